@@ -1,58 +1,350 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
 from matplotlib import pyplot as plt
+from matplotlib.transforms import Bbox
+from data.ring_buffer import SampleRing
+
 
 class EEGVisualizer:
-    def __init__(self, ch_names, picks):
-        self.ch_names = ch_names
-        self.picks = picks
-        self.colors = ['r', 'g', 'b', 'c', 'm', 'y']
-        print("Initializing EEGVisualizer...")
-        print(f"Channel Names: {self.ch_names}")
-        print(f"Picks: {self.picks}")
-        self.fig, self.ax = self.setup_plot()
-
-    def setup_plot(self):
-        """Set up the Matplotlib plot for the EEG channels."""
-        plt.ion()  # Enable interactive mode for live plotting
-        print("Setting up the plot...")
-        fig, ax = plt.subplots(6, 1, sharex=True, constrained_layout=True)
-        plt.show()  # Ensure the plot window appears
-        print("Plot setup complete.")
-        return fig, ax
-
-    def update_plot(self, ts, data):
-        """Update the plot with new EEG data."""
-        print("Updating plot with new data...")
-        print(f"Timestamps: {ts}")
-        print(f"Data: {data}")
-
-        for axis in self.ax:
-            axis.clear()  # Clear previous plot
-        print("Cleared previous plot.")
-
-        # Plot each channel's data
-        for idx, data_channel in enumerate(data):
-            print(f"Plotting data for channel {self.picks[idx]} with color {self.colors[idx]}")
-            self.ax[idx].plot(ts, data_channel, color=self.colors[idx])
-
-        # Add titles and labels
-        for idx, ch in enumerate(self.picks):
-            self.ax[idx].set_title(f"EEG {ch}")
-            print(f"Set title for channel {ch}")
-        self.ax[-1].set_xlabel("Timestamp (LSL time)")
-        print("Set x-axis label.")
-
-        plt.pause(0.1)  # Increase pause duration slightly
-        plt.show(block=True)  # Ensures the plot is displayed without blocking
-        print("Plot update complete.\n")
+    """Live sweep display of any number of EEG channels, redrawn by blitting.
 
-if __name__ == "__main__":
-    ch_names = ["Fp1", "Fp2", "F3", "F4", "C3", "C4"]
-    picks = ch_names[:6]
+    Every channel is one persistent ``Line2D`` on a single axes, stacked top to
+    bottom at integer offsets. Samples go into a preallocated per-channel
+    ``SampleRing`` whose columns are the x positions of a ``window``-second sweep.
+    New data overwrite the oldest trace from left to right, behind a cursor and a
+    short blank gap, so nothing is shifted or reallocated as data arrive.
+
+    ``push`` only writes into the ring and may be called from an intake thread.
+    Drawing runs on a GUI timer capped at ``fps`` and skips ticks without new data.
+    A frame restores the static background (axes, ticks, labels) and redraws the
+    lines clipped to the strip written since the previous frame, then blits only
+    that strip. Up/down arrows change the gain and ``c`` re-centres the channels.
+    """
+
+    GAP = 0.02  # blank gap ahead of the cursor, as a fraction of the sweep
+
+    def __init__(self, ch_names, sfreq, picks=None, window=5.0, fps=30, scale=None, title=None):
+        if not sfreq:
+            raise ValueError("the visualizer needs a stream with a nominal sampling rate")
+        self.ch_names = list(ch_names)
+        self.picks = [self.ch_names.index(p) if isinstance(p, str) else int(p) for p in picks] if picks else None
+        self.names = [self.ch_names[i] for i in self.picks] if self.picks else self.ch_names
+        self.sfreq = sfreq
+        self.fps = fps
+        self.n_points = max(int(round(window * sfreq)), 2)
+        self.n_gap = max(int(self.n_points * self.GAP), 1)
+
+        n_channels = len(self.names)
+        self.ring = SampleRing(n_channels, self.n_points)
+        self.ring.data[:] = np.nan
+        self.display = np.full_like(self.ring.data, np.nan)
+        self.x = np.arange(self.n_points) / sfreq
+        self.offsets = np.arange(n_channels - 1, -1, -1, dtype=np.float32)
+        self.gain = 1 / scale if scale else None  # set from the first chunk when not given
+        self.baseline = np.zeros(n_channels, dtype=np.float32)
+        self._lock = threading.Lock()
+        self._next_sample = None
+        self._drawn = 0  # ring count at the previous frame
+        self._redraw = True
+        self._background = None
+        self._frame_times = deque(maxlen=max(int(2 * fps), 2))
+
+        self.fig, self.ax, self.lines, self.cursor = self.setup_plot(title)
+        self._clip = Bbox.from_extents(*self.ax.bbox.extents)
+        for line in self.lines:
+            line.set_clip_box(self._clip)
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+        self.fig.canvas.mpl_connect("key_press_event", self._on_key)
+
+    def setup_plot(self, title=None):
+        """Create the stacked axes and the animated line artists (drawn only by blitting)."""
+        n_channels = len(self.names)
+        height = min(max(3, 0.18 * n_channels + 1.5), 12)
+        fig, ax = plt.subplots(figsize=(12, height), constrained_layout=True)
+        colors = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+        lines = [
+            ax.plot(self.x, np.full(self.n_points, np.nan), color=colors[i % len(colors)], lw=0.8, animated=True)[0]
+            for i in range(n_channels)
+        ]
+        cursor = ax.axvline(0, color="0.5", lw=1, animated=True)
+        ax.set_xlim(0, self.n_points / self.sfreq)
+        ax.set_ylim(-1, n_channels)
+        ax.set_yticks(self.offsets, self.names, fontsize=8 if n_channels <= 32 else 6)
+        ax.set_xlabel("Time in sweep (s)")
+        ax.set_title(title or f"EEG ({n_channels} channels, {self.sfreq:g} Hz)")
+        return fig, ax, lines, cursor
+
+    @property
+    def frame_rate(self):
+        """Frames drawn per second, measured over the last couple of seconds."""
+        times = self._frame_times
+        return (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+
+    def push(self, data, timestamps, first_sample=None):
+        """Write a (n_channels, n_samples) chunk into the sweep; safe to call from any thread.
+
+        With ``first_sample`` (the monotonic index of the first sample), samples that
+        were dropped upstream are left blank instead of closing up the trace.
+        """
+        data = np.asarray(data, dtype=np.float32)
+        if self.picks:
+            data = data[self.picks]
+        timestamps = np.asarray(timestamps)
+        with self._lock:
+            if self.gain is None:
+                self._autoscale(data)
+            if first_sample is not None and self._next_sample is not None and first_sample > self._next_sample:
+                n_gap = min(first_sample - self._next_sample, self.n_points)
+                self.ring.write(np.full((data.shape[0], n_gap), np.nan, dtype=np.float32), np.full(n_gap, np.nan))
+            self.ring.write(data, timestamps)
+            if first_sample is not None:
+                self._next_sample = first_sample + timestamps.shape[0]
+
+    def _autoscale(self, data):
+        """Centre every channel on its mean and space them ~3 median standard deviations apart."""
+        if data.shape[1] == 0:
+            return
+        self.baseline = np.nan_to_num(np.nanmean(data, axis=1)).astype(np.float32)
+        spread = float(np.nanmedian(np.nanstd(data, axis=1))) if data.shape[1] > 1 else 0.0
+        self.gain = 1 / (3 * spread) if spread > 0 and np.isfinite(spread) else 1.0
+
+    def _on_key(self, event):
+        with self._lock:
+            if event.key == "up" and self.gain:
+                self.gain *= 1.25
+            elif event.key == "down" and self.gain:
+                self.gain /= 1.25
+            elif event.key == "c":
+                self.baseline = np.nan_to_num(np.nanmedian(self.ring.data, axis=1)).astype(np.float32)
+            else:
+                return
+            self._redraw = True
+
+    def _on_draw(self, event):
+        # A full redraw (first show, resize): grab the new background without the lines
+        canvas = self.fig.canvas
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+        self._clip.set(self.ax.bbox)
+        self._draw_lines(0, self.n_points)
+        self._redraw = True
+
+    def _ranges(self, start, stop):
+        """Sweep positions covering samples ``[start, stop)``, split where the sweep wraps."""
+        if stop - start >= self.n_points:
+            return [(0, self.n_points)]
+        start, stop = start % self.n_points, stop % self.n_points or self.n_points
+        return [(start, stop)] if start < stop else [(start, self.n_points), (0, stop)]
+
+    def _draw_lines(self, lo, hi):
+        """Draw sweep positions ``[lo, hi)`` of every line, plus a few samples either side.
+
+        Agg rasterizes the whole path it is given whatever the clip box, so each line
+        only gets the slice being redrawn; the extra samples complete the segments
+        crossing the strip edges, which the clip box then trims.
+        """
+        pad = int(np.ceil(3 * self.n_points / self.ax.bbox.width)) + 1
+        lo, hi = max(lo - pad, 0), min(hi + pad, self.n_points)
+        for line, y in zip(self.lines, self.display):
+            line.set_data(self.x[lo:hi], y[lo:hi])
+            self.ax.draw_artist(line)
+        self.ax.draw_artist(self.cursor)
+
+    def draw_frame(self):
+        """Draw whatever arrived since the last frame; called by the frame timer."""
+        if self._background is None or (self.ring.count == self._drawn and not self._redraw):
+            return
+        with self._lock:
+            count, redraw = self.ring.count, self._redraw
+            start, self._drawn, self._redraw = self._drawn, count, False
+            np.multiply(self.ring.data, self.gain or 1.0, out=self.display)
+            self.display += (self.offsets - self.baseline * (self.gain or 1.0))[:, None]
+        cursor = count % self.n_points
+        self.display[:, (cursor + np.arange(self.n_gap)) % self.n_points] = np.nan
+        self.cursor.set_xdata([cursor / self.sfreq] * 2)
+
+        # Redraw from the sample before the previous cursor (the segment joining the
+        # frames) through the new gap, or the whole sweep after a gain/layout change
+        stop = count + self.n_gap
+        canvas = self.fig.canvas
+        height = self.fig.bbox.height
+        x0, x1 = self.ax.bbox.x0, self.ax.bbox.x1
+        y0, y1 = int(self.ax.bbox.y0), int(np.ceil(self.ax.bbox.y1))
+        for lo, hi in self._ranges(stop - self.n_points if redraw else start - 1, stop):
+            left = max(int(x0 + lo * (x1 - x0) / self.n_points) - 2, int(x0))
+            right = min(int(np.ceil(x0 + hi * (x1 - x0) / self.n_points)) + 2, int(np.ceil(x1)))
+            # The saved region is the whole canvas (origin (0, 0)), addressed from the top;
+            # blits are addressed from the bottom
+            canvas.restore_region(self._background, bbox=(left, height - y1, right, height - y0), xy=(0, 0))
+            strip = Bbox.from_extents(left, y0, right, y1)
+            self._clip.set(strip)
+            self._draw_lines(lo, hi)
+            canvas.blit(strip)
+        self._frame_times.append(time.perf_counter())
+
+    def run(self, source):
+        """Stream ``source`` into the window until it is closed.
+
+        ``source`` is a connected ``LSLSource`` or ``WebSocketSource``. Its intake
+        thread feeds ``push`` while the frame timer draws at up to ``fps``.
+        """
+        timer = self.fig.canvas.new_timer(interval=int(1000 / self.fps))
+        timer.add_callback(self.draw_frame)
+        source.start(self.push)
+        timer.start()
+        try:
+            plt.show()
+        finally:
+            timer.stop()
+            source.stop()
 
-    visualizer = EEGVisualizer(ch_names, picks)
 
-    ts = list(range(100))
-    data = [[i + j for i in range(100)] for j in range(6)]
+class LSLSource:
+    """Feeds a visualizer directly from an LSL stream through ``LSLStreamConnector``."""
+
+    def __init__(self, source_id, bufsize=5, interval=0.01):
+        from data.lsl_stream_connector import LSLStreamConnector
+
+        self.source_id = source_id
+        self.connector = LSLStreamConnector(bufsize=bufsize)
+        self.interval = interval
+        self.ch_names = None
+        self.sfreq = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def connect(self):
+        self.connector.connect_by_source_id(self.source_id)
+        self.ch_names, self.sfreq = self.connector.ch_names, self.connector.sfreq
+
+    def start(self, sink):
+        def intake():
+            while not self._stop.is_set():
+                data, timestamps, first_sample, _ = self.connector.get_new_data()
+                if data is not None:
+                    sink(data, timestamps, first_sample)
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=intake, name="lsl-intake", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self.connector.disconnect()
+
+
+class WebSocketSource:
+    """Feeds a visualizer from an ``EEGWebSocketServer``, as one of its clients.
+
+    Requests incremental binary frames, optionally through a server-side ``pipeline``,
+    so every sample arrives once together with its monotonic index. Over slow links,
+    ``frame_format="delta16"`` or ``"delta24"`` requests quantized, compressed frames
+    (see ``data.protocol``).
+    """
+
+    def __init__(self, url, source_id, pipeline=None, timeout=30, frame_format="binary"):
+        self.url = url
+        self.source_id = source_id
+        self.pipeline = pipeline
+        self.frame_format = frame_format
+        self.timeout = timeout
+        self.ch_names = None
+        self.sfreq = None
+        self.websocket = None
+        self._thread = None
+
+    def _receive_json(self, deadline):
+        while True:
+            message = self.websocket.recv(timeout=max(deadline - time.monotonic(), 0))
+            if isinstance(message, str):
+                message = json.loads(message)
+                if "error" in message:
+                    raise RuntimeError(message["error"])
+                return message
+
+    def connect(self):
+        from websockets.sync.client import connect
+
+        deadline = time.monotonic() + self.timeout
+        self.websocket = connect(self.url, max_size=None)
+        # The stream list comes first; a stream the server has not resolved yet arrives as stream_added
+        while self.sfreq is None:
+            try:
+                message = self._receive_json(deadline)
+            except TimeoutError:
+                self.websocket.close()
+                raise RuntimeError(f"No data stream with source_id={self.source_id} on {self.url}") from None
+            if message.get("type") == "stream_list":
+                streams = message["data_streams"]
+            elif message.get("type") == "stream_added":
+                streams = [message["stream"]]
+            else:
+                continue
+            info = next((s for s in streams if s["source_id"] == self.source_id), None)
+            if info is not None:
+                if not info["sfreq"]:
+                    raise RuntimeError(f"Stream {self.source_id} has no nominal sampling rate")
+                self.sfreq = info["sfreq"]
+
+        selection = {"type": "start_data", "data_stream": {"source_id": self.source_id},
+                     "delivery": "incremental", "format": self.frame_format}
+        if self.pipeline:
+            selection["pipeline"] = self.pipeline
+        self.websocket.send(json.dumps(selection))
+        while self.ch_names is None:
+            self.ch_names = self._receive_json(deadline).get("channels")
+
+    def start(self, sink):
+        from websockets.exceptions import ConnectionClosed
+        from data.protocol import decode_binary_frame
+
+        def intake():
+            try:
+                for message in self.websocket:
+                    if isinstance(message, bytes):
+                        frame = decode_binary_frame(message)
+                        sink(frame["data"], frame["timestamps"], frame["first_sample"])
+                    elif "error" in (message := json.loads(message)):
+                        logging.error(f"[VISUALIZER] Server error: {message['error']}")
+            except ConnectionClosed:
+                pass
+            logging.info("[VISUALIZER] WebSocket connection closed")
+
+        self._thread = threading.Thread(target=intake, name="websocket-intake", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.websocket is not None:
+            self.websocket.close()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live EEG display from LSL or an EEG WebSocket server.")
+    parser.add_argument("source_id", help="LSL source_id of the data stream")
+    parser.add_argument("--url", help="ws://host:port of an EEG WebSocket server (default: read LSL directly)")
+    parser.add_argument("--pipeline", type=json.loads, help="server-side pipeline as JSON (with --url)")
+    parser.add_argument("--format", choices=["binary", "delta16", "delta24"], default="binary",
+                        help="frame encoding requested from the server (with --url)")
+    parser.add_argument("--picks", nargs="+", help="channel names to show (default: all)")
+    parser.add_argument("--window", type=float, default=5.0, help="sweep length in seconds")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--scale", type=float, help="signal range per channel row (default: automatic)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-    
-    plt.show(block=True)  # Keep the plot window open
+    if args.url:
+        source = WebSocketSource(args.url, args.source_id, args.pipeline, frame_format=args.format)
+    else:
+        source = LSLSource(args.source_id)
+    source.connect()
+    visualizer = EEGVisualizer(source.ch_names, source.sfreq, picks=args.picks, window=args.window,
+                               fps=args.fps, scale=args.scale, title=args.source_id)
+    visualizer.run(source)
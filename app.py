@@ -1,160 +1,888 @@
+import argparse
 import asyncio
 import json
 import logging
+import math
+import os
+import signal
+import time
+from collections import deque
+from http import HTTPStatus
 import websockets
-import numpy as np
-from pylsl import resolve_byprop, StreamInlet
-from data.eeg_data_simulator import LSLDataSimulator
-from data.lsl_stream_connector import LSLStreamConnector
+from pylsl import local_clock
+from data.acquisition_hub import AcquisitionHub
+from data.marker_reader import MarkerHub
+from data.recorder import Recorder, RecordingSession
+from data.replay import Replay
+from data.stream_registry import StreamRegistry, is_marker_stream
+from data.protocol import DELTA_FORMATS, FRAME_FORMATS, encode_frame
+from data.dsp_pipeline import pipeline_key
+from data.epoching import EpochAverager
+from data.spectral import feature_key
+from data.metrics import Metrics
+from data.server_config import load_config
+from data.stream_sync import SyncGroup
+from data.worker_pool import DSPWorkerPool
+
+
+class SendQueue:
+    """Bounded queue of chunks waiting to be sent to one client.
+
+    When a slow client lets the queue fill up, ``policy`` decides what happens to the
+    next chunk: ``"drop_oldest"`` discards the oldest queued chunk, ``"coalesce"``
+    merges the chunk into the newest queued one (fewer, larger frames, no data lost)
+    and ``"downgrade"`` drops the oldest chunk and flags the session to switch to
+    decimated frames. The flag is cleared once ``RECOVERY_CHUNKS`` chunks in a row
+    found the queue empty, i.e. the client kept up for a while.
+    """
+
+    POLICIES = ("drop_oldest", "coalesce", "downgrade")
+    RECOVERY_CHUNKS = 100
+
+    def __init__(self, maxsize=8, policy="drop_oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy!r}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.n_dropped = 0
+        self.n_coalesced = 0
+        self.overloaded = False
+        self._drained = 0  # consecutive chunks put while the queue was empty
+        self._items = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, chunk):
+        if len(self._items) >= self.maxsize:
+            newest = self._items[-1]
+            if self.policy == "coalesce" and newest.source is chunk.source:
+                self._items[-1] = newest.merge(chunk)
+                self.n_coalesced += 1
+                return
+            self._items.popleft()
+            self.n_dropped += 1
+            self.overloaded = self.policy == "downgrade"
+            self._drained = 0
+        elif self.overloaded:
+            self._drained = self._drained + 1 if not self._items else 0
+            if self._drained >= self.RECOVERY_CHUNKS:
+                self.overloaded = False
+        self._items.append(chunk)
+        self._ready.set()
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+
+class ClientSession:
+    """Per-client streaming settings and outbound frame queue."""
+
+    # A "downgrade" session that falls behind without a view gets one reducing its samples
+    # to DOWNGRADE_BYTE_RATE bytes per second as float32, and at least DOWNGRADE_MIN_FACTOR times
+    DOWNGRADE_BYTE_RATE = 64 * 1024
+    DOWNGRADE_MIN_FACTOR = 4
+
+    def __init__(self, websocket, metrics=None):
+        self.websocket = websocket
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.source_id = None
+        self.source = None
+        self.sync = None
+        self.attach_task = None
+        self.marker_source_id = None
+        self.pipeline_config = None
+        self.pipeline_key = None
+        self.feature_config = None
+        self.features_key = None
+        self.delivery = "window"
+        self.frame_format = "json"
+        self.resolution = None
+        self.view = None
+        self.downgraded = False  # ``view`` was set by the "downgrade" backpressure policy
+        self.epochs = None
+        self.quality = False  # receives the source's signal-quality messages
+        self.queue = SendQueue()
+        self.sender_task = None
+        self.n_sent = 0
+        self.bytes_sent = 0
+
+    def configure(self, selection):
+        # "reference_channels" is shorthand for a pipeline with a single reference stage
+        self.pipeline_config = selection.get("pipeline")
+        if self.pipeline_config is None and selection.get("reference_channels"):
+            self.pipeline_config = [{"type": "reference", "channels": selection["reference_channels"]}]
+        self.delivery = selection.get("delivery", "window")
+        self.feature_config = selection.get("features")
+        self.frame_format = selection.get("format", "json")
+        # Quantization step (microvolts) of the delta formats; None keeps the format's default
+        self.resolution = selection.get("resolution") if self.frame_format in DELTA_FORMATS else None
+        self.view = selection.get("view")
+        self.downgraded = False
+        backpressure = selection.get("backpressure")
+        if backpressure:
+            self.queue.maxsize = backpressure.get("max_queue", self.queue.maxsize)
+            self.queue.policy = backpressure.get("policy", self.queue.policy)
+
+    @property
+    def ch_names(self):
+        """Channels the session receives, after its pipeline."""
+        if self.source is None:
+            return None
+        if self.pipeline_key is not None:
+            return self.source.pipelines[self.pipeline_key][0].ch_names
+        return self.source.ch_names
+
+    @property
+    def encode_key(self):
+        """Settings that determine the encoded frame; sessions with equal keys share frames."""
+        view = (self.view.get("width"), self.view.get("span")) if self.view else None
+        return self.delivery, self.frame_format, self.pipeline_key, view, self.resolution
+
+    def push(self, chunk):
+        if self.epochs is not None and chunk.source is self.source and (
+                self.pipeline_key is None or self.pipeline_key in chunk.processed):
+            data, timestamps = chunk.samples(self.pipeline_key)
+            for condition in self.epochs.add_samples(data, timestamps, chunk.first_sample):
+                self.notify(self.epochs.erp(condition))
+        if self.quality and chunk.quality is not None and chunk.source is self.source:
+            self.notify(chunk.quality)
+        self.queue.put(chunk)
+        if self.queue.overloaded and self.view is None and self.source is not None and self.source.sfreq:
+            self.view = self.downgrade_view()
+            self.downgraded = True
+            self.notify({"type": "backpressure", "action": "downgraded", "view": self.view})
+        elif self.downgraded and not self.queue.overloaded:
+            self.view = None
+            self.downgraded = False
+            self.notify({"type": "backpressure", "action": "restored", "view": None})
+
+    def downgrade_view(self):
+        """A one-second view whose min/max decimation cuts the sample rate (see ``DOWNGRADE_BYTE_RATE``)."""
+        sfreq = self.source.sfreq
+        factor = max(sfreq * len(self.ch_names) * 4 / self.DOWNGRADE_BYTE_RATE, self.DOWNGRADE_MIN_FACTOR)
+        n_per_bin = math.ceil(2 * factor)  # each bin becomes two points, its min and max
+        return {"width": max(int(sfreq / n_per_bin), 1), "span": 1}
+
+    @property
+    def stats(self):
+        return {
+            "queued": len(self.queue),
+            "dropped": self.queue.n_dropped,
+            "coalesced": self.queue.n_coalesced,
+            "sent_frames": self.n_sent,
+            "sent_bytes": self.bytes_sent,
+        }
+
+    def push_markers(self, reader, triggers, timestamps):
+        """Send a batch of triggers in one message.
+
+        Each trigger is annotated with the index of the nearest sample of the session's
+        data stream (the ``first_sample`` numbering of incremental frames).
+        """
+        if self.epochs is not None:
+            self.epochs.add_markers(triggers, timestamps)
+        source = self.source
+        message = {
+            "type": "triggers",
+            "stream_name": reader.name,
+            "triggers": [
+                {
+                    "trigger": trigger,
+                    "timestamp": timestamp,
+                    "sample_index": source.sample_index_at(timestamp) if source else None
+                }
+                for trigger, timestamp in zip(triggers, timestamps)
+            ]
+        }
+        asyncio.create_task(self._send_markers(reader, message, timestamps[0]))
+
+    async def _send_markers(self, reader, message, first_timestamp):
+        await self._send_json(message)
+        # Marker timestamps are clock-corrected to the local LSL clock
+        self.metrics.observe("marker_to_send", local_clock() - first_timestamp, marker_source_id=reader.source_id)
+
+    def notify(self, message):
+        """Send a JSON control message without waiting for it to be written."""
+        asyncio.create_task(self._send_json(message))
+
+    async def _send_json(self, message):
+        try:
+            await self.websocket.send(json.dumps(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
 
-logging.basicConfig(level=logging.DEBUG)
 
 class EEGWebSocketServer:
-    def __init__(self, host="0.0.0.0", port=8765, bufsize=20):
+    def __init__(self, host="0.0.0.0", port=8765, bufsize=20, data_path=None,
+                 ping_interval=20, ping_timeout=20, write_limit=2 ** 20, workers=None,
+                 streams=None, warm_start=False, warm_seconds=1.0, connect_deadline=30.0, replay=None):
         self.host = host
         self.port = port
         self.bufsize = bufsize
-        self.simulator = LSLDataSimulator()
-        self.connector = None
-        self.reference_channels = []
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.write_limit = write_limit
+        self.data_path = data_path or os.environ.get("DATA_PATH", "eeg_data")
+        # With workers > 0, pipelines and frame encoding run in that many worker processes
+        self.workers = workers if workers is not None else int(os.environ.get("DSP_WORKERS", "0"))
+        self.pool = None
+        # Streams connected at start-up and kept acquiring; with warm_start, before the socket opens
+        self.streams = list(streams or [])
+        self.warm_start = warm_start
+        self.warm_seconds = warm_seconds
+        self.recording = None
+        self.metrics = Metrics()
+        # With replay, a recording in data_path (or at that path) is served instead of the LSL streams
+        self.replay = None
+        if replay:
+            self.replay = Replay(replay if os.path.isdir(replay) else os.path.join(self.data_path, replay))
+            self.registry = self.replay
+            self.hub = AcquisitionHub(bufsize=bufsize, connect_deadline=connect_deadline, metrics=self.metrics,
+                                      connector_factory=self.replay.connector)
+            self.markers = MarkerHub(self.on_markers, reader_factory=self.replay.marker_reader)
+        else:
+            self.registry = StreamRegistry()
+            self.hub = AcquisitionHub(bufsize=bufsize, connect_deadline=connect_deadline, metrics=self.metrics)
+            self.markers = MarkerHub(self.on_markers)
+        self.sessions = set()
+        self._loop = None
 
     async def websocket_handler(self, websocket):
         logging.info("[WebSocket] New client connected.")
+        session = ClientSession(websocket, self.metrics)
+        self.sessions.add(session)
         try:
-            # Discover all LSL streams
-            all_streams = self.simulator.find_streams()
-            if not all_streams:
-                await websocket.send(json.dumps({"error": "No streams available."}))
-                return
-
-            marker_streams = []
-            data_streams = []
-
-            for stream in all_streams:
-                stream_info = {
-                    "name": stream.name(),
-                    "type": stream.type(),
-                    "source_id": stream.source_id()
-                }
-
-                if stream.type().lower() == "markers":
-                    marker_streams.append(stream_info)
-                else:
-                    data_streams.append(stream_info)
-
-            await websocket.send(json.dumps({
-                "type": "stream_list",
-                "data_streams": data_streams,
-                "marker_streams": marker_streams
-            }))
+            # Answer from the registry cache; later changes arrive as stream_added/stream_removed
+            await websocket.send(json.dumps(self.registry.stream_list()))
+            if self.replay is not None:
+                await websocket.send(json.dumps(self.replay.clock.status()))
 
             while True:
                 message = await websocket.recv()
                 selection = json.loads(message)
 
-                if selection.get("type") == "start_data":
+                if selection.get("type") == "start_data" and selection.get("data_streams"):
+                    # Several streams aligned onto one clock and sent as one combined stream
+                    streams = selection["data_streams"]
+                    resample = selection.get("resample")
+                    if not all(isinstance(s, dict) and "source_id" in s for s in streams):
+                        await websocket.send(json.dumps({"error": "Invalid EEG data stream selection."}))
+                        continue
+                    if resample is not None and not (isinstance(resample, (int, float)) and resample > 0):
+                        await websocket.send(json.dumps({"error": f"Invalid resample rate {resample!r}"}))
+                        continue
+                    error = (self.check_backpressure(selection) or self.check_format(selection)
+                             or self.check_view(selection.get("view")))
+                    if error:
+                        await websocket.send(json.dumps({"error": error}))
+                        continue
+                    self.detach(session)
+                    session.configure(selection)
+                    session.attach_task = asyncio.create_task(self.attach_sync(session, streams, resample))
+
+                elif selection.get("type") == "start_data":
                     selected_data = selection.get("data_stream")
-                    self.reference_channels = selection.get("reference_channels", [])
                     if not selected_data or "source_id" not in selected_data:
                         await websocket.send(json.dumps({"error": "Invalid EEG data stream selection."}))
                         continue
+                    error = (self.check_backpressure(selection) or self.check_format(selection)
+                             or self.check_view(selection.get("view")))
+                    if error:
+                        await websocket.send(json.dumps({"error": error}))
+                        continue
 
-                    self.connector = LSLStreamConnector(bufsize=self.bufsize)
-                    if not self.connector.connect_by_source_id(selected_data["source_id"]):
-                        await websocket.send(json.dumps({"error": "Failed to connect to EEG stream."}))
-                        return
+                    source_id = selected_data["source_id"]
+                    if session.source_id != source_id:
+                        self.detach(session)
+                        session.configure(selection)
+                        session.source_id = source_id
+                        session.attach_task = asyncio.create_task(self.attach(session, source_id))
+                    else:
+                        self.release_pipeline(session)
+                        session.configure(selection)
+                        if session.source is not None:
+                            await self.setup_pipeline(session)
+                            await websocket.send(json.dumps({"channels": session.source.ch_names,
+                                                                     "stream_id": session.source.stream_id}))
+
+                elif selection.get("type") == "set_view":
+                    # {"width": pixels, "span": seconds} enables display decimation; null restores full resolution
+                    error = self.check_view(selection.get("view"))
+                    if error:
+                        await websocket.send(json.dumps({"error": error}))
+                        continue
+                    session.view = selection.get("view")
+                    session.downgraded = False
+
+                elif selection.get("type") == "history":
+                    # Catch-up: the last "seconds" already acquired, sent at once as an incremental frame
+                    seconds = selection.get("seconds", self.bufsize)
+                    if isinstance(seconds, bool) or not (isinstance(seconds, (int, float)) and seconds > 0):
+                        await websocket.send(json.dumps({"error": f"Invalid history length {seconds!r}"}))
+                        continue
+                    if session.source is None or session.delivery == "features":
+                        await websocket.send(json.dumps({"error": "Select a data stream with sample delivery "
+                                                                  "before requesting history."}))
+                        continue
+                    await self.send_history(session, seconds)
 
-                    await websocket.send(json.dumps({"channels": self.connector.ch_names}))
-                    asyncio.create_task(self.stream_real_time(websocket, self.connector.ch_names))
+                elif selection.get("type") == "replay":
+                    # Playback control of the replayed recording, shared by every client
+                    if self.replay is None:
+                        await websocket.send(json.dumps({"error": "The server is not replaying a recording."}))
+                        continue
+                    try:
+                        status = self.replay.control(selection)
+                    except ValueError as e:
+                        await websocket.send(json.dumps({"error": f"Invalid replay command: {e}"}))
+                        continue
+                    self._broadcast(status)
+
+                elif selection.get("type") == "start_epoching":
+                    # Epochs are cut from the session's (processed) data stream around its markers
+                    if session.source is None:
+                        await websocket.send(json.dumps({"error": "Select a data stream before epoching."}))
+                        continue
+                    params = {k: selection[k] for k in ("tmin", "tmax", "baseline", "reject", "conditions",
+                                                        "max_conditions") if k in selection}
+                    try:
+                        session.epochs = EpochAverager(session.ch_names, session.source.sfreq, **params)
+                    except (TypeError, ValueError) as e:
+                        await websocket.send(json.dumps({"error": f"Invalid epoching settings: {e}"}))
+                        continue
+                    await websocket.send(json.dumps({"type": "epoching_status", "state": "started",
+                                                     "times": session.epochs.times.tolist()}))
+
+                elif selection.get("type") == "stop_epoching":
+                    session.epochs = None
+                    await websocket.send(json.dumps({"type": "epoching_status", "state": "stopped"}))
+
+                elif selection.get("type") == "start_quality":
+                    # Per-channel quality of the raw stream, about once per second (see data.signal_quality)
+                    if session.source is None or session.sync is not None:
+                        await websocket.send(json.dumps({"error": "Select a single data stream before "
+                                                                  "monitoring signal quality."}))
+                        continue
+                    if not session.quality:
+                        session.source.acquire_quality()
+                        session.quality = True
+                    await websocket.send(json.dumps({"type": "quality_status", "state": "started"}))
+
+                elif selection.get("type") == "stop_quality":
+                    self.release_quality(session)
+                    await websocket.send(json.dumps({"type": "quality_status", "state": "stopped"}))
+
+                elif selection.get("type") == "start_recording":
+                    asyncio.create_task(self.start_recording(session, selection))
+
+                elif selection.get("type") == "stop_recording":
+                    recorder = await self.stop_recording()
+                    await websocket.send(json.dumps({
+                        "type": "recording_status",
+                        "state": "stopped" if recorder else "not_recording",
+                        "path": recorder.directory if recorder else None,
+                        "n_dropped": recorder.n_dropped if recorder else 0
+                    }))
+
+                elif selection.get("type") == "stats":
+                    await websocket.send(json.dumps({"type": "stats", "session": session.stats,
+                                                     "server": self.metrics.snapshot()}))
+
+                elif selection.get("type") == "stream_list":
+                    await websocket.send(json.dumps(self.registry.stream_list()))
 
                 elif selection.get("type") == "start_marker":
                     selected_marker = selection.get("marker_stream")
+                    if session.marker_source_id is not None:
+                        self.markers.unsubscribe(session.marker_source_id, session)
+                        session.marker_source_id = None
                     if selected_marker and "source_id" in selected_marker:
-                        logging.info(f"Marker stream selected: {selected_marker['name']} ({selected_marker['source_id']})")
-                        asyncio.create_task(self.marker_listener(websocket, selected_marker))
+                        logging.info(f"Marker stream selected: {selected_marker.get('name')} ({selected_marker['source_id']})")
+                        self.markers.subscribe(selected_marker, session, self._loop)
+                        session.marker_source_id = selected_marker["source_id"]
                     else:
                         logging.info("No marker stream selected.")
 
         except websockets.exceptions.ConnectionClosed:
             logging.info("WebSocket disconnected.")
         finally:
-            stream = self.connector.stream if self.connector else None
-            if stream and hasattr(stream, "connected"):
-                try:
-                    if stream.connected:
-                        stream.disconnect()
-                        logging.info("Disconnected from EEG stream.")
-                except Exception as e:
-                    logging.error(f"Error during stream disconnect: {e}")
-
-    async def marker_listener(self, websocket, marker_stream_info):
-        name = marker_stream_info["name"]
-        source_id = marker_stream_info["source_id"]
-        logging.info(f"Looking for Marker stream '{name}' (source_id={source_id})...")
-
-        streams = resolve_byprop("source_id", source_id, timeout=5)
-        if not streams:
-            logging.warning(f"Marker stream '{name}' not found.")
+            logging.info(f"[WebSocket] Client stats: {session.stats}")
+            self.sessions.discard(session)
+            if session.sender_task is not None:
+                session.sender_task.cancel()
+            self.detach(session)
+            if session.marker_source_id is not None:
+                self.markers.unsubscribe(session.marker_source_id, session)
+
+    async def attach(self, session, source_id):
+        """Connect the session to its acquisition source without blocking the handler.
+
+        Runs as a task so the handler keeps reading messages; it is cancelled when the
+        client disconnects or selects another stream while the connection is pending.
+        """
+        source = await self.hub.subscribe(source_id, session)
+        if source is None:
+            session.source_id = None
+            await session.websocket.send(json.dumps({"error": "Failed to connect to EEG stream."}))
             return
 
-        inlet = StreamInlet(streams[0])
-        logging.info(f"Connected to Marker stream: {name}")
+        session.source = source
+        await self.setup_pipeline(session)
+        await session.websocket.send(json.dumps({"channels": source.ch_names, "stream_id": source.stream_id}))
+        if session.delivery == "window" and session.pipeline_key is None and source.connector.sample_count:
+            # The source is already running (e.g. warm-started): send what it has buffered now
+            session.queue.put(source.primer())
+        if session.sender_task is None:
+            session.sender_task = asyncio.create_task(self.stream_real_time(session))
 
+    async def send_history(self, session, seconds):
+        """Send the last ``seconds`` the session's source has acquired, as one frame.
+
+        A ``history`` message announces the span, followed by an ``incremental`` frame
+        in the session's format, pipeline, view and resolution. It is numbered like the
+        live frames, which continue from its end, so a client can splice it in front of
+        them. The span is limited to the connector's buffer (raw data) or the pipeline's
+        history.
+        """
+        source = session.source
+        data, timestamps, first_sample = source.history(seconds, session.pipeline_key)
+        if first_sample < 0:
+            # Numbered before the first acquired sample: buffer padding, not data
+            data, timestamps, first_sample = data[:, -first_sample:], timestamps[-first_sample:], 0
+        n_samples = len(timestamps) if timestamps is not None else 0
+        await session.websocket.send(json.dumps({
+            "type": "history", "first_sample": first_sample, "n_samples": n_samples,
+            "seconds": n_samples / source.sfreq if source.sfreq else 0.0
+        }))
+        if not n_samples:
+            return
+        message = encode_frame(data, timestamps, max(source.seq - 1, 0), session.ch_names, source.sfreq,
+                               first_sample, 0, "incremental", session.frame_format, session.view,
+                               session.resolution, source.units, source.stream_id)
+        await session.websocket.send(message)
+        session.n_sent += 1
+        session.bytes_sent += len(message)
+
+    @staticmethod
+    def check_format(selection):
+        """Error message for an unsupported ``format``/``resolution`` in ``start_data``, else None."""
+        frame_format = selection.get("format", "json")
+        if frame_format not in FRAME_FORMATS:
+            return f"Unknown frame format {frame_format!r}, expected one of {', '.join(FRAME_FORMATS)}"
+        resolution = selection.get("resolution")
+        if resolution is not None and not (isinstance(resolution, (int, float)) and resolution > 0):
+            return f"Invalid resolution {resolution!r}"
+        return None
+
+    @staticmethod
+    def check_backpressure(selection):
+        """Error message for an invalid ``backpressure`` setting in ``start_data``, else None."""
+        backpressure = selection.get("backpressure") or {}
+        if not isinstance(backpressure, dict):
+            return f"Invalid backpressure settings {backpressure!r}"
+        policy = backpressure.get("policy")
+        if policy is not None and policy not in SendQueue.POLICIES:
+            return f"Unknown backpressure policy {policy!r}"
+        max_queue = backpressure.get("max_queue")
+        if max_queue is not None and (isinstance(max_queue, bool) or not isinstance(max_queue, int) or max_queue < 1):
+            return f"Invalid max_queue {max_queue!r}, expected a positive integer"
+        return None
+
+    @staticmethod
+    def check_view(view):
+        """Error message for an invalid ``view`` (positive ``width`` and ``span``, or null), else None."""
+        if view is None:
+            return None
+        if not isinstance(view, dict):
+            return f"Invalid view {view!r}"
+        for name in ("width", "span"):
+            value = view.get(name)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                      or not 0 < value < math.inf):
+                return f"Invalid view {name} {value!r}"
+        return None
+
+    async def attach_sync(self, session, streams, resample):
+        """Like ``attach``, for a ``SyncGroup`` of several streams.
+
+        The group applies the session's pipeline on each source itself, so the session
+        reads the combined stream without a pipeline of its own.
+        """
+        group = SyncGroup(self.hub, streams, session, resample=resample, pipeline=session.pipeline_config)
+        session.sync = group
+        session.source_id = group.source_id
         try:
-            while True:
-                sample, timestamp = inlet.pull_sample(timeout=0.0)
-                if sample:
-                    logging.debug(f"[MARKER] Trigger received: {sample[0]} at {timestamp}")
-                    await websocket.send(json.dumps({
-                        "type": "trigger",
-                        "stream_name": name,
-                        "trigger": sample[0],
-                        "timestamp": timestamp
-                    }))
-                await asyncio.sleep(0.01)
-        except websockets.exceptions.ConnectionClosed:
-            logging.warning("Marker stream stopped.")
+            connected = await group.connect()
+        except (TypeError, ValueError) as e:
+            group.close()
+            connected = False
+            await session.websocket.send(json.dumps({"error": f"Invalid pipeline: {e}"}))
+        else:
+            if not connected:
+                await session.websocket.send(json.dumps({"error": "Failed to connect to EEG stream."}))
+        if not connected:
+            session.sync = None
+            session.source_id = None
+            return
 
-    def apply_reference_cleaning(self, data, channels):
-        ref_indices = [channels.index(ch) for ch in self.reference_channels if ch in channels]
-        if not ref_indices:
-            return data
-        ref_data = np.mean(data[ref_indices, :], axis=0)
-        return data - ref_data
+        session.source = group
+        if session.delivery == "features":
+            await session.websocket.send(json.dumps({"error": "Feature delivery is not supported for combined streams."}))
+        await session.websocket.send(json.dumps({"channels": group.ch_names, "stream_id": group.stream_id}))
+        if session.sender_task is None:
+            session.sender_task = asyncio.create_task(self.stream_real_time(session))
 
-    async def stream_real_time(self, websocket, channels):
-        interval = self.connector.bufsize / self.connector.sfreq if self.connector.sfreq else 0.1
-        logging.info("Streaming EEG data with reference cleaning...")
+    async def setup_pipeline(self, session):
+        """Attach the session to the source pipeline matching its processing settings.
 
+        Sessions with the same settings share one pipeline, so filter state is kept once
+        per stream and each chunk is processed once.
+        """
+        setting = "pipeline"
         try:
-            while True:
-                data, timestamps = self.connector.get_data(winsize=1, picks=channels)
-                if data is None or timestamps is None or len(data) == 0:
-                    continue
+            key = pipeline_key(session.pipeline_config)
+            session.source.acquire_pipeline(key, session.pipeline_config)
+            session.pipeline_key = key
+            if session.delivery == "features":
+                setting = "features"
+                features = (key, feature_key(session.feature_config))
+                session.source.acquire_features(features, session.feature_config)
+                session.features_key = features
+        except (TypeError, ValueError) as e:
+            self.release_pipeline(session)
+            await session.websocket.send(json.dumps({"error": f"Invalid {setting}: {e}"}))
+
+    def release_pipeline(self, session):
+        if session.epochs is not None:
+            # Epochs are cut from the pipeline output, whose channels may change
+            session.epochs = None
+            session.notify({"type": "epoching_status", "state": "stopped"})
+        if session.source is not None and session.features_key is not None:
+            session.source.release_features(session.features_key)
+        if session.source is not None and session.pipeline_key is not None:
+            session.source.release_pipeline(session.pipeline_key)
+        session.pipeline_key = None
+        session.features_key = None
+
+    def release_quality(self, session):
+        if session.quality and session.source is not None:
+            session.source.release_quality()
+        session.quality = False
+
+    def detach(self, session):
+        self.release_pipeline(session)
+        if session.quality:
+            # The monitor belongs to the stream being left
+            self.release_quality(session)
+            session.notify({"type": "quality_status", "state": "stopped"})
+        if session.attach_task is not None:
+            session.attach_task.cancel()
+            session.attach_task = None
+        if session.sync is not None:
+            session.sync.close()
+            session.sync = None
+        elif session.source_id is not None:
+            self.hub.unsubscribe(session.source_id, session)
+        session.source_id = None
+        session.source = None
+
+    def on_markers(self, reader, triggers, timestamps):
+        for session in list(reader.subscribers):
+            session.push_markers(reader, triggers, timestamps)
+
+    async def start_recording(self, session, selection):
+        """Record data and marker streams to ``data_path`` until ``stop_recording``.
+
+        Defaults to the requesting client's current data and marker streams.
+        """
+        if self.recording is not None:
+            session.notify({"type": "recording_status", "state": "already_recording",
+                            "path": self.recording.recorder.directory})
+            return
+
+        data_streams, marker_streams = selection.get("data_streams") or [], selection.get("marker_streams") or []
+        if not (isinstance(data_streams, list) and isinstance(marker_streams, list) and all(
+                isinstance(s, dict) and "source_id" in s for s in data_streams + marker_streams)):
+            session.notify({"error": "Invalid stream selection for recording."})
+            return
+        data_ids = [s["source_id"] for s in data_streams]
+        marker_ids = [s["source_id"] for s in marker_streams]
+        if not data_ids and session.sync is not None:
+            data_ids = list(session.sync.source_ids)
+        elif not data_ids and session.source_id is not None:
+            data_ids = [session.source_id]
+        if not marker_ids and session.marker_source_id is not None:
+            marker_ids = [session.marker_source_id]
+
+        name = selection.get("name") or time.strftime("session_%Y%m%d_%H%M%S")
+        max_segment_bytes = selection.get("max_segment_bytes", 256 * 1024 * 1024)
+        # The name becomes a directory in data_path: only a single plain path component
+        if (not isinstance(name, str) or name in (".", "..") or any(c in name for c in "/\\\0")
+                or os.path.isabs(name)):
+            session.notify({"error": f"Invalid recording name {name!r}"})
+            return
+        if isinstance(max_segment_bytes, bool) or not isinstance(max_segment_bytes, int) or max_segment_bytes <= 0:
+            session.notify({"error": f"Invalid max_segment_bytes {max_segment_bytes!r}"})
+            return
+
+        # This runs as a task of its own, so failures are reported here rather than raised
+        try:
+            recorder = Recorder(os.path.join(self.data_path, name), max_segment_bytes=max_segment_bytes)
+            recorder.start()
+        except (OSError, ValueError) as e:
+            session.notify({"error": f"Could not start recording {name!r}: {e}"})
+            return
+        recording = self.recording = RecordingSession(recorder)
+        for source_id in data_ids:
+            source = await self.hub.subscribe(source_id, recording)
+            if self.recording is not recording:
+                # Stopped while connecting; stop_recording only released the streams subscribed before
+                if source is not None:
+                    self.hub.unsubscribe(source_id, recording)
+                return
+            if source is not None:
+                recording.source_ids.append(source_id)
+        for source_id in marker_ids:
+            self.markers.subscribe({"source_id": source_id}, recording, self._loop)
+            recording.marker_source_ids.append(source_id)
+
+        session.notify({"type": "recording_status", "state": "started", "path": recorder.directory,
+                        "data_streams": recording.source_ids, "marker_streams": marker_ids})
 
-                cleaned_data = self.apply_reference_cleaning(data, channels)
+    async def stop_recording(self):
+        recording, self.recording = self.recording, None
+        if recording is None:
+            return None
+        for source_id in recording.source_ids:
+            self.hub.unsubscribe(source_id, recording)
+        for source_id in recording.marker_source_ids:
+            self.markers.unsubscribe(source_id, recording)
+        # Joining the writer thread waits for pending disk writes; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, recording.recorder.stop)
+        return recording.recorder
 
-                logging.debug(f"[EEG] Data received: shape={data.shape}, first 5 ts={timestamps[:5].tolist()}")
-                logging.debug(f"[EEG] Sending {len(channels)} channels with {len(timestamps)} samples")
+    def build_message(self, session, chunk):
+        """Process and serialize ``chunk`` with the session's settings.
 
-                await websocket.send(json.dumps({
-                    "type": "eeg",
-                    "timestamps": timestamps.tolist(),
-                    "data": cleaned_data.tolist(),
-                    "selected_channels": channels
-                }))
-                await asyncio.sleep(interval)
+        The result is cached on the chunk, so every client sharing the same settings
+        reuses one encoded frame.
+        """
+        key = session.encode_key
+
+        def build():
+            start = time.perf_counter()
+            message = self._encode_chunk(session, chunk)
+            self.metrics.observe("serialize", time.perf_counter() - start, source_id=chunk.source.source_id)
+            return message
+
+        return chunk.encode(key, build)
+
+    def _encode_chunk(self, session, chunk):
+        if session.delivery == "features":
+            # Estimators publish at their own low rate; most chunks carry no update
+            features = chunk.features.get(session.features_key)
+            return json.dumps(dict(features, seq=chunk.seq)) if features is not None else None
+
+        key = session.pipeline_key
+        channels = chunk.source.pipelines[key][0].ch_names if key is not None else chunk.source.ch_names
+        if session.delivery == "incremental":
+            cleaned_data, timestamps = chunk.samples(key)
+            first_sample = chunk.first_sample
+        else:
+            winsize = float(session.view.get("span", 1)) if session.view else 1
+            cleaned_data, timestamps = chunk.window(winsize, key)
+            first_sample = chunk.first_sample + len(chunk.timestamps) - len(timestamps)
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"[EEG] Sending {len(channels)} channels with {len(timestamps)} samples")
+
+        return encode_frame(cleaned_data, timestamps, chunk.seq, channels, chunk.source.sfreq, first_sample,
+                            chunk.n_dropped, session.delivery, session.frame_format, session.view,
+                            session.resolution, chunk.source.units, chunk.source.stream_id)
+
+    async def stream_real_time(self, session):
+        """Send the chunks broadcast by the session's acquisition source.
+
+        ``delivery="window"`` sends the last second of data on every frame (the original
+        behaviour). ``delivery="incremental"`` sends only the samples acquired since the
+        previous frame, tagged with the index of the first sample so clients can detect
+        gaps. Data is processed by the session's pipeline (see ``data.dsp_pipeline``).
+        ``format="binary"`` sends each frame as a packed float32 array (see
+        ``data.protocol``) instead of JSON; ``"delta16"``/``"delta24"`` send it
+        quantized to ``resolution`` microvolts, delta-coded and compressed. With a ``view`` set, traces are reduced to
+        the min/max per pixel (see ``data.decimation``). ``seq`` is the source's chunk
+        counter. ``delivery="features"`` sends band powers and a compact PSD a few times
+        per second instead of samples (see ``data.spectral``). A session started with
+        ``data_streams`` streams the combined frames of a ``SyncGroup`` (see
+        ``data.stream_sync``) the same way.
+        """
+        logging.info(f"Streaming EEG data with reference cleaning ({session.delivery} delivery)...")
+        try:
+            while True:
+                chunk = await session.queue.get()
+                if chunk.source is not session.source:
+                    continue  # left over from a previously selected stream
+                if session.pipeline_key is not None and session.pipeline_key not in chunk.processed:
+                    continue  # acquired before the session's pipeline was set up
+                message = self.build_message(session, chunk)
+                if message is None:
+                    continue
+                start = time.perf_counter()
+                await session.websocket.send(message)
+                self.metrics.observe("send", time.perf_counter() - start, source_id=chunk.source.source_id)
+                session.n_sent += 1
+                session.bytes_sent += len(message)
         except websockets.exceptions.ConnectionClosed:
             logging.info("EEG stream closed.")
 
+    def _on_stream_event(self, event, stream_info):
+        # Called from the registry thread
+        self._loop.call_soon_threadsafe(self._broadcast_stream_event, event, stream_info)
+        if event == "stream_added" and stream_info["source_id"] in self.streams:
+            # A configured stream that was missing at start-up (or whose pin gave up) came online
+            self._loop.call_soon_threadsafe(self._pin_stream, stream_info["source_id"])
+
+    def _pin_stream(self, source_id):
+        if source_id not in self.hub.pinned:
+            asyncio.create_task(self.hub.pin(source_id))
+
+    async def warm_up(self):
+        """Connect the configured ``streams`` and wait until each holds ``warm_seconds`` of data.
+
+        Pinned sources keep acquiring without clients, so a viewer selecting one of them
+        skips discovery and the connection, and gets its first window frame at once.
+        """
+        started = time.perf_counter()
+        sources = await asyncio.gather(*[self.hub.pin(source_id) for source_id in self.streams])
+        for source_id, source in zip(self.streams, sources):
+            if source is None:
+                logging.warning(f"[WARM] Could not connect source_id={source_id}; it is pinned when it appears")
+        sources = [source for source in sources if source is not None]
+        while any(source.connector.sample_count < self.warm_seconds * (source.sfreq or 1) for source in sources):
+            if time.perf_counter() - started > self.hub.connect_deadline:
+                break
+            await asyncio.sleep(0.05)
+        logging.info(f"[WARM] {len(sources)}/{len(self.streams)} stream(s) ready "
+                     f"in {time.perf_counter() - started:.2f}s")
+
+    @staticmethod
+    def preload():
+        """Import the modules deferred at start-up (LSL connections, filter design)."""
+        import mne_lsl.stream  # noqa: F401
+        import scipy.signal  # noqa: F401
+
+    def _broadcast_stream_event(self, event, stream_info):
+        self._broadcast({
+            "type": event,
+            "kind": "marker" if is_marker_stream(stream_info) else "data",
+            "stream": stream_info
+        })
+
+    def _broadcast(self, message):
+        for session in list(self.sessions):
+            session.notify(message)
+
+    async def watch_replay(self, interval=0.5):
+        """Tell every client when the replayed recording reaches its end."""
+        ended = False
+        while True:
+            if self.replay.clock.ended != ended:
+                ended = not ended
+                if ended:
+                    self._broadcast(self.replay.clock.status())
+            await asyncio.sleep(interval)
+
+    def metrics_text(self):
+        """Prometheus text exposition of the hot-path metrics plus client totals."""
+        gauges = {"clients": len(self.sessions)}
+        for session in self.sessions:
+            for name, value in session.stats.items():
+                gauges[f"client_{name}"] = gauges.get(f"client_{name}", 0) + value
+        return self.metrics.render(gauges)
+
+    def process_request(self, connection, request):
+        # Plain HTTP GET /metrics is answered for Prometheus; everything else is a WebSocket
+        if request.path == "/metrics":
+            return connection.respond(HTTPStatus.OK, self.metrics_text())
+        return None
+
     async def start_server(self):
+        self._loop = asyncio.get_running_loop()
+        self.registry.add_listener(self._on_stream_event)
+        self.registry.start()
+        if self.workers:
+            self.pool = DSPWorkerPool(self.workers)
+            self.pool.start()
+            self.hub.pool = self.pool
+        # Load the deferred heavy modules in the background rather than on the first request
+        self._loop.run_in_executor(None, self.preload)
+        if self.replay is not None:
+            asyncio.create_task(self.watch_replay())
+        if self.streams and self.warm_start:
+            await self.warm_up()
+        elif self.streams:
+            asyncio.create_task(self.warm_up())
         logging.info(f"Server running at ws://{self.host}:{self.port}")
-        async with websockets.serve(self.websocket_handler, self.host, self.port, ping_interval=None):
-            await asyncio.Future()
+        try:
+            # Keepalive pings reap dead peers; write_limit bounds each connection's write buffer
+            async with websockets.serve(self.websocket_handler, self.host, self.port,
+                                        ping_interval=self.ping_interval, ping_timeout=self.ping_timeout,
+                                        write_limit=self.write_limit, process_request=self.process_request):
+                await self._stopped()
+        finally:
+            await self.stop_recording()
+            for source_id in list(self.hub.pinned):
+                self.hub.unpin(source_id)
+            self.registry.stop()
+            if self.pool is not None:
+                self.pool.stop()
+
+    async def _stopped(self):
+        """Wait for SIGTERM (``docker stop``), so recordings are finalized on the way out."""
+        stopped = self._loop.create_future()
+        try:
+            self._loop.add_signal_handler(signal.SIGTERM, lambda: stopped.done() or stopped.set_result(None))
+        except (NotImplementedError, RuntimeError):
+            pass  # no signal handlers on this platform or thread; run until cancelled
+        try:
+            await stopped
+            logging.info("SIGTERM received, shutting down")
+        finally:
+            try:
+                self._loop.remove_signal_handler(signal.SIGTERM)
+            except (NotImplementedError, RuntimeError):
+                pass
 
     def run(self):
         asyncio.run(self.start_server())
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EEG LSL to WebSocket streaming server.")
+    parser.add_argument("--config", help="JSON settings file (default: $CONFIG_FILE)")
+    parser.add_argument("--host", help="interface to listen on ($HOST)")
+    parser.add_argument("--port", type=int, help="WebSocket port ($WEBSOCKET_PORT)")
+    parser.add_argument("--bufsize", type=float, help="seconds buffered per LSL stream ($BUFFER_SIZE)")
+    parser.add_argument("--stream", dest="streams", action="append",
+                        help="source_id to connect at start-up and keep acquiring, repeatable ($STREAMS)")
+    parser.add_argument("--warm-start", action="store_const", const=True,
+                        help="fill the --stream buffers before accepting clients ($WARM_START)")
+    parser.add_argument("--replay", help="serve a recorded session (a directory in $DATA_PATH, or a path) "
+                                         "instead of the LSL streams ($REPLAY)")
+    parser.add_argument("--workers", type=int, help="DSP worker processes ($DSP_WORKERS)")
+    parser.add_argument("--log-level", help="$LOG_LEVEL")
+    args = parser.parse_args(argv)
+    config = load_config(args.config, overrides={k: v for k, v in vars(args).items() if k != "config"})
+
+    # Per-frame debug logging is only formatted when LOG_LEVEL=DEBUG
+    logging.basicConfig(level=config.pop("log_level").upper())
+    EEGWebSocketServer(**config).run()
+
+
 if __name__ == "__main__":
-    EEGWebSocketServer().run()
+    main()
@@ -0,0 +1,422 @@
+import asyncio
+import itertools
+import logging
+import time
+import numpy as np
+from data.dsp_pipeline import Pipeline
+from data.lsl_stream_connector import LSLStreamConnector
+from data.metrics import Metrics
+from data.ring_buffer import SharedSampleRing
+from data.signal_quality import SignalQualityMonitor
+from data.spectral import BandPowerEstimator
+
+
+class Chunk:
+    """One acquisition tick of a source, shared by every subscribed client.
+
+    Encoded messages are cached on the chunk, so clients with identical settings
+    reuse the same bytes instead of re-processing and re-serializing the data.
+    """
+
+    def __init__(self, source, seq, data, timestamps, first_sample, n_dropped):
+        self.source = source
+        self.seq = seq
+        self.data = data
+        self.timestamps = timestamps
+        self.first_sample = first_sample
+        self.n_dropped = n_dropped
+        self.processed = {}
+        self.features = {}
+        self.quality = None  # signal-quality message published with this chunk, if any
+        self._windows = {}
+        self._encoded = {}
+
+    def merge(self, newer):
+        """Return one chunk covering this chunk followed by ``newer`` (same source)."""
+        merged = Chunk(
+            self.source, newer.seq,
+            np.concatenate((self.data, newer.data), axis=1),
+            np.concatenate((self.timestamps, newer.timestamps)),
+            self.first_sample, self.n_dropped + newer.n_dropped
+        )
+        for key in self.processed.keys() & newer.processed.keys():
+            merged.processed[key] = np.concatenate((self.processed[key], newer.processed[key]), axis=1)
+        merged.features = {**self.features, **newer.features}
+        merged.quality = newer.quality or self.quality
+        return merged
+
+    def samples(self, key=None):
+        """Return this chunk's samples, processed by the source pipeline ``key``."""
+        if key is None:
+            return self.data, self.timestamps
+        return self.processed[key], self.timestamps
+
+    def window(self, winsize=1, key=None):
+        """Return the last ``winsize`` seconds of (processed) data (read once per tick)."""
+        if (winsize, key) not in self._windows:
+            if key is None:
+                window = self.source.window(winsize)
+            else:
+                pipeline = self.source.pipelines[key][0]
+                window = pipeline.history.latest(winsize * pipeline.sfreq)
+            self._windows[(winsize, key)] = window
+        return self._windows[(winsize, key)]
+
+    def encode(self, key, build):
+        if key not in self._encoded:
+            self._encoded[key] = build()
+        return self._encoded[key]
+
+
+class AcquisitionSource:
+    """A single LSL connection and ring buffer, fanned out to many subscribers."""
+
+    # Seconds over which the measured sample rate is averaged
+    RATE_WINDOW = 1.0
+
+    def __init__(self, source_id, bufsize, connect_deadline=30.0, metrics=None, pool=None, connector=None,
+                 stream_id=0):
+        self.source_id = source_id
+        self.stream_id = stream_id  # number sent in this source's frames (see data.protocol)
+        self.connector = connector if connector is not None else LSLStreamConnector(bufsize=bufsize)
+        self.connect_deadline = connect_deadline
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pool = pool
+        self.input_ring = None  # shared copy of the raw samples for the worker pool
+        self.subscribers = set()
+        self.seq = 0
+        self.pipelines = {}  # pipeline key -> [Pipeline, number of sessions using it]
+        self.features = {}  # (pipeline key, feature key) -> [BandPowerEstimator, number of sessions]
+        self.quality = None  # [SignalQualityMonitor, number of users] while sessions or pipelines need it
+        self.encode_errors = set()  # encode keys a worker failed on, reported once
+        self.bad_channels = []
+        self.connect_task = None
+        self._task = None
+
+    @property
+    def ch_names(self):
+        return self.connector.ch_names
+
+    @property
+    def sfreq(self):
+        return self.connector.sfreq
+
+    @property
+    def units(self):
+        return self.connector.ch_units
+
+    def window(self, winsize=1):
+        """Return the last ``winsize`` seconds of raw data from the connector's buffer."""
+        return self.connector.get_data(winsize=winsize, picks=self.ch_names)
+
+    def sample_index_at(self, timestamp):
+        return self.connector.sample_index_at(timestamp)
+
+    def history(self, seconds, key=None):
+        """The last ``seconds`` acquired, processed by pipeline ``key``, as ``(data, timestamps, first_sample)``.
+
+        Raw samples come from the connector's buffer and processed ones from the
+        pipeline's history ring; ``first_sample`` is in the numbering of the chunks.
+        """
+        if key is None:
+            return self.connector.get_history(seconds, picks=self.ch_names)
+        pipeline = self.pipelines[key][0]
+        data, timestamps = pipeline.history.latest(seconds * pipeline.sfreq)
+        return data, timestamps, self.connector.sample_count - len(timestamps)
+
+    def primer(self):
+        """A chunk with no new samples, for a subscriber joining an already running source.
+
+        Its window is the data already buffered, so a window-delivery client can be sent
+        a full frame right away instead of at the next acquisition tick.
+        """
+        data = np.zeros((len(self.ch_names), 0), dtype=np.float32)
+        return Chunk(self, max(self.seq - 1, 0), data, np.zeros(0), self.connector.sample_count, 0)
+
+    def report(self, status):
+        """Forward a connection status message to every subscriber."""
+        for session in list(self.subscribers):
+            session.notify(status)
+
+    def acquire_pipeline(self, key, config):
+        """Start (or share) the pipeline ``key``; it sees every chunk from now on."""
+        if key is None:
+            return None
+        if key not in self.pipelines:
+            pipeline = Pipeline(config, self.ch_names, self.sfreq)
+            if self.pool is not None:
+                # A worker runs the filters and writes their output here
+                pipeline.history = SharedSampleRing(len(pipeline.ch_names), pipeline.history.capacity)
+            self.pipelines[key] = [pipeline, 0]
+        self.pipelines[key][1] += 1
+        if self.pipelines[key][0].excludes_bad:
+            self.acquire_quality()
+        return self.pipelines[key][0]
+
+    def release_pipeline(self, key):
+        if key in self.pipelines:
+            if self.pipelines[key][0].excludes_bad:
+                self.release_quality()
+            self.pipelines[key][1] -= 1
+            if self.pipelines[key][1] <= 0:
+                pipeline, _ = self.pipelines.pop(key)
+                if self.pool is not None:
+                    self._release_ring(key, pipeline.history)
+
+    def _release_ring(self, key, ring):
+        self.pool.drop(self.source_id, key, ring.name)
+        ring.close()
+        ring.unlink()
+
+    def acquire_features(self, key, config):
+        """Start (or share) a band-power estimator on the output of pipeline ``key[0]``."""
+        if key not in self.features:
+            ch_names = self.pipelines[key[0]][0].ch_names if key[0] is not None else self.ch_names
+            self.features[key] = [BandPowerEstimator(ch_names, self.sfreq, **(config or {})), 0]
+        self.features[key][1] += 1
+        return self.features[key][0]
+
+    def release_features(self, key):
+        if key in self.features:
+            self.features[key][1] -= 1
+            if self.features[key][1] <= 0:
+                del self.features[key]
+
+    def acquire_quality(self):
+        """Start (or share) the signal-quality monitor on the raw samples."""
+        if self.quality is None:
+            self.quality = [SignalQualityMonitor(self.ch_names, self.sfreq), 0]
+        self.quality[1] += 1
+        return self.quality[0]
+
+    def release_quality(self):
+        if self.quality is not None:
+            self.quality[1] -= 1
+            if self.quality[1] <= 0:
+                self.quality = None
+                self.bad_channels = []
+
+    async def connect(self):
+        return await self.connector.connect_async(
+            self.source_id, deadline=self.connect_deadline, progress=self.report
+        )
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._acquire())
+
+    async def _acquire(self):
+        interval = self.connector.bufsize / self.sfreq if self.sfreq else 0.1
+        logging.info(f"[HUB] Acquisition started for source_id={self.source_id}")
+        metrics, labels = self.metrics, {"source_id": self.source_id}
+        metrics.set_gauge("nominal_rate_hz", self.sfreq or 0, **labels)
+        rate_start, rate_count = time.perf_counter(), self.connector.sample_count
+        try:
+            while True:
+                if not self.connector.connected:
+                    # The stream dropped: reconnect in the background until it comes back or the
+                    # last subscriber leaves. The connector keeps its sample cursor, so frame
+                    # indices continue and the outage is reported as dropped samples.
+                    logging.warning(f"[HUB] Stream lost for source_id={self.source_id}, reconnecting...")
+                    await self.connector.connect_async(self.source_id, deadline=None, progress=self.report)
+                    continue
+
+                start = time.perf_counter()
+                data, timestamps, first_sample, n_dropped = self.connector.get_new_data(picks=self.ch_names)
+                pulled = time.perf_counter()
+                metrics.observe("pull", pulled - start, **labels)
+                metrics.set_gauge("buffer_fill_ratio", self.connector.buffer_fill, **labels)
+                if pulled - rate_start >= self.RATE_WINDOW:
+                    metrics.set_gauge("sample_rate_hz", (self.connector.sample_count - rate_count)
+                                      / (pulled - rate_start), **labels)
+                    rate_start, rate_count = pulled, self.connector.sample_count
+
+                if data is not None and len(timestamps):
+                    chunk = Chunk(self, self.seq, data, timestamps, first_sample, n_dropped)
+                    if self.quality is not None:
+                        # Before the pipelines, so a reference sees the channels just flagged bad
+                        start = time.perf_counter()
+                        chunk.quality = self.quality[0].update(data, timestamps, first_sample)
+                        if chunk.quality is not None:
+                            self.bad_channels = sorted(chunk.quality["bad"])
+                        metrics.observe("quality", time.perf_counter() - start, **labels)
+                    if self.pool is not None:
+                        await self._process_in_pool(chunk)
+                        metrics.observe("workers", time.perf_counter() - pulled, **labels)
+                    elif self.pipelines:
+                        for key, (pipeline, _) in list(self.pipelines.items()):
+                            pipeline.exclude(self.bad_channels)
+                            chunk.processed[key] = pipeline.process(data, timestamps)
+                        metrics.observe("dsp", time.perf_counter() - pulled, **labels)
+                    if self.features:
+                        start = time.perf_counter()
+                        for key, (estimator, _) in list(self.features.items()):
+                            samples = chunk.processed.get(key[0]) if key[0] is not None else data
+                            features = estimator.update(samples, timestamps) if samples is not None else None
+                            if features is not None:
+                                chunk.features[key] = features
+                        metrics.observe("features", time.perf_counter() - start, **labels)
+                    self.seq += 1
+                    for session in list(self.subscribers):
+                        try:
+                            session.push(chunk)
+                        except Exception:
+                            # One failing subscriber must not stop the stream for the others
+                            logging.exception(f"[HUB] Subscriber failed on source_id={self.source_id}")
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            logging.info(f"[HUB] Acquisition stopped for source_id={self.source_id}")
+            raise
+
+    async def _process_in_pool(self, chunk):
+        """Run the pipelines and the subscribers' encodings for ``chunk`` in a worker.
+
+        Afterwards ``chunk.processed`` holds the pipeline outputs (read from the shared
+        history rings) and the encoded frames are preloaded into the chunk's cache.
+        Frames a worker did not produce are still encoded locally on demand.
+        """
+        if self.input_ring is None:
+            self.input_ring = SharedSampleRing(len(self.ch_names), self.connector.bufsize * (self.sfreq or 1))
+        ring = self.input_ring
+        start = ring.count
+        ring.write(chunk.data, chunk.timestamps)
+
+        pipelines = {key: pipeline for key, (pipeline, _) in self.pipelines.items()}
+        encodings = {getattr(session, "encode_key", None) for session in self.subscribers}
+        task = {
+            "source_id": self.source_id, "stream_id": self.stream_id, "sfreq": self.sfreq, "ch_names": self.ch_names, "units": self.units,
+            "input": ring.spec(), "start": start, "stop": ring.count,
+            "seq": chunk.seq, "first_sample": chunk.first_sample, "n_dropped": chunk.n_dropped,
+            "exclude": self.bad_channels,
+            "pipelines": {key: (pipeline.config, pipeline.history.spec(), pipeline.history.count)
+                          for key, pipeline in pipelines.items()},
+            "encodings": [key for key in encodings
+                          if key is not None and key[0] != "features" and (key[2] is None or key[2] in pipelines)],
+        }
+        try:
+            frames, counts, errors = await self.pool.run(self.source_id, task)
+        except RuntimeError as e:
+            logging.error(f"[HUB] Worker failed for source_id={self.source_id}: {e}")
+            # The chunk is missing from the pipelines' histories; older samples would be
+            # misnumbered, so the histories start over with the next chunk
+            for pipeline in pipelines.values():
+                pipeline.history.count = 0
+            return
+
+        n = len(chunk.timestamps)
+        for key, pipeline in pipelines.items():
+            if key in self.pipelines and self.pipelines[key][0] is pipeline:
+                pipeline.history.count = counts[key]
+                chunk.processed[key], _ = pipeline.history.read(counts[key] - n, counts[key])
+        chunk._encoded.update(frames)
+        for key, error in errors.items():
+            chunk._encoded[key] = None  # sessions with these settings skip the chunk
+            if key not in self.encode_errors:
+                self.encode_errors.add(key)
+                logging.error(f"[HUB] Encoding {key} failed for source_id={self.source_id}: {error}")
+                for session in list(self.subscribers):
+                    if getattr(session, "encode_key", None) == key:
+                        session.notify({"error": f"Could not encode frames with these settings: {error}"})
+
+    def stop(self):
+        for task in (self.connect_task, self._task):
+            if task is not None:
+                task.cancel()
+        self.connect_task = None
+        self._task = None
+        try:
+            self.connector.disconnect()
+        except Exception as e:
+            logging.error(f"Error during stream disconnect: {e}")
+        if self.pool is not None:
+            for key, (pipeline, _) in self.pipelines.items():
+                self._release_ring(key, pipeline.history)
+            self.pipelines = {}
+            if self.input_ring is not None:
+                self._release_ring(None, self.input_ring)
+                self.input_ring = None
+            self.pool.release(self.source_id)
+        self.metrics.forget(source_id=self.source_id)
+
+
+class Standby:
+    """Subscriber that keeps a source connected and acquiring while no client uses it."""
+
+    def push(self, chunk):
+        pass
+
+    def notify(self, message):
+        pass
+
+
+class AcquisitionHub:
+    """Reference-counted registry of acquisition sources keyed by LSL ``source_id``."""
+
+    def __init__(self, bufsize=20, connect_deadline=30.0, metrics=None, pool=None, connector_factory=None):
+        self.bufsize = bufsize
+        self.connect_deadline = connect_deadline
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pool = pool  # DSPWorkerPool for new sources, or None to process in the event loop
+        # connector_factory(source_id, bufsize) replaces the LSL connection (see data.replay)
+        self.connector_factory = connector_factory
+        self._stream_ids = itertools.count()
+        self.sources = {}
+        self.pinned = {}  # source_id -> Standby subscriber
+
+    def new_stream_id(self):
+        """A frame ``stream_id`` for a new source or combined stream (1-65535, then reused)."""
+        return next(self._stream_ids) % 0xFFFF + 1
+
+    async def subscribe(self, source_id, session):
+        """Attach ``session`` to ``source_id``, connecting the source on first use.
+
+        Concurrent subscribers wait on the same connection attempt. Cancelling one of
+        them does not cancel the attempt; it is only abandoned once every waiting
+        subscriber has unsubscribed. Returns the source, or ``None`` if the stream could
+        not be connected before the deadline.
+        """
+        source = self.sources.get(source_id)
+        if source is None:
+            connector = self.connector_factory(source_id, self.bufsize) if self.connector_factory else None
+            source = AcquisitionSource(source_id, self.bufsize, self.connect_deadline, self.metrics, self.pool,
+                                       connector, self.new_stream_id())
+            source.connect_task = asyncio.create_task(source.connect())
+            self.sources[source_id] = source
+        source.subscribers.add(session)
+
+        if source.connect_task is not None:
+            if not await asyncio.shield(source.connect_task):
+                self.unsubscribe(source_id, session)
+                return None
+            source.connect_task = None
+            source.start()
+
+        logging.info(f"[HUB] {len(source.subscribers)} subscriber(s) on source_id={source_id}")
+        return source
+
+    def unsubscribe(self, source_id, session):
+        """Detach ``session``; the source is stopped once its last subscriber leaves."""
+        source = self.sources.get(source_id)
+        if source is None:
+            return
+        source.subscribers.discard(session)
+        if not source.subscribers:
+            source.stop()
+            del self.sources[source_id]
+
+    async def pin(self, source_id):
+        """Connect ``source_id`` and keep it acquiring even without clients.
+
+        Returns the source, or ``None`` if it could not be connected.
+        """
+        # Pinning again just waits on the same connection attempt
+        standby = self.pinned.setdefault(source_id, Standby())
+        source = await self.subscribe(source_id, standby)
+        if source is None:
+            self.pinned.pop(source_id, None)
+        return source
+
+    def unpin(self, source_id):
+        standby = self.pinned.pop(source_id, None)
+        if standby is not None:
+            self.unsubscribe(source_id, standby)
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def samples_per_bin(view, sfreq):
+    """Number of raw samples that fall on one pixel of a client viewport.
+
+    ``view`` is the ``{"width": pixels, "span": seconds}`` dict sent by the client.
+    """
+    if not view or not sfreq:
+        return 1
+    width = max(int(view.get("width", 0)), 1)
+    span = float(view.get("span", 0))
+    return max(int(span * sfreq / width), 1)
+
+
+def minmax_decimate(data, timestamps, n_per_bin, first_sample=0):
+    """Reduce ``data`` to the min and max of every ``n_per_bin`` samples.
+
+    Computed over the whole (n_channels, n_samples) matrix at once with
+    ``reduceat``. Bins are aligned to the absolute sample index ``first_sample``, so
+    consecutive incremental chunks split at the same places for every client. Each
+    bin yields two points (min at the bin's first timestamp, max at its last), which
+    preserves the visual envelope of the trace, including spikes.
+    """
+    n_samples = data.shape[1]
+    if n_per_bin <= 2 or n_samples == 0:
+        return data, timestamps
+
+    first_edge = (-first_sample) % n_per_bin
+    starts = np.arange(first_edge, n_samples, n_per_bin)
+    if first_edge:
+        starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], n_samples) - 1
+
+    decimated = np.empty((data.shape[0], 2 * starts.size), dtype=data.dtype)
+    decimated[:, 0::2] = np.minimum.reduceat(data, starts, axis=1)
+    decimated[:, 1::2] = np.maximum.reduceat(data, starts, axis=1)
+    decimated_ts = np.empty(2 * starts.size, dtype=timestamps.dtype)
+    decimated_ts[0::2] = timestamps[starts]
+    decimated_ts[1::2] = timestamps[ends]
+    return decimated, decimated_ts
@@ -0,0 +1,229 @@
+import json
+import numpy as np
+from data.ring_buffer import SampleRing
+
+
+class Stage:
+    """One step of a streaming pipeline.
+
+    ``setup`` is called once with the input channel names and sampling rate and
+    returns the output channel names. ``process`` transforms a float32
+    (n_channels, n_samples) block, in place where possible, and returns the result.
+    """
+
+    def setup(self, ch_names, sfreq):
+        return ch_names
+
+    def process(self, data):
+        raise NotImplementedError
+
+
+class Rereference(Stage):
+    """Re-referencing as a single precomputed (n_out, n_in) matrix product.
+
+    ``mode="average"`` subtracts the common average, ``channels=[...]`` subtracts the
+    mean of the listed channels (e.g. linked mastoids) and ``mode="bipolar"`` with
+    ``pairs=[[a, b], ...]`` outputs one ``a-b`` derivation per pair. With
+    ``exclude_bad``, channels flagged by the stream's signal-quality monitor (see
+    ``data.signal_quality``) are left out of the reference mean while they are bad.
+    """
+
+    def __init__(self, mode="channels", channels=None, pairs=None, exclude_bad=False):
+        self.mode = mode
+        self.channels = channels or []
+        self.pairs = pairs or []
+        self.exclude_bad = exclude_bad
+        self.excluded = frozenset()
+
+    def setup(self, ch_names, sfreq):
+        index = {ch: i for i, ch in enumerate(ch_names)}
+        n = len(ch_names)
+        self._scratch = None
+        self._ch_names = ch_names
+        if self.mode == "bipolar":
+            pairs = [(a, b) for a, b in self.pairs if a in index and b in index]
+            self.matrix = np.zeros((len(pairs), n), dtype=np.float32)
+            for row, (a, b) in enumerate(pairs):
+                self.matrix[row, index[a]] = 1
+                self.matrix[row, index[b]] = -1
+            return [f"{a}-{b}" for a, b in pairs]
+
+        self._refs = list(range(n)) if self.mode == "average" else [index[ch] for ch in self.channels if ch in index]
+        self._build()
+        return ch_names
+
+    def _build(self):
+        # Without any good reference channel left, keep the full reference rather than none
+        refs = [i for i in self._refs if self._ch_names[i] not in self.excluded] or self._refs
+        self.matrix = None
+        if refs:
+            self.matrix = np.eye(len(self._ch_names), dtype=np.float32)
+            self.matrix[:, refs] -= 1 / len(refs)
+
+    def exclude(self, channels):
+        """Leave ``channels`` out of the reference (until the next call)."""
+        excluded = frozenset(channels)
+        if excluded != self.excluded and self.mode != "bipolar":
+            self.excluded = excluded
+            self._build()
+
+    def process(self, data):
+        if self.matrix is None:
+            return data
+        if self._scratch is None or self._scratch.shape[1] < data.shape[1]:
+            self._scratch = np.empty((self.matrix.shape[0], data.shape[1]), dtype=np.float32)
+        out = self._scratch[:, :data.shape[1]]
+        np.matmul(self.matrix, data, out=out)
+        if out.shape[0] == data.shape[0]:
+            data[...] = out
+            return data
+        return out
+
+
+class IIRFilter(Stage):
+    """Causal second-order-sections filter whose state carries across chunks.
+
+    The state is initialised to the filter's step response scaled by the first
+    chunk's channel means, so the DC offset of the signal does not ring at start-up.
+    Coefficients, state and arithmetic are float64: with electrode offsets of tens of
+    millivolts, single-precision recursion errors reach microvolts at high rates. Only
+    the result is stored back into the float32 block.
+    ``scipy.signal`` is imported on first use; it dominates the server's start-up time.
+    """
+
+    def design(self, sfreq):
+        raise NotImplementedError
+
+    def setup(self, ch_names, sfreq):
+        self.sos = self.design(sfreq).astype(np.float64)
+        self.zi = None
+        return ch_names
+
+    def process(self, data):
+        from scipy.signal import sosfilt, sosfilt_zi
+
+        if self.zi is None:
+            zi = sosfilt_zi(self.sos)[:, np.newaxis, :]
+            self.zi = zi * data.mean(axis=1, dtype=np.float64)[np.newaxis, :, np.newaxis]
+        data[...], self.zi = sosfilt(self.sos, data.astype(np.float64), axis=1, zi=self.zi)
+        return data
+
+
+class BandPass(IIRFilter):
+    """Butterworth band-pass; ``l_freq=None`` gives a low-pass, ``h_freq=None`` a high-pass."""
+
+    def __init__(self, l_freq=None, h_freq=None, order=4):
+        self.l_freq = l_freq
+        self.h_freq = h_freq
+        self.order = order
+
+    def design(self, sfreq):
+        from scipy.signal import butter
+
+        if self.l_freq and self.h_freq:
+            return butter(self.order, [self.l_freq, self.h_freq], btype="bandpass", fs=sfreq, output="sos")
+        if self.l_freq:
+            return butter(self.order, self.l_freq, btype="highpass", fs=sfreq, output="sos")
+        if self.h_freq:
+            return butter(self.order, self.h_freq, btype="lowpass", fs=sfreq, output="sos")
+        raise ValueError("bandpass stage needs l_freq and/or h_freq")
+
+
+class Notch(IIRFilter):
+    """Notch at ``freq`` and its first ``harmonics - 1`` multiples below Nyquist."""
+
+    def __init__(self, freq=50, quality=30, harmonics=1):
+        self.freq = freq
+        self.quality = quality
+        self.harmonics = harmonics
+
+    def design(self, sfreq):
+        from scipy.signal import iirnotch, tf2sos
+
+        sections = []
+        for k in range(1, self.harmonics + 1):
+            if self.freq * k < sfreq / 2:
+                b, a = iirnotch(self.freq * k, self.quality, fs=sfreq)
+                sections.append(tf2sos(b, a))
+        if not sections:
+            raise ValueError(f"notch frequency {self.freq} Hz is above Nyquist")
+        return np.concatenate(sections)
+
+
+class DCRemoval(IIRFilter):
+    """First-order high-pass at ``cutoff`` Hz removing the electrode offset."""
+
+    def __init__(self, cutoff=0.1):
+        self.cutoff = cutoff
+
+    def design(self, sfreq):
+        from scipy.signal import butter
+
+        return butter(1, self.cutoff, btype="highpass", fs=sfreq, output="sos")
+
+
+STAGES = {
+    "reference": Rereference,
+    "bandpass": BandPass,
+    "notch": Notch,
+    "dc": DCRemoval,
+}
+
+
+def pipeline_key(config):
+    """Canonical, hashable form of a pipeline config (``None`` for no processing)."""
+    return json.dumps(config, sort_keys=True) if config else None
+
+
+def build_stages(config):
+    stages = []
+    for stage in config:
+        params = dict(stage)
+        kind = params.pop("type", None)
+        if kind not in STAGES:
+            raise ValueError(f"Unknown pipeline stage {kind!r}")
+        stages.append(STAGES[kind](**params))
+    return stages
+
+
+class Pipeline:
+    """A chain of stages applied once per acquired chunk of a stream.
+
+    Chunks are converted into a preallocated float32 working buffer that the stages
+    modify in place. Each result is also written to a history ring, so window-mode
+    clients read filtered data with continuous filter state instead of re-filtering
+    every window.
+    """
+
+    def __init__(self, config, ch_names, sfreq, history=10):
+        self.config = config
+        self.stages = build_stages(config)
+        for stage in self.stages:
+            ch_names = stage.setup(ch_names, sfreq)
+        self.ch_names = ch_names
+        self.sfreq = sfreq
+        self.history = SampleRing(len(ch_names), history * sfreq if sfreq else 1)
+        self._work = None
+
+    @property
+    def excludes_bad(self):
+        """Whether a stage drops bad channels from its reference (see ``exclude``)."""
+        return any(getattr(stage, "exclude_bad", False) for stage in self.stages)
+
+    def exclude(self, channels):
+        """Pass the stream's current bad channels to the stages that exclude them."""
+        for stage in self.stages:
+            if getattr(stage, "exclude_bad", False):
+                stage.exclude(channels)
+
+    def process(self, data, timestamps):
+        n_samples = data.shape[1]
+        if self._work is None or self._work.shape[1] < n_samples:
+            self._work = np.empty((data.shape[0], n_samples), dtype=np.float32)
+        block = self._work[:, :n_samples]
+        block[...] = data
+        for stage in self.stages:
+            block = stage.process(block)
+        self.history.write(block, timestamps)
+        # The working buffer is reused for the next chunk; hand out an owned copy
+        return block.copy()
@@ -1,7 +1,12 @@
+import argparse
+import bisect
+import logging
+import threading
 import time
 import uuid
-from pylsl import resolve_streams
-from mne_lsl.stream import StreamLSL as Stream  # Use MNE-LSL's StreamLSL instead of pylsl's StreamInlet
+import numpy as np
+from pylsl import StreamInfo, StreamOutlet, local_clock, resolve_streams
+from scipy.signal import lfilter
 
 class LSLDataSimulator:
     def __init__(self, chunk_size=200):
@@ -55,6 +60,8 @@ class LSLDataSimulator:
         print(f"\n🔗 Connecting to Stream '{selected_stream.name()}' using MNE-LSL...")
 
         # Create a StreamLSL object (MNE-LSL)
+        from mne_lsl.stream import StreamLSL as Stream  # Use MNE-LSL's StreamLSL instead of pylsl's StreamInlet
+
         self.stream = Stream(bufsize=2, name=selected_stream.name(), stype=selected_stream.type())
         self.stream.connect()
 
@@ -84,11 +91,413 @@ class LSLDataSimulator:
             print("\n Stopping LSL streaming.")
             self.stream.disconnect()
 
-# Testing the class
-if __name__ == "__main__":
-    simulator = LSLDataSimulator(chunk_size=200)
-    available_streams = simulator.find_streams()  # List available streams
 
-    if available_streams:
-        print("[TEST] Stream discovery completed successfully.")
-        simulator.stream_data(0)  # Connect to the first available stream and start streaming
+
+# Paul Kellet / J. O. Smith pinking filter: white noise -> ~1/f power over ~4 decades
+PINK_B = [0.049922035, -0.095993537, 0.050612699, -0.004408786]
+PINK_A = [1.0, -2.494956002, 2.017265875, -0.522189400]
+
+
+def _gaussians(times, components):
+    """Sum of ``(amplitude, centre, width)`` Gaussians evaluated at ``times`` (seconds)."""
+    return sum(a * np.exp(-0.5 * ((times - c) / w) ** 2) for a, c, w in components)
+
+
+class SignalGenerator:
+    """Synthesizes a multichannel signal in fixed-size blocks from a seeded RNG.
+
+    ``read(n)`` returns the next ``n`` samples as an (n, n_channels) float32 array,
+    the layout ``push_chunk`` takes. Blocks are always ``block`` seconds long whatever
+    the read sizes, so the output depends only on the seed: a stream pushed in
+    timer-sized chunks is sample-for-sample identical to one read offline in one go.
+    Short waveforms (artifacts, heartbeats, evoked responses) are rendered into an
+    overlap buffer whose tail is carried into the next block.
+    """
+
+    stype = "Misc"
+    unit = "microvolts"
+
+    def __init__(self, n_channels, sfreq, seed=None, ch_names=None, block=0.1, max_event=1.0):
+        self.n_channels = n_channels
+        self.sfreq = float(sfreq)
+        self.ch_names = list(ch_names) if ch_names else [f"{self.stype}{k + 1:03d}" for k in range(n_channels)]
+        if len(self.ch_names) != n_channels:
+            raise ValueError(f"{len(self.ch_names)} channel names for {n_channels} channels")
+        self.rng = np.random.default_rng(seed)
+        self.block_size = max(int(round(block * self.sfreq)), 1)
+        self.n_generated = 0  # samples synthesized so far, i.e. the index of the next block
+        self._carry = np.zeros((max(int(max_event * self.sfreq), 1), n_channels), dtype=np.float32)
+        self._pending = np.zeros((0, n_channels), dtype=np.float32)
+
+    def read(self, n):
+        pieces, have = [self._pending], len(self._pending)
+        while have < n:
+            block = self._next_block()
+            pieces.append(block)
+            have += len(block)
+        data = np.concatenate(pieces) if len(pieces) > 1 else self._pending
+        self._pending = data[n:]
+        return data[:n]
+
+    def _next_block(self):
+        n = self.block_size
+        times = (self.n_generated + np.arange(n)) / self.sfreq
+        overlay = np.zeros((n + len(self._carry), self.n_channels), dtype=np.float32)
+        overlay[:len(self._carry)] = self._carry
+        block = self.synthesize(times, overlay)
+        block += overlay[:n]
+        self._carry = overlay[n:]
+        self.n_generated += n
+        return block
+
+    def synthesize(self, times, overlay):
+        """Return the (len(times), n_channels) block; events go into ``overlay`` via ``render``."""
+        raise NotImplementedError
+
+    def render(self, overlay, onset, waveform, weights):
+        """Add ``waveform`` scaled by per-channel ``weights`` from block sample ``onset`` on."""
+        waveform = waveform[:len(overlay) - onset]
+        overlay[onset:onset + len(waveform)] += np.outer(waveform, weights)
+
+
+class EEGGenerator(SignalGenerator):
+    """EEG-like signal in microvolts.
+
+    Each channel is 1/f background noise plus posterior-weighted alpha bursts (an
+    alpha-band carrier under a slowly fluctuating envelope) and mains interference
+    at ``line_freq`` and its third harmonic. Blinks (frontal, low channel numbers),
+    muscle bursts and electrode pops arrive as Poisson events at the given rates per
+    second. With a linked ``MarkerGenerator`` and ``erp`` amplitudes per label, an
+    N1/P3 evoked response is added after every such marker.
+    """
+
+    stype = "EEG"
+
+    def __init__(self, n_channels=32, sfreq=250.0, seed=None, ch_names=None, amplitude=10.0,
+                 alpha_freq=10.0, alpha_amplitude=10.0, alpha_burst=1.0, line_freq=50.0, line_amplitude=2.0,
+                 blink_rate=0.2, muscle_rate=0.05, pop_rate=0.02, markers=None, erp=None, block=0.1):
+        super().__init__(n_channels, sfreq, seed, ch_names, block, max_event=1.0)
+        rng = self.rng
+        self.amplitude = amplitude
+        self.alpha_freq = alpha_freq
+        self.alpha_amplitude = alpha_amplitude
+        self.line_freq = line_freq
+        self.line_amplitude = line_amplitude
+        self.rates = {"blink": blink_rate, "muscle": muscle_rate, "pop": pop_rate}
+        self.markers = markers
+        self.erp = dict(erp or {})
+
+        impulse = lfilter(PINK_B, PINK_A, np.r_[1.0, np.zeros(1 << 16)])
+        self._pink_gain = amplitude / np.sqrt(np.sum(impulse ** 2))
+        self._pink_zi = np.zeros((len(PINK_A) - 1, n_channels))
+        # Alpha envelope: one AR(1) process shared by all channels, correlation time ``alpha_burst``
+        self._alpha_pole = np.exp(-1.0 / (alpha_burst * self.sfreq))
+        self._alpha_zi = np.zeros(1)
+
+        position = np.arange(n_channels) / max(n_channels - 1, 1)  # 0 = frontal, 1 = occipital
+        # Sinusoids with per-channel gain g and phase p, as g*sin(wt + p) = sin(wt)*g*cos(p) + cos(wt)*g*sin(p):
+        # a (n, 2) time basis times a (2, n_channels) mixing matrix instead of n * n_channels sines
+        alpha_phase = rng.uniform(0, 2 * np.pi, n_channels)
+        line_phase = rng.uniform(0, 2 * np.pi, n_channels)
+        alpha_gain = alpha_amplitude * (0.2 + 0.8 * position) * rng.uniform(0.8, 1.2, n_channels)
+        line_gain = line_amplitude * rng.uniform(0.5, 1.5, n_channels)
+        self._mixing = np.array([
+            alpha_gain * np.cos(alpha_phase), alpha_gain * np.sin(alpha_phase),
+            line_gain * np.cos(line_phase), line_gain * np.sin(line_phase),
+            0.2 * line_gain * np.cos(3 * line_phase), 0.2 * line_gain * np.sin(3 * line_phase),
+        ])
+        self._blink_weights = np.exp(-4 * position)
+        self._erp_weights = np.exp(-((position - 0.6) / 0.35) ** 2)  # centro-parietal maximum
+
+        t = np.arange(int(0.4 * self.sfreq)) / self.sfreq
+        self._blink = _gaussians(t, [(100.0, 0.2, 0.05)])
+        t = np.arange(int(0.3 * self.sfreq)) / self.sfreq
+        self._pop = 50.0 * np.exp(-t / 0.05)
+        t = np.arange(int(0.8 * self.sfreq)) / self.sfreq
+        self._evoked = _gaussians(t, [(-0.5, 0.1, 0.02), (1.0, 0.32, 0.06)])  # per unit amplitude
+
+    def synthesize(self, times, overlay):
+        n, rng = len(times), self.rng
+        white = rng.standard_normal((n, self.n_channels))
+        block, self._pink_zi = lfilter(PINK_B, PINK_A, white, axis=0, zi=self._pink_zi)
+        block *= self._pink_gain
+
+        pole = self._alpha_pole
+        drive = rng.standard_normal(n) * np.sqrt((1 + pole) / (1 - pole))  # unit-variance envelope
+        envelope, self._alpha_zi = lfilter([1 - pole], [1, -pole], drive, zi=self._alpha_zi)
+        envelope = np.maximum(envelope, 0)
+        alpha = 2 * np.pi * self.alpha_freq * times
+        line = 2 * np.pi * self.line_freq * times
+        basis = np.column_stack([
+            np.sin(alpha) * envelope, np.cos(alpha) * envelope,
+            np.sin(line), np.cos(line), np.sin(3 * line), np.cos(3 * line),
+        ])
+        block += basis @ self._mixing
+
+        for kind, rate in self.rates.items():
+            for onset in np.flatnonzero(rng.random(n) < rate / self.sfreq):
+                if kind == "blink":
+                    self.render(overlay, onset, self._blink, self._blink_weights * rng.uniform(0.5, 1.5))
+                elif kind == "muscle":
+                    burst = rng.standard_normal(int(rng.uniform(0.1, 0.5) * self.sfreq)) * 20.0
+                    channels = rng.random(self.n_channels) < 0.2
+                    self.render(overlay, onset, burst * np.hanning(len(burst)), channels.astype(float))
+                else:
+                    weights = np.zeros(self.n_channels)
+                    weights[rng.integers(self.n_channels)] = rng.choice([-1.0, 1.0])
+                    self.render(overlay, onset, self._pop, weights)
+
+        if self.markers is not None and self.erp:
+            for time_, label in self.markers.between(times[0], times[0] + n / self.sfreq):
+                amplitude = self.erp.get(label)
+                if amplitude:
+                    onset = int(round(time_ * self.sfreq)) - self.n_generated
+                    self.render(overlay, max(onset, 0), amplitude * self._evoked, self._erp_weights)
+        return block.astype(np.float32)
+
+
+class ECGGenerator(SignalGenerator):
+    """ECG-like signal in microvolts: a PQRST template at heart-rate-variable RR
+    intervals, projected onto each lead with its own gain, on top of respiratory
+    baseline wander and white noise."""
+
+    stype = "ECG"
+
+    def __init__(self, n_channels=1, sfreq=500.0, seed=None, ch_names=None, heart_rate=70.0, hrv=0.05,
+                 amplitude=1000.0, noise=10.0, block=0.1):
+        super().__init__(n_channels, sfreq, seed, ch_names, block, max_event=0.8)
+        self.heart_rate = heart_rate
+        self.hrv = hrv
+        self.noise = noise
+        self._leads = amplitude * self.rng.uniform(0.4, 1.0, n_channels) * self.rng.choice([-1, 1], n_channels)
+        self._leads[0] = abs(self._leads[0])
+        t = np.arange(int(0.8 * self.sfreq)) / self.sfreq - 0.3  # R peak 300 ms into the template
+        self._beat = _gaussians(t, [(0.15, -0.2, 0.025), (-0.15, -0.025, 0.01), (1.0, 0.0, 0.012),
+                                    (-0.25, 0.03, 0.01), (0.3, 0.3, 0.05)])
+        self._next_beat = int(self.rng.uniform(0, 60.0 / heart_rate) * self.sfreq)
+
+    def synthesize(self, times, overlay):
+        n, rng = len(times), self.rng
+        block = rng.standard_normal((n, self.n_channels)) * self.noise
+        block += (0.1 * np.sin(2 * np.pi * 0.25 * times))[:, None] * self._leads
+        while self._next_beat < self.n_generated + n:
+            self.render(overlay, self._next_beat - self.n_generated, self._beat, self._leads)
+            rr = 60.0 / self.heart_rate * (1 + self.hrv * rng.standard_normal())
+            self._next_beat += max(int(rr * self.sfreq), int(0.3 * self.sfreq))
+        return block.astype(np.float32)
+
+
+class MarkerGenerator:
+    """Irregular string-marker stream following an experimental paradigm.
+
+    ``oddball``: ``labels[1]`` with ``target_probability``, else ``labels[0]``, every
+    ``soa`` ± ``jitter`` seconds. ``periodic``: ``labels[0]`` every ``soa`` seconds.
+    ``blocks``: the labels in turn, one per ``soa`` seconds. ``random``: uniformly
+    drawn labels with exponentially distributed intervals of mean ``soa`` (a
+    Poisson process). Event times are seconds from stream start and are scheduled
+    lazily from the seeded RNG, so any consumer sees the same sequence.
+    """
+
+    PARADIGMS = {
+        "oddball": ("standard", "target"),
+        "periodic": ("stim",),
+        "blocks": ("rest", "task"),
+        "random": ("1", "2", "3", "4"),
+    }
+
+    def __init__(self, paradigm="oddball", seed=None, soa=1.0, jitter=0.2, target_probability=0.2,
+                 labels=None, start=1.0):
+        if paradigm not in self.PARADIGMS:
+            raise ValueError(f"Unknown paradigm {paradigm!r}, expected one of {', '.join(self.PARADIGMS)}")
+        self.paradigm = paradigm
+        self.labels = [str(label) for label in (labels or self.PARADIGMS[paradigm])]
+        self.rng = np.random.default_rng(seed)
+        self.soa = soa
+        self.jitter = jitter
+        self.target_probability = target_probability
+        self.times = []
+        self.events = []  # (time, label), in time order
+        self._next_time = start
+
+    def _schedule(self, until):
+        rng = self.rng
+        while self._next_time < until:
+            n = len(self.events)
+            if self.paradigm == "oddball":
+                label = self.labels[-1] if rng.random() < self.target_probability else self.labels[0]
+                interval = self.soa + rng.uniform(-self.jitter, self.jitter)
+            elif self.paradigm == "periodic":
+                label, interval = self.labels[0], self.soa
+            elif self.paradigm == "blocks":
+                label, interval = self.labels[n % len(self.labels)], self.soa
+            else:
+                label, interval = self.labels[rng.integers(len(self.labels))], rng.exponential(self.soa)
+            self.times.append(self._next_time)
+            self.events.append((self._next_time, label))
+            self._next_time += max(interval, 0.0)
+
+    def between(self, start, stop):
+        """Events with ``start <= time < stop``."""
+        self._schedule(stop)
+        return self.events[bisect.bisect_left(self.times, start):bisect.bisect_left(self.times, stop)]
+
+
+class StreamSimulator:
+    """Publishes synthetic EEG, ECG and marker streams on LSL from one pacing thread.
+
+    Every ``chunk`` seconds each signal stream pushes all samples due since start
+    according to ``local_clock``, so rates stay exact however late the thread wakes.
+    Chunk timestamps are the nominal sample times, offset by Gaussian noise of
+    ``jitter`` seconds per chunk when set. ``dropout`` is the rate (per second) of
+    outages of ``dropout_duration`` seconds during which samples are generated but
+    not pushed, which receivers see as gaps in the sample timestamps. Each stream
+    draws from its own child of ``seed``, so streams are reproducible independently
+    of each other and of timing.
+    """
+
+    def __init__(self, seed=0, chunk=0.02, jitter=0.0, dropout=0.0, dropout_duration=0.5):
+        self.seeds = np.random.SeedSequence(seed)
+        self.chunk = chunk
+        self.jitter = jitter
+        self.dropout = dropout
+        self.dropout_duration = dropout_duration
+        self.streams = []  # dicts: name, source_id, generator, and counters once started
+        self._rng = np.random.default_rng(self.seeds.spawn(1)[0])  # jitter and dropout
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _add(self, cls, name, source_id, kwargs):
+        generator = cls(seed=self.seeds.spawn(1)[0], **kwargs)
+        self.streams.append({"name": name, "source_id": source_id or f"sim-{name.lower()}", "generator": generator})
+        return generator
+
+    def add_eeg(self, name="SimEEG", source_id=None, **kwargs):
+        return self._add(EEGGenerator, name, source_id, kwargs)
+
+    def add_ecg(self, name="SimECG", source_id=None, **kwargs):
+        return self._add(ECGGenerator, name, source_id, kwargs)
+
+    def add_markers(self, name="SimMarkers", source_id=None, **kwargs):
+        return self._add(MarkerGenerator, name, source_id, kwargs)
+
+    @staticmethod
+    def _outlet(stream):
+        generator = stream["generator"]
+        if isinstance(generator, MarkerGenerator):
+            info = StreamInfo(stream["name"], "Markers", 1, 0, "string", stream["source_id"])
+            return StreamOutlet(info)
+        info = StreamInfo(stream["name"], generator.stype, generator.n_channels, generator.sfreq, "float32",
+                          stream["source_id"])
+        channels = info.desc().append_child("channels")
+        for label in generator.ch_names:
+            ch = channels.append_child("channel")
+            ch.append_child_value("label", label)
+            ch.append_child_value("unit", generator.unit)
+            ch.append_child_value("type", generator.stype)
+        return StreamOutlet(info, max(int(generator.sfreq * 0.01), 1))
+
+    def start(self):
+        for stream in self.streams:
+            stream.update(outlet=self._outlet(stream), elapsed=0.0, n_sent=0, n_pushed=0, n_dropped=0, outage_until=0.0)
+            logging.info(f"[SIM] {stream['name']} ({stream['source_id']}) publishing")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="stream-simulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        for stream in self.streams:
+            stream.pop("outlet", None)
+
+    def _push(self, stream, t0, elapsed):
+        generator, outlet = stream["generator"], stream["outlet"]
+        if isinstance(generator, MarkerGenerator):
+            for time_, label in generator.between(stream["elapsed"], elapsed):
+                outlet.push_sample([label], t0 + time_)
+                stream["n_pushed"] += 1
+            stream["elapsed"] = elapsed
+            return
+
+        n = int(elapsed * generator.sfreq) - stream["n_sent"]
+        if n <= 0:
+            return
+        data = generator.read(n)
+        stop = stream["n_sent"] + n
+        stream["n_sent"] = stop
+        if self.dropout and elapsed >= stream["outage_until"] and self._rng.random() < self.dropout * self.chunk:
+            stream["outage_until"] = elapsed + self.dropout_duration
+        if elapsed < stream["outage_until"]:
+            stream["n_dropped"] += n
+            return
+        timestamp = t0 + (stop - 1) / generator.sfreq
+        if self.jitter:
+            timestamp += self._rng.normal(0, self.jitter)
+        outlet.push_chunk(data, timestamp)
+        stream["n_pushed"] += n
+
+    def _run(self):
+        t0 = local_clock()
+        next_tick = time.perf_counter()
+        while not self._stop_event.is_set():
+            elapsed = local_clock() - t0
+            for stream in self.streams:
+                self._push(stream, t0, elapsed)
+            next_tick += self.chunk
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # fell behind: catch up in one larger chunk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish synthetic EEG, ECG and marker streams on LSL.")
+    parser.add_argument("--eeg", type=int, nargs="*", default=[32], metavar="CHANNELS",
+                        help="channel count of each EEG stream (default: one 32-channel stream)")
+    parser.add_argument("--sfreq", type=float, default=250.0, help="EEG sampling rate in Hz")
+    parser.add_argument("--ecg", type=int, default=0, metavar="CHANNELS", help="add an ECG stream with this many leads")
+    parser.add_argument("--ecg-sfreq", type=float, default=500.0)
+    parser.add_argument("--markers", choices=["none", *MarkerGenerator.PARADIGMS], default="oddball")
+    parser.add_argument("--soa", type=float, default=1.0, help="seconds between markers")
+    parser.add_argument("--erp", action="store_true", help="add evoked responses to oddball markers in the EEG")
+    parser.add_argument("--line-freq", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=float, default=0.02, help="seconds between pushes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="timestamp jitter per chunk, in seconds")
+    parser.add_argument("--dropout", type=float, default=0.0, help="outages per second")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    simulator = StreamSimulator(seed=args.seed, chunk=args.chunk, jitter=args.jitter, dropout=args.dropout)
+    markers = None
+    if args.markers != "none":
+        markers = simulator.add_markers(paradigm=args.markers, soa=args.soa)
+    for i, n_channels in enumerate(args.eeg):
+        simulator.add_eeg(name=f"SimEEG{i + 1}" if len(args.eeg) > 1 else "SimEEG", n_channels=n_channels,
+                          sfreq=args.sfreq, line_freq=args.line_freq, markers=markers,
+                          erp={"target": 10.0, "standard": 3.0} if args.erp else None)
+    if args.ecg:
+        simulator.add_ecg(n_channels=args.ecg, sfreq=args.ecg_sfreq)
+
+    simulator.start()
+    try:
+        if args.duration is not None:
+            time.sleep(args.duration)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        for stream in simulator.streams:
+            if "n_pushed" in stream:
+                logging.info(f"[SIM] {stream['name']}: {stream['n_pushed']} samples pushed, "
+                             f"{stream['n_dropped']} dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+from collections import deque
+import numpy as np
+from data.ring_buffer import SampleRing
+
+
+class EpochAverager:
+    """Marker-locked epochs of one stream, averaged online per condition.
+
+    Samples are written to a lookback ``SampleRing`` holding ``tmax - tmin`` seconds
+    plus ``max_delay`` of slack for late markers. A trigger is queued until the
+    samples up to ``tmax`` after it have arrived. Only that epoch's
+    (n_channels, n_times) slice is then read from the ring, baseline-corrected and
+    folded into the condition's running mean and variance (Welford).
+
+    Statistics for up to ``max_conditions`` conditions live in preallocated float32
+    arrays. Their capacity doubles as new conditions appear, so memory is bounded
+    by the conditions actually seen. Triggers beyond the limit are counted in
+    ``n_ignored``. An epoch is rejected when any channel's peak-to-peak amplitude
+    exceeds ``reject``, or when it overlaps samples that were dropped. Epochs are
+    limited to ``MAX_SPAN`` seconds, so a request cannot size a huge ring.
+    """
+
+    MAX_SPAN = 10.0
+
+    def __init__(self, ch_names, sfreq, tmin=-0.2, tmax=0.8, baseline=(None, 0), reject=None,
+                 conditions=None, max_conditions=256, max_delay=2.0, max_pending=1024):
+        if not sfreq:
+            raise ValueError("epoching needs a stream with a nominal sampling rate")
+        for name, value in (("tmin", tmin), ("tmax", tmax)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                raise ValueError(f"{name} must be a finite number of seconds, got {value!r}")
+        if tmax - tmin > self.MAX_SPAN:
+            raise ValueError(f"epochs are limited to {self.MAX_SPAN:g} s, got tmax - tmin = {tmax - tmin:g} s")
+        if tmax <= tmin:
+            raise ValueError(f"tmax ({tmax}) must be greater than tmin ({tmin})")
+        self.ch_names = ch_names
+        self.sfreq = sfreq
+        self.tmin = tmin
+        self.tmax = tmax
+        self.n_pre = int(round(-tmin * sfreq))
+        self.n_times = int(round((tmax - tmin) * sfreq)) + 1
+        self.times = (np.arange(self.n_times) - self.n_pre) / sfreq
+        self.baseline = None
+        if baseline is not None:
+            lo = tmin if baseline[0] is None else baseline[0]
+            hi = tmax if baseline[1] is None else baseline[1]
+            self.baseline = slice(*np.searchsorted(self.times, [lo, hi + 0.5 / sfreq]))
+        self.reject = reject
+        self.conditions = set(map(str, conditions)) if conditions else None
+        self.max_conditions = max_conditions
+        self.n_ignored = 0
+
+        self.ring = SampleRing(len(ch_names), (tmax - tmin + max_delay) * sfreq)
+        self.pending = deque(maxlen=max_pending)  # (condition, trigger timestamp)
+        self.gaps = deque(maxlen=64)  # (start, stop) ring indices filled in for dropped samples
+        self._next_sample = None
+
+        self.index = {}  # condition -> row in the statistics arrays
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.rejected = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros((0, len(ch_names), self.n_times), dtype=np.float32)
+        self.m2 = np.zeros_like(self.mean)
+        self._delta = np.empty((len(ch_names), self.n_times), dtype=np.float32)
+        self._residual = np.empty_like(self._delta)
+
+    def add_markers(self, triggers, timestamps):
+        for trigger, timestamp in zip(triggers, timestamps):
+            condition = str(trigger)
+            if self.conditions is None or condition in self.conditions:
+                self.pending.append((condition, timestamp))
+
+    def add_samples(self, data, timestamps, first_sample):
+        """Append a chunk; returns the conditions whose averages were updated."""
+        if self._next_sample is not None and first_sample > self._next_sample:
+            # Hold the last value over dropped samples, so epochs spanning them can be rejected
+            n_gap = min(first_sample - self._next_sample, self.ring.capacity)
+            last, last_ts = self.ring.latest(1)
+            start = self.ring.count
+            self.ring.write(np.repeat(last, n_gap, axis=1), np.linspace(last_ts[0], timestamps[0], n_gap + 2)[1:-1])
+            self.gaps.append((start, self.ring.count))
+        self.ring.write(data, timestamps)
+        self._next_sample = first_sample + len(timestamps)
+
+        updated = []
+        latest = timestamps[-1]
+        while self.pending and self.pending[0][1] + self.tmax <= latest:
+            condition, timestamp = self.pending.popleft()
+            if self._add_epoch(condition, timestamp, latest):
+                updated.append(condition)
+        return updated
+
+    def _onset(self, timestamp, latest):
+        """Ring index of the sample nearest to ``timestamp``, searching a small slice only."""
+        guess = self.ring.count - 1 - int((latest - timestamp) * self.sfreq)
+        margin = max(int(0.05 * self.sfreq), 8)
+        lo = max(guess - margin, self.ring.count - len(self.ring))
+        _, ts = self.ring.read(lo, guess + margin)
+        if ts.size == 0:
+            return None
+        pos = int(np.searchsorted(ts, timestamp))
+        if pos == ts.size or (pos > 0 and timestamp - ts[pos - 1] <= ts[pos] - timestamp):
+            pos -= 1
+        return lo + pos
+
+    def _row(self, condition):
+        row = self.index.get(condition)
+        if row is not None:
+            return row
+        if len(self.index) >= self.max_conditions:
+            return None
+        row = len(self.index)
+        if row == len(self.counts):
+            capacity = min(max(2 * row, 8), self.max_conditions)
+            self.counts = np.resize(self.counts, capacity)
+            self.rejected = np.resize(self.rejected, capacity)
+            mean = np.zeros((capacity,) + self.mean.shape[1:], dtype=np.float32)
+            m2 = np.zeros_like(mean)
+            mean[:row], m2[:row] = self.mean, self.m2
+            self.mean, self.m2 = mean, m2
+        self.counts[row] = self.rejected[row] = 0
+        self.mean[row] = self.m2[row] = 0
+        self.index[condition] = row
+        return row
+
+    def _add_epoch(self, condition, timestamp, latest):
+        row = self._row(condition)
+        if row is None:
+            self.n_ignored += 1
+            return False
+        onset = self._onset(timestamp, latest)
+        start = onset - self.n_pre if onset is not None else None
+        if start is None or start < self.ring.count - len(self.ring) or start + self.n_times > self.ring.count:
+            self.rejected[row] += 1  # out of the lookback window
+            return True
+        if any(start < gap_stop and gap_start < start + self.n_times for gap_start, gap_stop in self.gaps):
+            self.rejected[row] += 1
+            return True
+
+        epoch, _ = self.ring.read(start, start + self.n_times)
+        if self.baseline is not None:
+            epoch -= epoch[:, self.baseline].mean(axis=1, keepdims=True)
+        if self.reject is not None and np.any(np.ptp(epoch, axis=1) > self.reject):
+            self.rejected[row] += 1
+            return True
+
+        # Welford update in place: mean += (x - mean) / n; m2 += (x - mean_old) * (x - mean_new)
+        self.counts[row] += 1
+        mean, delta, residual = self.mean[row], self._delta, self._residual
+        np.subtract(epoch, mean, out=delta)
+        np.divide(delta, self.counts[row], out=residual)
+        mean += residual
+        np.subtract(epoch, mean, out=residual)
+        delta *= residual
+        self.m2[row] += delta
+        return True
+
+    def erp(self, condition):
+        row = self.index[condition]
+        n = int(self.counts[row])
+        std = np.sqrt(self.m2[row] / (n - 1)) if n > 1 else np.zeros_like(self.m2[row])
+        return {
+            "type": "erp",
+            "condition": condition,
+            "n_epochs": n,
+            "n_rejected": int(self.rejected[row]),
+            "channels": self.ch_names,
+            "times": self.times.tolist(),
+            "mean": self.mean[row].tolist(),
+            "std": std.tolist(),
+        }
@@ -1,19 +1,69 @@
+import asyncio
+import threading
 import time
-from mne_lsl.stream import StreamLSL as Stream
+import numpy as np
 from pylsl import resolve_byprop
 
 
+class TimestampIndex:
+    """Ring of recent sample timestamps, mapping LSL time to monotonic sample indices."""
+
+    def __init__(self, size):
+        self.timestamps = np.zeros(max(int(size), 1))
+        self.count = 0  # total number of samples appended
+
+    def append(self, timestamps, first_sample):
+        size = self.timestamps.size
+        if self.count and first_sample > self.count:
+            # Dropped samples: fill their slots by interpolating across the gap
+            last = self.timestamps[(self.count - 1) % size]
+            n_gap = min(first_sample - self.count, size)
+            gap = np.linspace(last, timestamps[0], first_sample - self.count + 2)[1:-1][-n_gap:]
+            self.timestamps[(first_sample - n_gap + np.arange(n_gap)) % size] = gap
+        skip = max(len(timestamps) - size, 0)
+        positions = (first_sample + skip + np.arange(len(timestamps) - skip)) % size
+        self.timestamps[positions] = timestamps[skip:]
+        self.count = first_sample + len(timestamps)
+
+    def nearest(self, timestamp, sfreq):
+        """Return the index of the sample closest to ``timestamp``.
+
+        Times after the newest sample are extrapolated with the nominal rate, since
+        markers usually arrive before the data they refer to.
+        """
+        if self.count == 0:
+            return None
+        size = self.timestamps.size
+        n = min(self.count, size)
+        start = self.count - n
+        ordered = np.roll(self.timestamps, -(start % size))[:n]
+        if timestamp >= ordered[-1]:
+            return self.count - 1 + (int(round((timestamp - ordered[-1]) * sfreq)) if sfreq else 0)
+        pos = int(np.searchsorted(ordered, timestamp))
+        if pos > 0 and (pos == n or timestamp - ordered[pos - 1] <= ordered[pos] - timestamp):
+            pos -= 1
+        return start + pos
+
+
 class LSLStreamConnector:
     def __init__(self, bufsize, ch_names=None, sfreq=None):
         self.bufsize = bufsize
         self.ch_names = ch_names
         self.sfreq = sfreq
+        self.ch_units = {}  # voltage channels -> power of ten of their unit (-6 for microvolts)
         self.stream = None
+        self.last_timestamp = None
+        self.sample_count = 0
+        self._resumed = False
+        self.timestamp_index = None
+        self.buffer_fill = 0.0  # fraction of the ring buffer holding unread samples
         print(f"[INIT] LSLStreamConnector initialized with bufsize={self.bufsize}")
 
     def connect(self, stream_name):
         try:
             print(f"[CONNECT] Connecting to LSL stream by name: {stream_name}...")
+            from mne_lsl.stream import StreamLSL as Stream
+
             self.stream = Stream(bufsize=self.bufsize, name=stream_name)
             self.stream.connect()
             print(f"[CONNECT] Successfully connected to stream: {stream_name}")
@@ -28,21 +78,7 @@ class LSLStreamConnector:
         while True:
             try:
                 print(f"[CONNECT] Attempt {attempt + 1}: Resolving LSL stream with source_id={source_id}...")
-                streams = resolve_byprop("source_id", source_id, timeout=3)
-                if not streams:
-                    raise RuntimeError(f"No stream found with source_id={source_id}")
-
-                resolved_stream = streams[0]
-                stream_name = resolved_stream.name()
-                stream_type = resolved_stream.type()
-
-                print(f"[CONNECT] Found stream with name='{stream_name}', type='{stream_type}', source_id='{source_id}'")
-
-                self.stream = Stream(bufsize=self.bufsize, name=stream_name, stype=stream_type)
-                self.stream.connect()
-
-                print(f"[CONNECT] Successfully connected to stream with source_id: {source_id}")
-                self._update_stream_info()
+                self._connect_once(source_id)
                 return True
 
             except Exception as e:
@@ -50,6 +86,96 @@ class LSLStreamConnector:
                 time.sleep(wait_sec)
                 attempt += 1
 
+    def _connect_once(self, source_id, timeout=3):
+        """Resolve and connect to ``source_id`` once; raises on failure (blocking)."""
+        streams = resolve_byprop("source_id", source_id, timeout=timeout)
+        if not streams:
+            raise RuntimeError(f"No stream found with source_id={source_id}")
+
+        resolved_stream = streams[0]
+        stream_name = resolved_stream.name()
+        stream_type = resolved_stream.type()
+
+        print(f"[CONNECT] Found stream with name='{stream_name}', type='{stream_type}', source_id='{source_id}'")
+
+        # mne_lsl (and mne with it) takes over a second to import; only load it once a stream is used
+        from mne_lsl.stream import StreamLSL as Stream
+
+        stream = Stream(bufsize=self.bufsize, name=stream_name, stype=stream_type, source_id=source_id)
+        # Timestamps are converted to the local clock, so they line up with markers and
+        # other streams coming from different machines.
+        stream.connect(timeout=timeout, processing_flags=["clocksync"])
+        self.stream = stream
+        self._resumed = self.last_timestamp is not None
+
+        print(f"[CONNECT] Successfully connected to stream with source_id: {source_id}")
+        self._update_stream_info()
+
+    async def connect_async(self, source_id, deadline=30.0, backoff=0.5, max_backoff=8.0,
+                            resolve_timeout=3, progress=None):
+        """Connect without blocking the event loop.
+
+        Resolution and connection run in the default thread pool. Failed attempts are
+        retried with exponential backoff (``backoff`` doubling up to ``max_backoff``)
+        until ``deadline`` seconds have passed; ``deadline=None`` retries until the
+        task is cancelled. ``progress``, if given, is called with a status dict on every
+        state change. Returns ``True`` once connected, ``False`` when the deadline
+        expires.
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline if deadline is not None else None
+        delay = backoff
+        attempt = 0
+
+        def report(state, **extra):
+            if progress is not None:
+                progress({"type": "connect_status", "source_id": source_id,
+                          "state": state, "attempt": attempt, **extra})
+
+        # The worker thread cannot be interrupted. If the attempt is abandoned, whichever
+        # of the thread and the cancelled task comes second drops the stream.
+        lock = threading.Lock()
+        abandoned = False
+
+        def connect_once():
+            self._connect_once(source_id, resolve_timeout)
+            with lock:
+                if abandoned:
+                    self.disconnect()
+
+        while True:
+            attempt += 1
+            report("resolving")
+            try:
+                await loop.run_in_executor(None, connect_once)
+                report("connected")
+                return True
+            except asyncio.CancelledError:
+                with lock:
+                    abandoned = True
+                    self.disconnect()
+                raise
+            except Exception as e:
+                print(f"[ERROR] Connection attempt {attempt} failed: {e}")
+
+            remaining = end - loop.time() if end is not None else delay
+            if remaining <= 0:
+                report("failed")
+                return False
+            wait = min(delay, remaining)
+            report("retrying", retry_in=wait)
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, max_backoff)
+
+    @property
+    def connected(self):
+        return self.stream is not None and self.stream.connected
+
+    def disconnect(self):
+        if self.connected:
+            self.stream.disconnect()
+            print("[CONNECT] Disconnected from LSL stream.")
+
     def _update_stream_info(self):
         if self.sfreq is None:
             self.sfreq = self.stream.info["sfreq"]
@@ -57,6 +183,11 @@ class LSLStreamConnector:
         if self.ch_names is None:
             self.ch_names = self.stream.info["ch_names"]
             print(f"[INFO] Retrieved channel names: {self.ch_names}")
+        if not self.ch_units:
+            from mne.io.constants import FIFF
+
+            self.ch_units = {ch["ch_name"]: int(ch["unit_mul"]) for ch in self.stream.info["chs"]
+                             if ch["unit"] == FIFF.FIFF_UNIT_V}
 
     def get_data(self, winsize=None, picks=None):
         if not self.stream:
@@ -75,7 +206,6 @@ class LSLStreamConnector:
             if winsize is None:
                 winsize = self.stream.n_new_samples / self.sfreq
 
-            print(f"[GET DATA] Retrieving data: winsize={winsize}, picks={picks}")
             data, ts = self.stream.get_data(winsize, picks=picks)
             return data, ts
 
@@ -83,6 +213,85 @@ class LSLStreamConnector:
             print(f"[ERROR] Data retrieval failed: {e}")
             return None, None
 
+    def get_new_data(self, picks=None):
+        """Return only the samples acquired since the previous call.
+
+        A timestamp cursor is kept between calls, so samples that arrive while the
+        buffer is being read are picked up on the next call instead of being lost.
+        Returns ``(data, timestamps, first_sample, n_dropped)`` where ``first_sample``
+        is the monotonic index of the first returned sample since the first connection
+        (the cursor survives reconnects) and ``n_dropped`` counts samples that were
+        overwritten in the buffer or missed while disconnected.
+        """
+        if not self.connected:
+            return None, None, self.sample_count, 0
+
+        n_new = self.stream.n_new_samples
+        if not n_new:
+            return None, None, self.sample_count, 0
+
+        buffer_samples = int(self.bufsize * self.sfreq) if self.sfreq else None
+        self.buffer_fill = min(n_new / buffer_samples, 1.0) if buffer_samples else 0.0
+        n_request = n_new + 1
+        while True:
+            winsize = n_request / self.sfreq if self.sfreq else n_request
+            data, ts = self.stream.get_data(winsize, picks=picks)
+            covered = self.last_timestamp is None or ts.size == 0 or ts[0] <= self.last_timestamp
+            if covered or buffer_samples is None or n_request >= buffer_samples:
+                break
+            n_request *= 2
+
+        n_dropped = 0
+        if self.last_timestamp is None:
+            start = max(ts.size - n_new, 0)
+        else:
+            start = int(np.searchsorted(ts, self.last_timestamp, side="right"))
+            # If the cursor fell out of the buffer or the stream was reconnected, samples
+            # were lost; estimate how many from the timestamp gap. Small gaps otherwise
+            # are inter-chunk timestamp jitter and are not counted.
+            overrun = start == 0 and ts.size and ts[0] > self.last_timestamp
+            if (overrun or self._resumed) and start < ts.size and self.sfreq:
+                gap = (ts[start] - self.last_timestamp) * self.sfreq
+                n_dropped = max(int(round(gap)) - 1, 0)
+
+        if start >= ts.size:
+            return None, None, self.sample_count, 0
+
+        self._resumed = False
+        first_sample = self.sample_count + n_dropped
+        data, ts = data[:, start:], ts[start:]
+        self.last_timestamp = ts[-1]
+        self.sample_count = first_sample + ts.size
+        if self.timestamp_index is None:
+            self.timestamp_index = TimestampIndex(buffer_samples or self.bufsize)
+        self.timestamp_index.append(ts, first_sample)
+        return data, ts, first_sample, n_dropped
+
+    def get_history(self, seconds, picks=None):
+        """Return the last ``seconds`` of samples already returned by ``get_new_data``.
+
+        At most the buffer length, and the samples acquired so far, are available.
+        Returns ``(data, timestamps, first_sample)`` with ``first_sample`` in the
+        numbering of ``get_new_data``.
+        """
+        if not self.connected or self.last_timestamp is None or not self.sfreq:
+            return None, None, self.sample_count
+        n_wanted = min(int(min(seconds, self.bufsize) * self.sfreq), self.sample_count)
+        # The buffer also holds the samples not pulled yet; they are cut off below
+        winsize = min((n_wanted + self.stream.n_new_samples) / self.sfreq, self.bufsize)
+        data, ts = self.stream.get_data(winsize, picks=picks)
+        stop = int(np.searchsorted(ts, self.last_timestamp, side="right"))
+        # Slots not filled since the (re)connection have zero timestamps and come first
+        filled = int(np.searchsorted(ts[:stop], 0.0, side="right"))
+        start = max(stop - n_wanted, filled)
+        return data[:, start:stop], ts[start:stop], self.sample_count - (stop - start)
+
+    def sample_index_at(self, timestamp):
+        """Monotonic index of the sample nearest to ``timestamp`` (see ``get_new_data``)."""
+        if self.timestamp_index is None:
+            return None
+        return self.timestamp_index.nearest(timestamp, self.sfreq)
+
     def stream_real_time(self):
         if not self.stream:
             print("[ERROR] No active stream. Use connect_by_source_id() or connect().")
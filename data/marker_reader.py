@@ -0,0 +1,90 @@
+import logging
+import threading
+from pylsl import StreamInlet, resolve_byprop, proc_clocksync
+
+
+class MarkerReader:
+    """Reads one LSL marker stream in a dedicated thread.
+
+    The thread blocks in ``pull_sample`` until a trigger arrives, then drains any burst
+    with a non-blocking ``pull_chunk``, so latency is bounded by LSL transport rather
+    than a polling interval and the thread is idle while no markers are sent.
+    Timestamps are clock-corrected to the local LSL clock. Each batch is handed to
+    the event loop as ``on_batch(triggers, timestamps)``.
+    """
+
+    def __init__(self, source_id, name, loop, on_batch, resolve_timeout=5, pull_timeout=0.5):
+        self.source_id = source_id
+        self.name = name
+        self.loop = loop
+        self.on_batch = on_batch
+        self.resolve_timeout = resolve_timeout
+        self.pull_timeout = pull_timeout
+        self.subscribers = set()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"markers-{source_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _resolve(self):
+        logging.info(f"Looking for Marker stream '{self.name}' (source_id={self.source_id})...")
+        while not self._stop_event.is_set():
+            streams = resolve_byprop("source_id", self.source_id, timeout=self.resolve_timeout)
+            if streams:
+                return StreamInlet(streams[0], processing_flags=proc_clocksync)
+            logging.warning(f"Marker stream '{self.name}' not found, retrying...")
+        return None
+
+    def _run(self):
+        inlet = self._resolve()
+        if inlet is None:
+            return
+        logging.info(f"Connected to Marker stream: {self.name}")
+
+        try:
+            while not self._stop_event.is_set():
+                sample, timestamp = inlet.pull_sample(timeout=self.pull_timeout)
+                if sample is None:
+                    continue
+                samples, timestamps = inlet.pull_chunk(timeout=0.0)
+                triggers = [sample[0]] + [s[0] for s in samples]
+                timestamps = [timestamp] + list(timestamps)
+                self.loop.call_soon_threadsafe(self.on_batch, self, triggers, timestamps)
+        except Exception as e:
+            logging.error(f"Marker stream '{self.name}' failed: {e}")
+        finally:
+            inlet.close_stream()
+            logging.info(f"Marker stream '{self.name}' stopped.")
+
+
+class MarkerHub:
+    """One ``MarkerReader`` per marker ``source_id``, shared by all subscribed clients."""
+
+    def __init__(self, on_batch, reader_factory=MarkerReader):
+        self.on_batch = on_batch
+        # reader_factory(source_id, name, loop, on_batch) builds a reader (see data.replay)
+        self.reader_factory = reader_factory
+        self.readers = {}
+
+    def subscribe(self, marker_stream_info, session, loop):
+        source_id = marker_stream_info["source_id"]
+        reader = self.readers.get(source_id)
+        if reader is None:
+            reader = self.reader_factory(source_id, marker_stream_info.get("name", source_id), loop, self.on_batch)
+            self.readers[source_id] = reader
+            reader.start()
+        reader.subscribers.add(session)
+        return reader
+
+    def unsubscribe(self, source_id, session):
+        reader = self.readers.get(source_id)
+        if reader is None:
+            return
+        reader.subscribers.discard(session)
+        if not reader.subscribers:
+            reader.stop()
+            del self.readers[source_id]
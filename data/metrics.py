@@ -0,0 +1,84 @@
+import time
+
+
+class Metrics:
+    """In-process counters for the streaming hot path.
+
+    Timings are kept as running count/sum/max per (name, labels), so recording one
+    costs a dict lookup and three additions; there are no per-observation
+    allocations or locks (everything is updated from the event loop thread).
+    ``render`` formats the current values in the Prometheus text exposition format.
+    """
+
+    def __init__(self, prefix="eeg"):
+        self.prefix = prefix
+        self.timings = {}  # (name, labels) -> [count, sum, max]
+        self.gauges = {}   # (name, labels) -> value
+        self.started = time.time()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        timing = self.timings.get(key)
+        if timing is None:
+            self.timings[key] = [1, seconds, seconds]
+            return
+        timing[0] += 1
+        timing[1] += seconds
+        if seconds > timing[2]:
+            timing[2] = seconds
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def forget(self, **labels):
+        """Drop every series carrying ``labels`` (e.g. a source that was closed)."""
+        items = set(labels.items())
+        for series in (self.timings, self.gauges):
+            for key in [key for key in series if items <= set(key[1])]:
+                del series[key]
+
+    def snapshot(self):
+        """JSON-serializable view of the current values, for the ``stats`` message."""
+        timings = [
+            dict(labels, name=name, count=count, mean_ms=1000 * total / count, max_ms=1000 * peak)
+            for (name, labels), (count, total, peak) in self.timings.items()
+            for labels in [dict(labels)]
+        ]
+        gauges = [dict(labels, name=name, value=value) for (name, labels), value in self.gauges.items()
+                  for labels in [dict(labels)]]
+        return {"uptime": time.time() - self.started, "timings": timings, "gauges": gauges}
+
+    def render(self, extra_gauges=None):
+        """Prometheus text format; ``extra_gauges`` adds ``{name: value}`` unlabelled gauges."""
+        lines = []
+
+        def series(name, labels):
+            if not labels:
+                return f"{self.prefix}_{name}"
+            text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            return f"{self.prefix}_{name}{{{text}}}"
+
+        for name in sorted({name for name, _ in self.timings}):
+            timings = [(labels, stats) for (key_name, labels), stats in self.timings.items() if key_name == name]
+            lines.append(f"# TYPE {self.prefix}_{name}_seconds summary")
+            for labels, (count, total, _) in timings:
+                lines.append(f"{series(name + '_seconds_count', labels)} {count}")
+                lines.append(f"{series(name + '_seconds_sum', labels)} {total:.9f}")
+            # A summary only allows _count, _sum and quantiles; the peak is a family of its own
+            lines.append(f"# TYPE {self.prefix}_{name}_seconds_max gauge")
+            for labels, (_, _, peak) in timings:
+                lines.append(f"{series(name + '_seconds_max', labels)} {peak:.9f}")
+
+        gauges = dict(self.gauges)
+        for name, value in (extra_gauges or {}).items():
+            gauges[(name, ())] = value
+        for name in sorted({name for name, _ in gauges}):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            for (key_name, labels), value in gauges.items():
+                if key_name == name:
+                    lines.append(f"{series(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,272 @@
+import json
+import struct
+import zlib
+import numpy as np
+from data.decimation import minmax_decimate, samples_per_bin
+
+# Binary EEG frame layout (little-endian), followed by the raw C-contiguous
+# (n_channels, n_samples) sample array:
+#   magic(4s) version(B) dtype(B) stream_id(H) seq(I) n_channels(I) n_samples(I)
+#   first_sample(Q) t0(d) dt(d)
+# ``stream_id`` is the server's number for the source (or combined stream) the frame
+# belongs to, also sent with the ``channels`` message, so frames of a previously
+# selected stream can be told apart.
+FRAME_MAGIC = b"EEGF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<4sBBHIIIQdd")
+
+DTYPE_FLOAT32 = 1
+DTYPE_DELTA = 2
+DTYPES = {DTYPE_FLOAT32: np.dtype("<f4")}
+
+# Quantized delta frames (dtype DTYPE_DELTA) replace the float32 array with:
+#   bits(B) width(B) flags(H) n_corrections(I) payload_size(I)
+#   correction_index u32[n_corrections]  correction_offset f32[n_corrections]
+#   zlib(scale f32[n_channels] | first i32[n_channels] |
+#        ``width`` byte planes of the zigzag-coded sample deltas, u8[width, n_channels * (n_samples - 1)])
+# Samples are reconstructed as ``(first + cumsum(deltas)) * scale`` per channel, and
+# timestamps as ``t0 + i * dt``, plus the latest correction offset at or before ``i``.
+# Quantized values lie in +-(2**(bits - 1) - 1); ``-2**(bits - 1)`` marks a missing
+# (non-finite) sample, decoded as NaN.
+# With the DELTA_PAIRS flag (min/max decimated frames, see ``data.decimation``) samples
+# come in (min, max) pairs sharing one timestamp: ``i``, ``dt`` and the corrections
+# count pairs, and both samples of pair ``i`` get its timestamp.
+DELTA_HEADER = struct.Struct("<BBHII")
+DELTA_PAIRS = 1
+DELTA_FORMATS = {"delta16": 16, "delta24": 24}
+FRAME_FORMATS = ("json", "binary", *DELTA_FORMATS)
+
+# Default quantization step of voltage channels, in microvolts per LSB
+# (int16: +-16 mV at 0.5 uV, below typical amplifier noise; int24: +-84 mV at 0.01 uV)
+DELTA_RESOLUTION = {16: 0.5, 24: 0.01}
+# Timestamps are reproduced to within this fraction of the frame's sample spacing
+TIMESTAMP_TOLERANCE = 0.1
+
+
+def _check_first_sample(first_sample):
+    # The header field is unsigned; a negative index would be a bug upstream, not a frame
+    if first_sample < 0:
+        raise ValueError(f"first_sample must not be negative, got {first_sample}")
+
+
+def encode_binary_frame(data, timestamps, seq, stream_id=0, first_sample=0):
+    """Pack an EEG chunk into a single binary frame.
+
+    The sample array is cast straight into the frame buffer, so the only copy made
+    is the float64 -> float32 conversion. Timestamps are sent as ``t0`` and the mean
+    sample spacing ``dt``.
+    """
+    n_channels, n_samples = data.shape
+    _check_first_sample(first_sample)
+    t0 = float(timestamps[0]) if n_samples else 0.0
+    dt = float(timestamps[-1] - timestamps[0]) / (n_samples - 1) if n_samples > 1 else 0.0
+
+    frame = bytearray(FRAME_HEADER.size + data.size * 4)
+    FRAME_HEADER.pack_into(
+        frame, 0, FRAME_MAGIC, FRAME_VERSION, DTYPE_FLOAT32, stream_id, seq,
+        n_channels, n_samples, first_sample, t0, dt
+    )
+    payload = np.frombuffer(frame, dtype=DTYPES[DTYPE_FLOAT32], offset=FRAME_HEADER.size)
+    payload.reshape(n_channels, n_samples)[...] = data
+    return frame
+
+
+def quantization_steps(channels, units, bits, resolution=None):
+    """Per-channel quantization step, in the stream's own units.
+
+    ``units`` maps voltage channels to the power of ten of their unit (-6 for
+    microvolts); those get ``resolution`` microvolts per LSB (default
+    ``DELTA_RESOLUTION[bits]``). Other channels get NaN, i.e. a step scaled to each
+    frame's peak (see ``encode_delta_frame``).
+    """
+    resolution = DELTA_RESOLUTION[bits] if resolution is None else resolution
+    units = units or {}
+    return np.array([resolution * 10.0 ** (-6 - units[ch]) if ch in units else np.nan for ch in channels])
+
+
+def _timestamp_corrections(timestamps, t0, dt, tolerance):
+    """Sparse step corrections keeping ``t0 + i * dt + offset`` within ``tolerance``.
+
+    Greedy: each correction starts where the residual first leaves the band around
+    the current offset, so a frame without gaps or clock jumps needs none.
+    """
+    residual = timestamps - (t0 + dt * np.arange(len(timestamps)))
+    indices, offsets = [], []
+    start, offset = 0, 0.0
+    while True:
+        outside = np.flatnonzero(np.abs(residual[start:] - offset) > tolerance)
+        if outside.size == 0:
+            break
+        start += int(outside[0])
+        offset = float(residual[start])
+        indices.append(start)
+        offsets.append(offset)
+    return np.array(indices, dtype="<u4"), np.array(offsets, dtype="<f4")
+
+
+def encode_delta_frame(data, timestamps, seq, sfreq, bits=16, steps=None, stream_id=0, first_sample=0,
+                       level=1, pairs=False):
+    """Pack an EEG chunk into a quantized, delta-coded and zlib-compressed frame.
+
+    Each channel is quantized to ``bits``-bit integers with its step from ``steps``
+    (see ``quantization_steps``). A channel whose frame peak would not fit, or whose
+    step is NaN, uses ``peak / (2**(bits - 1) - 1)`` instead, so values never clip
+    and the reconstruction error of every sample is at most half the step sent in
+    the frame. Deltas along time are zigzag-coded, split into byte planes (the high
+    planes of small deltas are all zeros) and compressed with zlib at ``level``.
+    NaN and infinite samples are left out of the peak and sent as the missing-sample
+    code, so they come back as NaN without affecting the rest of the channel.
+    Timestamps are sent as ``t0``, the nominal spacing ``1 / sfreq`` and sparse
+    corrections. With ``pairs``, ``data`` holds min/max pairs (an even number of
+    samples) and only each pair's first timestamp is sent, ``sfreq`` being the rate
+    of pairs; the alternating min/max times would otherwise need a correction each.
+    """
+    n_channels, n_samples = data.shape
+    _check_first_sample(first_sample)
+    qmax = 2 ** (bits - 1) - 1
+    finite = np.isfinite(data)
+    if not finite.all():
+        data = np.where(finite, data, 0.0)
+    peak = np.abs(data).max(axis=1) if n_samples else np.zeros(n_channels)
+    steps = np.full(n_channels, np.nan) if steps is None else steps
+    scale = np.fmax(steps, peak / qmax).astype(np.float32)  # quantize with the scale that is sent
+    scale[~(scale > 0)] = 1.0  # silent channels
+    quantized = np.rint(data / scale[:, None].astype(np.float64)).astype(np.int32)
+    # The float32 scale may round below peak / qmax; keep the missing-sample code free
+    np.clip(quantized, -qmax, qmax, out=quantized)
+    quantized[~finite] = -qmax - 1
+
+    deltas = np.diff(quantized, axis=1)
+    zigzag = ((deltas << 1) ^ (deltas >> 31)).astype("<u4")
+    largest = int(zigzag.max()) if zigzag.size else 0
+    width = max((largest.bit_length() + 7) // 8, 1)
+    planes = zigzag.reshape(-1).view(np.uint8).reshape(-1, 4)[:, :width].T
+    first = quantized[:, 0] if n_samples else np.zeros(n_channels, dtype=np.int32)
+    payload = zlib.compress(
+        scale.astype("<f4").tobytes() + first.astype("<i4").tobytes() + np.ascontiguousarray(planes).tobytes(), level
+    )
+
+    times = np.asarray(timestamps, dtype=np.float64)
+    if pairs:
+        times = times[0::2]
+    n_times = times.size
+    t0 = float(times[0]) if n_times else 0.0
+    if sfreq:
+        dt = 1.0 / sfreq
+    else:
+        dt = float(times[-1] - t0) / (n_times - 1) if n_times > 1 else 0.0
+    indices, offsets = _timestamp_corrections(times, t0, dt, TIMESTAMP_TOLERANCE * dt if dt else 0.0)
+
+    parts = [
+        FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, DTYPE_DELTA, stream_id, seq,
+                          n_channels, n_samples, first_sample, t0, dt),
+        DELTA_HEADER.pack(bits, width, DELTA_PAIRS if pairs else 0, len(indices), len(payload)),
+        indices.tobytes(), offsets.tobytes(), payload,
+    ]
+    return bytearray(b"".join(parts))
+
+
+def encode_frame(data, timestamps, seq, channels, sfreq, first_sample, n_dropped=0,
+                 delivery="window", frame_format="json", view=None, resolution=None, units=None,
+                 stream_id=0):
+    """Serialize samples as one ``eeg`` message for the given client settings.
+
+    ``first_sample`` is the index of the first sample in ``data``. With a ``view``,
+    traces are first reduced to the min/max per pixel (see ``data.decimation``).
+    The ``delta16``/``delta24`` formats quantize voltage channels (``units``, see
+    ``quantization_steps``) to ``resolution`` microvolts. ``stream_id`` identifies the
+    stream in the frame (see the header layout). Returns ``str`` for JSON
+    and ``bytearray`` for binary frames.
+    """
+    n_per_bin = samples_per_bin(view, sfreq)
+    if n_per_bin > 2:
+        data, timestamps = minmax_decimate(data, timestamps, n_per_bin, first_sample)
+
+    frame_first_sample = first_sample if delivery == "incremental" else 0
+    if frame_format == "binary":
+        return encode_binary_frame(data, timestamps, seq, stream_id, first_sample=frame_first_sample)
+    if frame_format in DELTA_FORMATS:
+        bits = DELTA_FORMATS[frame_format]
+        steps = quantization_steps(channels, units, bits, resolution)
+        rate = sfreq / n_per_bin if n_per_bin > 2 else sfreq  # one (min, max) pair per bin
+        return encode_delta_frame(data, timestamps, seq, rate, bits, steps, stream_id,
+                                  first_sample=frame_first_sample, pairs=n_per_bin > 2)
+
+    frame = {
+        "type": "eeg",
+        "stream_id": stream_id,
+        "seq": seq,
+        "timestamps": timestamps.tolist(),
+        "data": data.tolist(),
+        "selected_channels": channels
+    }
+    if delivery == "incremental":
+        frame["first_sample"] = first_sample
+        frame["n_dropped"] = n_dropped
+    if n_per_bin > 2:
+        frame["decimation"] = n_per_bin
+    return json.dumps(frame)
+
+
+def decode_binary_frame(frame):
+    """Unpack a binary EEG frame into a dict mirroring the JSON ``eeg`` message."""
+    (magic, version, dtype, stream_id, seq, n_channels, n_samples,
+     first_sample, t0, dt) = FRAME_HEADER.unpack_from(frame, 0)
+    if magic != FRAME_MAGIC:
+        raise ValueError(f"Not an EEG frame (magic={magic!r})")
+    if dtype == DTYPE_DELTA:
+        data, timestamps = _decode_delta_payload(frame, n_channels, n_samples, t0, dt)
+    elif dtype in DTYPES:
+        data = np.frombuffer(
+            frame, dtype=DTYPES[dtype], count=n_channels * n_samples, offset=FRAME_HEADER.size
+        ).reshape(n_channels, n_samples)
+        timestamps = t0 + dt * np.arange(n_samples)
+    else:
+        raise ValueError(f"Unsupported frame dtype code {dtype}")
+
+    return {
+        "type": "eeg",
+        "version": version,
+        "stream_id": stream_id,
+        "seq": seq,
+        "first_sample": first_sample,
+        "timestamps": timestamps,
+        "data": data,
+    }
+
+
+def _decode_delta_payload(frame, n_channels, n_samples, t0, dt):
+    offset = FRAME_HEADER.size
+    bits, width, flags, n_corrections, payload_size = DELTA_HEADER.unpack_from(frame, offset)
+    offset += DELTA_HEADER.size
+    indices = np.frombuffer(frame, dtype="<u4", count=n_corrections, offset=offset)
+    offsets = np.frombuffer(frame, dtype="<f4", count=n_corrections, offset=offset + 4 * n_corrections)
+    offset += 8 * n_corrections
+
+    payload = zlib.decompress(frame[offset:offset + payload_size])
+    scale = np.frombuffer(payload, dtype="<f4", count=n_channels)
+    first = np.frombuffer(payload, dtype="<i4", count=n_channels, offset=4 * n_channels)
+    planes = np.frombuffer(payload, dtype=np.uint8, offset=8 * n_channels)
+    n_deltas = n_channels * max(n_samples - 1, 0)
+    zigzag = np.zeros((n_deltas, 4), dtype=np.uint8)
+    zigzag[:, :width] = planes.reshape(width, n_deltas).T
+    zigzag = zigzag.view("<u4").reshape(n_channels, -1)
+    deltas = (zigzag >> 1).astype(np.int32) ^ -(zigzag & 1).astype(np.int32)
+
+    quantized = np.empty((n_channels, n_samples), dtype=np.int32)
+    if n_samples:
+        quantized[:, 0] = first
+        np.cumsum(deltas, axis=1, out=quantized[:, 1:])
+        quantized[:, 1:] += first[:, None]
+    data = quantized * scale[:, None]  # float64: float32 cannot hold every 24-bit value to half a step
+    data[quantized == -2 ** (bits - 1)] = np.nan
+
+    n_times = n_samples // 2 if flags & DELTA_PAIRS else n_samples
+    timestamps = t0 + dt * np.arange(n_times)
+    if n_corrections:
+        steps = np.zeros(n_times)
+        steps[indices] = np.diff(offsets.astype(np.float64), prepend=0.0)
+        timestamps += np.cumsum(steps)
+    if flags & DELTA_PAIRS:
+        timestamps = np.repeat(timestamps, 2)
+    return data, timestamps
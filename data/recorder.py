@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import numpy as np
+
+
+class SegmentedStreamWriter:
+    """Appends one stream to size-rotated, memory-mapped segment files.
+
+    Each segment is a preallocated ``<key>_<n>.samples`` float32 array of shape
+    (n_samples, n_channels) plus a ``<key>_<n>.timestamps`` float64 index. Segments
+    are truncated to the samples actually written when they are closed, and
+    ``<key>.json`` describes the stream and lists its segments.
+    """
+
+    def __init__(self, directory, key, meta, max_segment_bytes):
+        self.directory = directory
+        self.key = key
+        self.meta = dict(meta, dtype="float32", segments=[])
+        n_channels = len(meta["ch_names"])
+        self.segment_samples = max(max_segment_bytes // (n_channels * 4 + 8), 1)
+        self.n_channels = n_channels
+        self._samples = None
+        self._timestamps = None
+        self._written = 0
+
+    def _open_segment(self):
+        index = len(self.meta["segments"])
+        base = os.path.join(self.directory, f"{self.key}_{index:04d}")
+        self._samples = np.memmap(base + ".samples", dtype=np.float32, mode="w+",
+                                  shape=(self.segment_samples, self.n_channels))
+        self._timestamps = np.memmap(base + ".timestamps", dtype=np.float64, mode="w+",
+                                     shape=(self.segment_samples,))
+        self._written = 0
+        self.meta["segments"].append({"file": os.path.basename(base), "n_samples": 0})
+        self._write_meta()
+
+    def _close_segment(self):
+        if self._samples is None:
+            return
+        segment = self.meta["segments"][-1]
+        segment["n_samples"] = self._written
+        if self._written:
+            segment["t_first"] = float(self._timestamps[0])
+            segment["t_last"] = float(self._timestamps[self._written - 1])
+        self._samples.flush()
+        self._timestamps.flush()
+        samples_path, timestamps_path = self._samples.filename, self._timestamps.filename
+        self._samples = self._timestamps = None
+        os.truncate(samples_path, self._written * self.n_channels * 4)
+        os.truncate(timestamps_path, self._written * 8)
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(os.path.join(self.directory, f"{self.key}.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    def append(self, data, timestamps):
+        offset = 0
+        n = len(timestamps)
+        while offset < n:
+            if self._samples is None or self._written == self.segment_samples:
+                self._close_segment()
+                self._open_segment()
+            count = min(n - offset, self.segment_samples - self._written)
+            self._samples[self._written:self._written + count] = data[:, offset:offset + count].T
+            self._timestamps[self._written:self._written + count] = timestamps[offset:offset + count]
+            self._written += count
+            offset += count
+
+    def close(self):
+        self._close_segment()
+
+
+class Recorder:
+    """Writes acquired chunks and markers to disk from a background thread.
+
+    Producers only enqueue onto a bounded queue and never wait on disk I/O; if the
+    writer falls behind and the queue is full, the chunk is dropped and counted in
+    ``n_dropped``. ``stop`` drains the queue and flushes and closes every file.
+    """
+
+    def __init__(self, directory, max_segment_bytes=256 * 1024 * 1024, queue_size=1024):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.n_dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._streams = set()
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+
+    def start(self):
+        """Create the directory and start writing; raises ``FileExistsError`` if it holds files.
+
+        Reusing a directory would overwrite the earlier recording's segments and mix
+        its markers into the new one.
+        """
+        if os.path.isdir(self.directory) and os.listdir(self.directory):
+            raise FileExistsError(f"Recording directory {self.directory} already exists and is not empty")
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+        logging.info(f"[RECORDER] Recording to {self.directory}")
+
+    def stop(self):
+        """Flush and close all files; blocks until the writer thread has finished."""
+        self._queue.put(None)
+        self._thread.join()
+        logging.info(f"[RECORDER] Recording stopped ({self.n_dropped} chunk(s) dropped)")
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.n_dropped += 1
+            logging.warning("[RECORDER] Write queue full, dropping chunk")
+            return False
+
+    def write(self, key, meta, data, timestamps):
+        if key not in self._streams:
+            if not self._put(("open", key, meta)):
+                return False
+            self._streams.add(key)
+        return self._put(("data", key, data, timestamps))
+
+    def write_markers(self, source_id, triggers, timestamps):
+        return self._put(("markers", source_id, triggers, timestamps))
+
+    def _run(self):
+        writers = {}
+        markers = open(os.path.join(self.directory, "markers.jsonl"), "a")
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind = item[0]
+                try:
+                    if kind == "open":
+                        writers[item[1]] = SegmentedStreamWriter(self.directory, item[1], item[2],
+                                                                 self.max_segment_bytes)
+                    elif kind == "data":
+                        writers[item[1]].append(item[2], item[3])
+                    elif kind == "markers":
+                        for trigger, timestamp in zip(item[2], item[3]):
+                            markers.write(json.dumps({"source_id": item[1], "trigger": trigger,
+                                                      "timestamp": timestamp}) + "\n")
+                        markers.flush()
+                except Exception as e:
+                    logging.error(f"[RECORDER] Failed to write {kind}: {e}")
+        finally:
+            for writer in writers.values():
+                writer.close()
+            markers.close()
+
+
+class RecordingSession:
+    """Hub subscriber that feeds a source's chunks and markers into a ``Recorder``.
+
+    It subscribes to ``AcquisitionHub`` and ``MarkerHub`` like a client session, so the
+    recording shares the viewers' LSL inlets and keeps them alive while it runs.
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.source_ids = []
+        self.marker_source_ids = []
+
+    def push(self, chunk):
+        source = chunk.source
+        meta = {"source_id": source.source_id, "ch_names": source.ch_names, "sfreq": source.sfreq,
+                "units": source.units}
+        key = re.sub(r"[^\w.-]", "_", source.source_id)  # source_id is used as a file name
+        self.recorder.write(key, meta, chunk.data, chunk.timestamps)
+
+    def push_markers(self, reader, triggers, timestamps):
+        self.recorder.write_markers(reader.source_id, triggers, timestamps)
+
+    def notify(self, message):
+        logging.info(f"[RECORDER] {message}")
@@ -0,0 +1,393 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+import numpy as np
+from data.lsl_stream_connector import TimestampIndex
+
+
+class RecordedStream:
+    """One data stream of a recording (see ``data.recorder``), read through memory maps.
+
+    Segments are mapped read-only on first use, so only the pages actually read are
+    loaded, however long the recording. A timestamp is located by bisecting the
+    segments' first timestamps and then binary-searching that segment's timestamp file.
+    """
+
+    def __init__(self, directory, key):
+        with open(os.path.join(directory, f"{key}.json")) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.source_id = meta["source_id"]
+        self.ch_names = meta["ch_names"]
+        self.sfreq = meta["sfreq"]
+        self.units = meta.get("units", {})
+        # A segment still open when the recording was interrupted has no sample count
+        self.segments = [segment for segment in meta["segments"] if segment["n_samples"]]
+        self.offsets = np.cumsum([0] + [segment["n_samples"] for segment in self.segments])
+        self._t_first = [segment["t_first"] for segment in self.segments]
+        self._maps = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def t_first(self):
+        return self.segments[0]["t_first"]
+
+    @property
+    def t_last(self):
+        return self.segments[-1]["t_last"]
+
+    def _segment(self, i):
+        if i not in self._maps:
+            base = os.path.join(self.directory, self.segments[i]["file"])
+            n_samples = self.segments[i]["n_samples"]
+            self._maps[i] = (
+                np.memmap(base + ".samples", dtype=np.float32, mode="r", shape=(n_samples, len(self.ch_names))),
+                np.memmap(base + ".timestamps", dtype=np.float64, mode="r", shape=(n_samples,)),
+            )
+        return self._maps[i]
+
+    def index_at(self, timestamp, side="right"):
+        """Number of samples recorded at or before ``timestamp`` (before it, with ``side="left"``)."""
+        i = bisect.bisect_right(self._t_first, timestamp) - 1
+        if i < 0:
+            return 0
+        _, timestamps = self._segment(i)
+        return int(self.offsets[i]) + int(np.searchsorted(timestamps, timestamp, side=side))
+
+    def read(self, start, stop):
+        """Samples ``start:stop`` as ``(data, timestamps)``, data of shape (n_channels, n)."""
+        start, stop = max(start, 0), min(stop, len(self))
+        blocks, stamps = [], []
+        i = int(np.searchsorted(self.offsets, start, side="right")) - 1
+        while start < stop:
+            samples, timestamps = self._segment(i)
+            lo, hi = start - self.offsets[i], min(stop, self.offsets[i + 1]) - self.offsets[i]
+            blocks.append(samples[lo:hi].T)
+            stamps.append(timestamps[lo:hi])
+            start = int(self.offsets[i] + hi)
+            i += 1
+        if not blocks:
+            return np.zeros((len(self.ch_names), 0), dtype=np.float32), np.zeros(0)
+        return np.concatenate(blocks, axis=1), np.concatenate(stamps)
+
+
+class Recording:
+    """A session directory written by ``Recorder``: its data streams and markers.
+
+    Markers are small and loaded into memory; data streams stay on disk.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.streams = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                stream = RecordedStream(directory, name[:-len(".json")])
+                if len(stream):
+                    self.streams[stream.source_id] = stream
+
+        events = {}
+        path = os.path.join(directory, "markers.jsonl")
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        event = json.loads(line)
+                        events.setdefault(event["source_id"], []).append((event["timestamp"], event["trigger"]))
+        # source_id -> (timestamps, triggers), in time order
+        self.markers = {}
+        for source_id, batch in events.items():
+            batch.sort(key=lambda event: event[0])
+            self.markers[source_id] = (np.array([t for t, _ in batch]), [trigger for _, trigger in batch])
+
+        times = [t for stream in self.streams.values() for t in (stream.t_first, stream.t_last)]
+        times += [t for timestamps, _ in self.markers.values() for t in (timestamps[0], timestamps[-1])]
+        if not times:
+            raise ValueError(f"No recorded streams in {directory}")
+        self.start = min(times)
+        self.end = max(times)
+
+    def stream_list(self):
+        """The recording's streams, described like ``StreamRegistry.stream_list``."""
+        return {
+            "type": "stream_list",
+            "data_streams": [
+                {"name": stream.source_id, "type": "EEG", "source_id": stream.source_id,
+                 "sfreq": stream.sfreq, "n_channels": len(stream.ch_names)}
+                for stream in self.streams.values()
+            ],
+            "marker_streams": [
+                {"name": source_id, "type": "Markers", "source_id": source_id, "sfreq": 0.0, "n_channels": 1}
+                for source_id in self.markers
+            ],
+        }
+
+
+class PlaybackClock:
+    """Maps wall-clock time onto the recording's timestamps, with pause, seek and speed.
+
+    The clock is paused until ``start``. ``generation`` is incremented on every seek,
+    so readers know to move their cursor to ``seek_time`` rather than serve the
+    skipped samples.
+    """
+
+    MAX_SPEED = 16
+
+    def __init__(self, start, end, clock=time.monotonic):
+        self.start_time = start
+        self.end_time = end
+        self.speed = 1.0
+        self.paused = True
+        self.started = False
+        self.generation = 0
+        self.seek_time = start
+        self._clock = clock
+        self._anchor = start  # recording time at wall-clock time _anchor_wall
+        self._anchor_wall = clock()
+
+    def time(self):
+        if self.paused:
+            return self._anchor
+        return min(self._anchor + (self._clock() - self._anchor_wall) * self.speed, self.end_time)
+
+    @property
+    def ended(self):
+        return self.time() >= self.end_time
+
+    def _rebase(self, timestamp):
+        self._anchor, self._anchor_wall = timestamp, self._clock()
+
+    def start(self):
+        """Begin playback, the first time a stream is used."""
+        if not self.started:
+            self.started = True
+            self.play()
+
+    def play(self):
+        self._rebase(self.time())
+        self.paused = False
+
+    def pause(self):
+        self._rebase(self.time())
+        self.paused = True
+
+    def seek(self, position):
+        """Jump to ``position`` seconds from the start of the recording."""
+        self.seek_time = self.start_time + min(max(position, 0.0), self.end_time - self.start_time)
+        self._rebase(self.seek_time)
+        self.generation += 1
+
+    def set_speed(self, speed):
+        if not 1 <= speed <= self.MAX_SPEED:
+            raise ValueError(f"speed must be between 1 and {self.MAX_SPEED}, got {speed!r}")
+        self._rebase(self.time())
+        self.speed = float(speed)
+
+    def status(self):
+        return {
+            "type": "replay_status",
+            "position": self.time() - self.start_time,
+            "duration": self.end_time - self.start_time,
+            "speed": self.speed,
+            "paused": self.paused,
+            "ended": self.ended,
+        }
+
+
+class RecordingConnector:
+    """Serves a ``RecordedStream`` in place of ``LSLStreamConnector``, paced by a ``PlaybackClock``.
+
+    ``get_new_data`` returns the samples recorded up to the clock's current time,
+    with the recorded timestamps. Sample indices keep counting across seeks, so a
+    session's frames stay monotonic and a seek only shows as a jump in the timestamps.
+    If more than a buffer's worth is due at once, the older samples are skipped and
+    reported as dropped, as an overrun LSL buffer would be.
+    """
+
+    def __init__(self, stream, clock, bufsize):
+        self.recording = stream
+        self.clock = clock
+        self.bufsize = bufsize
+        self.ch_names = stream.ch_names if stream is not None else None
+        self.sfreq = stream.sfreq if stream is not None else None
+        self.ch_units = stream.units if stream is not None else {}
+        self.last_timestamp = None
+        self.sample_count = 0
+        self.timestamp_index = None
+        self.buffer_fill = 0.0
+        self._cursor = 0  # recording index of the next sample to serve
+        self._seek_index = 0  # recording index the current run of samples started at
+        self._generation = None
+
+    @property
+    def connected(self):
+        return self.recording is not None
+
+    async def connect_async(self, source_id, deadline=30.0, progress=None, **kwargs):
+        def report(state):
+            if progress is not None:
+                progress({"type": "connect_status", "source_id": source_id, "state": state, "attempt": 1})
+
+        if self.recording is None:
+            report("failed")
+            return False
+        self.clock.start()
+        report("connected")
+        return True
+
+    def disconnect(self):
+        pass
+
+    def _pick(self, data, picks):
+        if picks is None or list(picks) == self.ch_names:
+            return data
+        return data[[self.ch_names.index(ch) for ch in picks]]
+
+    def get_data(self, winsize=1, picks=None):
+        """The last ``winsize`` seconds served so far."""
+        start = self._cursor - int(winsize * self.sfreq) if self.sfreq else self._cursor - 1
+        data, timestamps = self.recording.read(start, self._cursor)
+        return self._pick(data, picks), timestamps
+
+    def get_history(self, seconds, picks=None):
+        """Like ``LSLStreamConnector.get_history``: the last ``seconds`` served since the last seek."""
+        n_wanted = int(min(seconds, self.bufsize) * (self.sfreq or 1))
+        data, timestamps = self.recording.read(max(self._cursor - n_wanted, self._seek_index), self._cursor)
+        return self._pick(data, picks), timestamps, self.sample_count - len(timestamps)
+
+    def get_new_data(self, picks=None):
+        """Same contract as ``LSLStreamConnector.get_new_data``."""
+        now = self.clock.time()
+        stop = self.recording.index_at(now)
+        buffer_samples = int(self.bufsize * self.sfreq) if self.sfreq else None
+        if self._generation != self.clock.generation:
+            # A seek restarts at its target; a first read at the current time (the stream
+            # may be joined long after playback started)
+            start_time = now if self._generation is None else self.clock.seek_time
+            self._generation = self.clock.generation
+            self._cursor = self._seek_index = self.recording.index_at(start_time, side="left")
+            self.timestamp_index = None  # timestamps jump, possibly backwards
+        if stop <= self._cursor:
+            self.buffer_fill = 0.0
+            return None, None, self.sample_count, 0
+
+        self.buffer_fill = min((stop - self._cursor) / buffer_samples, 1.0) if buffer_samples else 0.0
+        start = max(self._cursor, stop - buffer_samples) if buffer_samples else self._cursor
+        n_dropped = start - self._cursor
+        data, timestamps = self.recording.read(start, stop)
+        first_sample = self.sample_count + n_dropped
+        self._cursor = stop
+        self.last_timestamp = timestamps[-1]
+        self.sample_count = first_sample + len(timestamps)
+        if self.timestamp_index is None:
+            self.timestamp_index = TimestampIndex(buffer_samples or self.bufsize)
+        self.timestamp_index.append(timestamps, first_sample)
+        return self._pick(data, picks), timestamps, first_sample, n_dropped
+
+    def sample_index_at(self, timestamp):
+        if self.timestamp_index is None:
+            return None
+        return self.timestamp_index.nearest(timestamp, self.sfreq)
+
+
+class ReplayMarkerReader:
+    """Stands in for ``MarkerReader``, emitting a recording's markers as the clock passes them.
+
+    A task on the event loop checks the clock every ``interval`` seconds and hands
+    the markers due since the previous check to ``on_batch``.
+    """
+
+    def __init__(self, source_id, name, loop, on_batch, events, clock, interval=0.02):
+        self.source_id = source_id
+        self.name = name
+        self.loop = loop
+        self.on_batch = on_batch
+        self.timestamps, self.triggers = events
+        self.clock = clock
+        self.interval = interval
+        self.subscribers = set()
+        self._task = None
+
+    def start(self):
+        self._task = self.loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        position, generation = 0, None
+        while True:
+            now = self.clock.time()
+            if generation != self.clock.generation:
+                start_time = now if generation is None else self.clock.seek_time
+                generation = self.clock.generation
+                position = int(np.searchsorted(self.timestamps, start_time))
+            stop = int(np.searchsorted(self.timestamps, now, side="right"))
+            if stop > position:
+                self.on_batch(self, self.triggers[position:stop], self.timestamps[position:stop].tolist())
+                position = stop
+            await asyncio.sleep(self.interval)
+
+
+class Replay:
+    """A recording served as if its streams were live.
+
+    It stands in for the ``StreamRegistry`` (listing the recorded streams) and creates
+    the connectors and marker readers used by ``AcquisitionHub`` and ``MarkerHub``,
+    all following one shared ``PlaybackClock``, so clients receive the same ``eeg`` and
+    ``triggers`` messages as from LSL.
+    """
+
+    def __init__(self, directory):
+        self.recording = Recording(directory)
+        self.clock = PlaybackClock(self.recording.start, self.recording.end)
+        logging.info(f"[REPLAY] {directory}: {len(self.recording.streams)} data and "
+                     f"{len(self.recording.markers)} marker stream(s), {self.clock.status()['duration']:.1f}s")
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def add_listener(self, callback):
+        pass  # the recorded streams never change
+
+    def stream_list(self):
+        return self.recording.stream_list()
+
+    def connector(self, source_id, bufsize):
+        return RecordingConnector(self.recording.streams.get(source_id), self.clock, bufsize)
+
+    def marker_reader(self, source_id, name, loop, on_batch):
+        events = self.recording.markers.get(source_id, (np.zeros(0), []))
+        return ReplayMarkerReader(source_id, name, loop, on_batch, events, self.clock)
+
+    def control(self, command):
+        """Apply a ``replay`` message: optional ``speed`` (1-16), ``position`` (seconds
+        from the start) and ``action`` (``"play"`` or ``"pause"``), in that order."""
+        action = command.get("action")
+        if action not in (None, "play", "pause"):
+            raise ValueError(f"Unknown replay action {action!r}")
+        speed, position = command.get("speed"), command.get("position")
+        for name, value in (("speed", speed), ("position", position)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"Invalid {name} {value!r}")
+        if speed is not None:
+            self.clock.set_speed(speed)
+        if position is not None:
+            self.clock.seek(position)
+        if action == "play":
+            self.clock.started = True
+            self.clock.play()
+        elif action == "pause":
+            self.clock.started = True  # do not auto-start when the first viewer connects
+            self.clock.pause()
+        return self.clock.status()
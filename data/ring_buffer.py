@@ -0,0 +1,85 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SampleRing:
+    """Fixed-capacity circular buffer of (n_channels, n_samples) data and timestamps.
+
+    ``count`` is the total number of samples ever written, so positions in the ring
+    map directly to monotonic sample indices.
+    """
+
+    def __init__(self, n_channels, capacity, dtype=np.float32):
+        self.capacity = max(int(capacity), 1)
+        self.data = np.zeros((n_channels, self.capacity), dtype=dtype)
+        self.timestamps = np.zeros(self.capacity)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def write(self, data, timestamps):
+        n = timestamps.shape[0]
+        if n > self.capacity:
+            data, timestamps = data[:, -self.capacity:], timestamps[-self.capacity:]
+            self.count += n - self.capacity
+            n = self.capacity
+        start = self.count % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[:, start:start + first] = data[:, :first]
+        self.timestamps[start:start + first] = timestamps[:first]
+        if first < n:
+            self.data[:, :n - first] = data[:, first:]
+            self.timestamps[:n - first] = timestamps[first:]
+        self.count += n
+
+    def latest(self, n_samples):
+        """Return a copy of the newest ``n_samples`` samples as ``(data, timestamps)``."""
+        return self.read(self.count - min(int(n_samples), len(self)), self.count)
+
+    def read(self, start, stop):
+        """Return a copy of samples ``[start, stop)`` by absolute sample index.
+
+        The range is clipped to what is still held in the ring.
+        """
+        start = max(start, self.count - len(self))
+        stop = min(stop, self.count)
+        if stop <= start:
+            return self.data[:, :0].copy(), self.timestamps[:0].copy()
+        positions = np.arange(start, stop) % self.capacity
+        return self.data[:, positions], self.timestamps[positions]
+
+
+class SharedSampleRing(SampleRing):
+    """``SampleRing`` whose arrays live in a ``multiprocessing.shared_memory`` block.
+
+    The creating process passes no ``name``; other processes attach to the same
+    memory by ``name`` and read or write it without copying. ``count`` is not
+    shared: each process tracks its own, in step with the samples it writes or is
+    told about. The creator is responsible for ``unlink``.
+    """
+
+    def __init__(self, n_channels, capacity, name=None):
+        self.capacity = max(int(capacity), 1)
+        size = self.capacity * (n_channels * 4 + 8)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size if name is None else 0)
+        self.timestamps = np.ndarray((self.capacity,), dtype=np.float64, buffer=self.shm.buf)
+        self.data = np.ndarray((n_channels, self.capacity), dtype=np.float32, buffer=self.shm.buf,
+                               offset=self.capacity * 8)
+        self.count = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self):
+        """Arguments that attach another process to this ring."""
+        return self.data.shape[0], self.capacity, self.name
+
+    def close(self):
+        # Views into the block must be released before it can be closed
+        self.data = self.timestamps = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
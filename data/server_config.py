@@ -0,0 +1,63 @@
+import json
+import os
+
+DEFAULTS = {
+    "host": "0.0.0.0",
+    "port": 8765,
+    "bufsize": 20,          # seconds held by each LSL connection
+    "data_path": "eeg_data",
+    "workers": 0,           # DSP worker processes (see data.worker_pool)
+    "log_level": "INFO",
+    "streams": [],          # source_ids to connect at start-up and keep acquiring
+    "warm_start": False,    # connect ``streams`` and fill their buffers before the socket opens
+    "warm_seconds": 1.0,
+    "connect_deadline": 30.0,
+    "replay": None,         # recorded session to serve instead of the LSL streams (see data.replay)
+}
+
+# Environment variable -> (setting, parser)
+ENVIRONMENT = {
+    "HOST": ("host", str),
+    "WEBSOCKET_PORT": ("port", int),
+    "BUFFER_SIZE": ("bufsize", float),
+    "DATA_PATH": ("data_path", str),
+    "DSP_WORKERS": ("workers", int),
+    "LOG_LEVEL": ("log_level", str),
+    "STREAMS": ("streams", lambda value: [s.strip() for s in value.split(",") if s.strip()]),
+    "WARM_START": ("warm_start", lambda value: value.strip().lower() in ("1", "true", "yes", "on")),
+    "WARM_SECONDS": ("warm_seconds", float),
+    "CONNECT_DEADLINE": ("connect_deadline", float),
+    "REPLAY": ("replay", str),
+}
+
+
+def load_config(path=None, environ=None, overrides=None):
+    """Server settings from, in increasing precedence: defaults, a JSON config file,
+    environment variables and ``overrides`` (e.g. command-line options).
+
+    ``path`` defaults to ``$CONFIG_FILE``. Unknown keys in the file and invalid values
+    raise ``ValueError``.
+    """
+    environ = os.environ if environ is None else environ
+    config = dict(DEFAULTS)
+
+    path = path or environ.get("CONFIG_FILE")
+    if path:
+        with open(path) as f:
+            values = json.load(f)
+        unknown = set(values) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {', '.join(sorted(unknown))}")
+        config.update(values)
+
+    for name, (key, parse) in ENVIRONMENT.items():
+        if environ.get(name):
+            try:
+                config[key] = parse(environ[name])
+            except ValueError:
+                raise ValueError(f"Invalid {name}={environ[name]!r}") from None
+
+    config.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    if isinstance(config["streams"], str):
+        config["streams"] = [config["streams"]]
+    return config
@@ -0,0 +1,150 @@
+import numpy as np
+from data.ring_buffer import SampleRing
+
+
+class SignalQualityMonitor:
+    """Rolling per-channel signal-quality statistics of one stream.
+
+    Every chunk is written to a ring holding the last ``window`` seconds, and the
+    length of each channel's current flat run (successive samples differing by at
+    most ``flat_tolerance``) is carried across chunks. At most ``rate`` times per
+    second of stream time, ``update`` evaluates the window, with each statistic
+    computed for all channels at once:
+
+    * ``variance``, and ``deviation``: the robust z-score of the channel's standard
+      deviation against all channels (median and MAD, as in the PREP pipeline);
+    * ``line_ratio``: the share of the variance at ``line_freq``, from the projection
+      onto a sine/cosine pair;
+    * ``clipped``: samples at or beyond ``clip_level``, or, without one, repeats of
+      the channel's window extremes (an amplifier rail);
+    * ``flat_seconds``: duration of the current flat run;
+    * ``max_correlation``: the highest correlation of the channel's first difference
+      with any other channel's. Differencing removes the slow drifts that all
+      channels share, so values near 1 indicate electrode bridging. It is evaluated
+      on at most ``max_corr_samples`` samples, keeping the (n_channels, n_channels)
+      product cheap.
+
+    Channels exceeding a threshold are listed in ``bad`` with their reasons.
+    """
+
+    def __init__(self, ch_names, sfreq, window=2.0, rate=1, line_freq=50, flat_tolerance=0.0,
+                 flat_seconds=1.0, clip_level=None, clip_fraction=0.01, deviation=5.0, line_ratio=0.5,
+                 bridge_correlation=0.98, max_corr_samples=1024):
+        if not sfreq:
+            raise ValueError("signal quality needs a stream with a nominal sampling rate")
+        self.ch_names = list(ch_names)
+        self.sfreq = sfreq
+        self.period = 1 / rate
+        self.line_freq = line_freq if line_freq and line_freq < sfreq / 2 else None
+        self.flat_tolerance = flat_tolerance
+        self.flat_seconds = flat_seconds
+        self.clip_level = clip_level
+        self.clip_fraction = clip_fraction
+        self.deviation = deviation
+        self.line_ratio = line_ratio
+        self.bridge_correlation = bridge_correlation
+        self.max_corr_samples = max_corr_samples
+
+        n_channels = len(self.ch_names)
+        self.ring = SampleRing(n_channels, window * sfreq)
+        self.bad = {}  # channel -> reasons, from the latest evaluation
+        self._flat_run = np.zeros(n_channels, dtype=np.int64)
+        self._last = None
+        self._next_sample = None
+        self._next_publish = None
+
+    def update(self, data, timestamps, first_sample=None):
+        """Add a chunk; returns a ``quality`` message when one is due, else ``None``."""
+        n_samples = data.shape[1]
+        if not n_samples:
+            return None
+        if first_sample is not None and self._next_sample is not None and first_sample > self._next_sample:
+            self._last = None  # dropped samples: a flat run cannot be followed across the gap
+            self._flat_run[:] = 0
+        self._next_sample = None if first_sample is None else first_sample + n_samples
+
+        # Length of the flat run at the end of the chunk: the samples after the last change
+        steps = np.abs(np.diff(data, axis=1, prepend=data[:, :1] if self._last is None else self._last))
+        moving = steps > self.flat_tolerance
+        if self._last is None:
+            moving[:, 0] = True
+        last_move = n_samples - 1 - np.argmax(moving[:, ::-1], axis=1)
+        still = ~moving.any(axis=1)
+        self._flat_run = np.where(still, self._flat_run + n_samples, n_samples - 1 - last_move)
+        self._last = data[:, -1:].copy()
+        self.ring.write(data, timestamps)
+
+        now = timestamps[-1]
+        if self._next_publish is not None and now < self._next_publish:
+            return None
+        behind = self._next_publish is None or now - self._next_publish > self.period
+        self._next_publish = (now if behind else self._next_publish) + self.period
+        return self.evaluate(now)
+
+    def evaluate(self, timestamp):
+        window, _ = self.ring.latest(len(self.ring))
+        window = window.astype(np.float64)
+        n_channels, n_samples = window.shape
+        centred = window - window.mean(axis=1, keepdims=True)
+        variance = np.einsum("ij,ij->i", centred, centred) / n_samples
+
+        live = variance > 0
+        std = np.sqrt(variance)
+        median = np.median(std)
+        mad = 1.4826 * np.median(np.abs(std - median))
+        deviation = (std - median) / mad if mad > 0 else np.zeros(n_channels)
+
+        line_ratio = np.zeros(n_channels)
+        if self.line_freq is not None:
+            phase = 2 * np.pi * self.line_freq / self.sfreq * np.arange(n_samples)
+            projection = centred @ np.column_stack((np.cos(phase), np.sin(phase)))
+            # A sinusoid of amplitude A has variance A**2 / 2; A = 2 |projection| / n
+            line_power = 2 * np.sum(projection ** 2, axis=1) / n_samples ** 2
+            line_ratio = np.divide(line_power, variance, out=line_ratio, where=live)
+
+        if self.clip_level is not None:
+            clipped = np.count_nonzero(np.abs(window) >= self.clip_level, axis=1)
+        else:
+            top, bottom = window.max(axis=1, keepdims=True), window.min(axis=1, keepdims=True)
+            clipped = np.count_nonzero(window == top, axis=1) + np.count_nonzero(window == bottom, axis=1) - 2
+            clipped[~live] = 0
+
+        max_correlation = np.zeros(n_channels)
+        bridged = []
+        if n_channels > 1 and n_samples > 2:
+            diffs = np.diff(window, axis=1)[:, ::-(-n_samples // self.max_corr_samples)]
+            diffs -= diffs.mean(axis=1, keepdims=True)
+            norms = np.linalg.norm(diffs, axis=1)
+            diffs /= np.where(norms > 0, norms, 1)[:, None]
+            correlation = diffs @ diffs.T
+            np.fill_diagonal(correlation, 0)
+            max_correlation = correlation.max(axis=1)
+            pairs = np.argwhere(np.triu(correlation >= self.bridge_correlation, 1))
+            bridged = [[self.ch_names[i], self.ch_names[j]] for i, j in pairs]
+
+        flat_seconds = self._flat_run / self.sfreq
+        checks = {
+            "flat": flat_seconds >= self.flat_seconds,
+            "clipping": clipped > self.clip_fraction * n_samples,
+            "noisy": deviation > self.deviation,
+            "line_noise": line_ratio > self.line_ratio,
+            "bridged": max_correlation >= self.bridge_correlation,
+        }
+        self.bad = {}
+        for reason, flags in checks.items():
+            for i in np.flatnonzero(flags):
+                self.bad.setdefault(self.ch_names[i], []).append(reason)
+
+        return {
+            "type": "quality",
+            "timestamp": float(timestamp),
+            "channels": self.ch_names,
+            "variance": variance.tolist(),
+            "deviation": deviation.tolist(),
+            "line_ratio": line_ratio.tolist(),
+            "clipped": clipped.tolist(),
+            "flat_seconds": flat_seconds.tolist(),
+            "max_correlation": max_correlation.tolist(),
+            "bridged": bridged,
+            "bad": self.bad,
+        }
@@ -0,0 +1,122 @@
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_BANDS = {
+    "delta": [1, 4],
+    "theta": [4, 8],
+    "alpha": [8, 13],
+    "beta": [13, 30],
+    "gamma": [30, 45],
+}
+
+
+def feature_key(config):
+    """Canonical, hashable form of a feature config."""
+    return json.dumps(config or {}, sort_keys=True)
+
+
+class BandPowerEstimator:
+    """Rolling Welch PSD and band powers, updated incrementally from each chunk.
+
+    Samples accumulate until a full ``nperseg`` segment is available; every
+    ``nperseg * (1 - overlap)`` new samples another Hann-windowed segment is
+    transformed, with all channels and segments batched into a single ``rfft``. The
+    PSD is the mean of the last ``n_average`` segment periodograms, kept as a
+    running sum over a ring. Band powers integrate the PSD through a precomputed
+    (n_bands, n_freqs) mask matrix, and a ``line`` band at ``line_freq`` tracks mains
+    noise.
+
+    ``update`` returns a feature message at most ``rate`` times per second of stream
+    time and ``None`` otherwise. The compact PSD covers ``0..psd_max_freq`` Hz,
+    averaged down to at most ``psd_bins`` points.
+    """
+
+    def __init__(self, ch_names, sfreq, rate=4, nperseg=None, overlap=0.5, n_average=8,
+                 bands=None, line_freq=50, psd_max_freq=60, psd_bins=64):
+        if not sfreq:
+            raise ValueError("features need a stream with a nominal sampling rate")
+        if not 0 <= overlap < 1:
+            raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+        if not rate > 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        if not (isinstance(n_average, int) and n_average >= 1):
+            raise ValueError(f"n_average must be a positive integer, got {n_average}")
+        from scipy.signal import get_window
+
+        self.ch_names = ch_names
+        self.sfreq = sfreq
+        self.period = 1 / rate
+        self.nperseg = int(nperseg or 2 ** int(np.ceil(np.log2(sfreq))))  # ~1 s segments
+        self.hop = max(int(self.nperseg * (1 - overlap)), 1)
+        self.window = get_window("hann", self.nperseg).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(self.nperseg, 1 / sfreq)
+        # One-sided power spectral density scaling (as scipy.signal.welch)
+        self.scale = np.full(self.freqs.size, 2 / (sfreq * np.sum(self.window ** 2)))
+        self.scale[0] /= 2
+        if self.nperseg % 2 == 0:
+            self.scale[-1] /= 2
+
+        bands = dict(DEFAULT_BANDS if bands is None else bands)
+        if line_freq and line_freq < sfreq / 2:
+            bands["line"] = [line_freq - 1, line_freq + 1]
+        self.band_names = list(bands)
+        df = self.freqs[1] - self.freqs[0]
+        self.band_matrix = np.array([(self.freqs >= lo) & (self.freqs < hi) for lo, hi in bands.values()],
+                                    dtype=np.float64) * df
+
+        n_psd = int(np.searchsorted(self.freqs, min(psd_max_freq or sfreq / 2, sfreq / 2), side="right"))
+        self.psd_step = max(int(np.ceil(n_psd / psd_bins)), 1) if psd_bins else 1
+        self.n_psd = n_psd - n_psd % self.psd_step or self.psd_step
+
+        n_channels = len(ch_names)
+        self._periodograms = np.zeros((n_average, n_channels, self.freqs.size))
+        self._sum = np.zeros((n_channels, self.freqs.size))
+        self._n_segments = 0
+        self._pending = np.zeros((n_channels, 0), dtype=np.float32)
+        self._next_publish = None
+
+    @property
+    def psd(self):
+        return self._sum / min(self._n_segments, len(self._periodograms))
+
+    def update(self, data, timestamps):
+        pending = np.concatenate((self._pending, data), axis=1)
+        n_segments = (pending.shape[1] - self.nperseg) // self.hop + 1
+        if n_segments > 0:
+            # (n_channels, n_segments, nperseg) strided view, no copy until the windowing
+            segments = sliding_window_view(pending, self.nperseg, axis=1)[:, :n_segments * self.hop:self.hop]
+            spectra = np.fft.rfft(segments * self.window, axis=-1)
+            power = (spectra.real ** 2 + spectra.imag ** 2) * self.scale
+            ring = self._periodograms
+            for k in range(n_segments):
+                slot = self._n_segments % len(ring)
+                self._sum += power[:, k] - ring[slot]
+                ring[slot] = power[:, k]
+                self._n_segments += 1
+            pending = pending[:, n_segments * self.hop:]
+        self._pending = pending
+
+        if not self._n_segments or not len(timestamps):
+            return None
+        now = timestamps[-1]
+        if self._next_publish is not None and now < self._next_publish:
+            return None
+        # Keep to the schedule across chunk boundaries, but do not burst after a stall
+        behind = self._next_publish is None or now - self._next_publish > self.period
+        self._next_publish = (now if behind else self._next_publish) + self.period
+        return self.features(now)
+
+    def features(self, timestamp):
+        psd = self.psd
+        band_power = psd @ self.band_matrix.T  # (n_channels, n_bands)
+        compact = psd[:, :self.n_psd].reshape(psd.shape[0], -1, self.psd_step).mean(axis=2)
+        freqs = self.freqs[:self.n_psd].reshape(-1, self.psd_step).mean(axis=1)
+        return {
+            "type": "features",
+            "timestamp": float(timestamp),
+            "channels": self.ch_names,
+            "bands": {name: band_power[:, i].tolist() for i, name in enumerate(self.band_names)},
+            "freqs": freqs.tolist(),
+            "psd": compact.tolist(),
+        }
@@ -0,0 +1,93 @@
+import logging
+import threading
+from pylsl import ContinuousResolver
+
+
+def describe_stream(stream):
+    """Return the JSON-friendly description of an LSL ``StreamInfo`` sent to clients."""
+    return {
+        "name": stream.name(),
+        "type": stream.type(),
+        "source_id": stream.source_id(),
+        "sfreq": stream.nominal_srate(),
+        "n_channels": stream.channel_count(),
+    }
+
+
+def is_marker_stream(stream_info):
+    return stream_info["type"].lower() == "markers"
+
+
+class StreamRegistry:
+    """Continuously resolves LSL streams in a background thread.
+
+    The current list is cached, so ``stream_list()`` answers instantly, and every
+    change is reported once to the registered listeners as ``("stream_added", info)``
+    or ``("stream_removed", info)``. Listeners are called from the registry thread.
+    """
+
+    def __init__(self, poll_interval=0.5, forget_after=5.0):
+        self.poll_interval = poll_interval
+        self.forget_after = forget_after
+        self._streams = {}  # stream uid -> description
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="lsl-stream-registry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def stream_list(self):
+        with self._lock:
+            streams = list(self._streams.values())
+        return {
+            "type": "stream_list",
+            "data_streams": [s for s in streams if not is_marker_stream(s)],
+            "marker_streams": [s for s in streams if is_marker_stream(s)],
+        }
+
+    def _run(self):
+        resolver = ContinuousResolver(forget_after=self.forget_after)
+        while not self._stop_event.is_set():
+            try:
+                current = {stream.uid(): describe_stream(stream) for stream in resolver.results()}
+            except Exception as e:
+                logging.error(f"[REGISTRY] Stream resolution failed: {e}")
+                current = None
+            if current is not None:
+                self._update(current)
+            self._stop_event.wait(self.poll_interval)
+
+    def _update(self, current):
+        with self._lock:
+            added = [info for uid, info in current.items() if uid not in self._streams]
+            removed = [info for uid, info in self._streams.items() if uid not in current]
+            self._streams = current
+
+        for info in added:
+            logging.info(f"[REGISTRY] Stream added: {info['name']} ({info['type']}, "
+                         f"source_id={info['source_id']}, {info['n_channels']} ch @ {info['sfreq']} Hz)")
+            self._notify("stream_added", info)
+        for info in removed:
+            logging.info(f"[REGISTRY] Stream removed: {info['name']} (source_id={info['source_id']})")
+            self._notify("stream_removed", info)
+
+    def _notify(self, event, info):
+        for callback in self._listeners:
+            try:
+                callback(event, info)
+            except Exception as e:
+                logging.error(f"[REGISTRY] Listener failed for {event}: {e}")
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import numpy as np
+from data.acquisition_hub import Chunk
+from data.dsp_pipeline import pipeline_key
+from data.lsl_stream_connector import TimestampIndex
+from data.ring_buffer import SampleRing
+
+
+def interpolate(data, timestamps, grid):
+    """Linearly interpolate (n_channels, n_samples) ``data`` onto the times in ``grid``.
+
+    Vectorized over channels and samples. Grid points outside the data are held at
+    the first/last sample instead of being extrapolated.
+    """
+    if timestamps.size == 1:
+        return np.repeat(data, grid.size, axis=1)
+    right = np.clip(np.searchsorted(timestamps, grid), 1, timestamps.size - 1)
+    left = right - 1
+    span = timestamps[right] - timestamps[left]
+    weight = np.clip((grid - timestamps[left]) / np.where(span > 0, span, 1), 0, 1)
+    return data[:, left] + (data[:, right] - data[:, left]) * weight
+
+
+class SyncGroup:
+    """Several data streams aligned onto one time base and sent as a single stream.
+
+    The group subscribes to each source through the ``AcquisitionHub``, like a client
+    session, and buffers their chunks. The inlets are clock-corrected, so all
+    timestamps are already on the local LSL clock. Whenever the first (primary)
+    stream delivers a chunk, every stream is interpolated onto a common grid up to
+    the newest time covered by all of them, and the result goes out as one chunk.
+    The grid is the primary stream's own timestamps, or a regular ``resample`` Hz grid.
+
+    A stream that lags the primary by more than ``max_lag`` seconds stops holding
+    the group back; its last value is held until it catches up.
+
+    The group offers the same interface as ``AcquisitionSource`` (``source_id``,
+    ``stream_id``, ``ch_names``, ``sfreq``, ``window``, ``sample_index_at``), so sessions stream it
+    through the usual send queue, encoders and decimation.
+    """
+
+    def __init__(self, hub, streams, session, resample=None, pipeline=None, max_lag=1.0, history=10):
+        self.hub = hub
+        self.session = session
+        self.source_ids = [stream["source_id"] for stream in streams]
+        self.labels = [stream.get("name") or stream["source_id"] for stream in streams]
+        self.source_id = "+".join(self.source_ids)
+        self.stream_id = hub.new_stream_id()
+        self.resample = resample
+        self.pipeline_config = pipeline
+        self.pipeline_key = pipeline_key(pipeline)
+        self.max_lag = max_lag
+        self.history_seconds = history
+        self.sources = []
+        self.rings = {}
+        self.pipelines = {}  # no per-session pipelines; processing happens on the sources
+        self.ch_names = None
+        self.units = {}
+        self.sfreq = None
+        self.output = None
+        self.index = None
+        self.seq = 0
+        self.stale = set()
+        self._next = None  # primary ring index (native grid) or grid sample count (resampled)
+        self._t0 = None
+
+    async def connect(self):
+        """Subscribe to every stream; returns ``False`` if any of them cannot be connected.
+
+        Raises ``ValueError``/``TypeError`` for an invalid pipeline config.
+        """
+        sources = await asyncio.gather(*[self.hub.subscribe(source_id, self) for source_id in self.source_ids])
+        if any(source is None for source in sources):
+            self.close()
+            return False
+        self.sources = list(sources)
+        for source in self.sources:
+            source.acquire_pipeline(self.pipeline_key, self.pipeline_config)
+
+        self.ch_names = []
+        self.units = {}
+        for label, source in zip(self.labels, self.sources):
+            names = source.pipelines[self.pipeline_key][0].ch_names if self.pipeline_key else source.ch_names
+            self.ch_names += [f"{label}:{ch}" for ch in names]
+            self.units.update({f"{label}:{ch}": unit for ch, unit in source.units.items()})
+        self.sfreq = self.resample or self.sources[0].sfreq
+        self.output = SampleRing(len(self.ch_names), self.history_seconds * self.sfreq)
+        self.index = TimestampIndex(self.history_seconds * self.sfreq)
+        return True
+
+    def close(self):
+        for source in self.sources:
+            source.release_pipeline(self.pipeline_key)
+        for source_id in self.source_ids:
+            self.hub.unsubscribe(source_id, self)
+        self.sources = []
+
+    def notify(self, message):
+        self.session.notify(message)
+
+    def push(self, chunk):
+        if self.pipeline_key is not None and self.pipeline_key not in chunk.processed:
+            return  # acquired before the pipeline was set up
+        data, timestamps = chunk.samples(self.pipeline_key)
+        ring = self.rings.get(chunk.source.source_id)
+        if ring is None:
+            ring = SampleRing(data.shape[0], self.history_seconds * (chunk.source.sfreq or 1))
+            self.rings[chunk.source.source_id] = ring
+        ring.write(data, timestamps)
+        if self.output is not None and self.sources and chunk.source is self.sources[0]:
+            self._emit()
+
+    def _latest(self, source):
+        ring = self.rings[source.source_id]
+        return ring.timestamps[(ring.count - 1) % ring.capacity]
+
+    def _emit(self):
+        if len(self.rings) < len(self.sources):
+            return
+        latest = {source.source_id: self._latest(source) for source in self.sources}
+        primary_latest = latest[self.sources[0].source_id]
+        stale = {sid for sid, t in latest.items() if t < primary_latest - self.max_lag}
+        if stale != self.stale:
+            self.stale = stale
+            self.notify({"type": "sync_status", "source_id": self.source_id, "stale": sorted(stale)})
+            logging.info(f"[SYNC] Lagging streams in {self.source_id}: {sorted(stale)}")
+        horizon = min(t for sid, t in latest.items() if sid not in stale)
+
+        grid = self._grid(horizon)
+        if grid is None or grid.size == 0:
+            return
+        blocks = []
+        for source in self.sources:
+            ring = self.rings[source.source_id]
+            # Only the tail of the ring overlapping the grid is needed
+            n = int((latest[source.source_id] - grid[0]) * (source.sfreq or 1)) + 2
+            data, timestamps = ring.latest(max(n, 2))
+            blocks.append(interpolate(data, timestamps, grid))
+        data = np.concatenate(blocks).astype(np.float32, copy=False)
+
+        first_sample = self.output.count
+        self.output.write(data, grid)
+        self.index.append(grid, first_sample)
+        chunk = Chunk(self, self.seq, data, grid, first_sample, 0)
+        self.seq += 1
+        self.session.push(chunk)
+
+    def _grid(self, horizon):
+        if self.resample:
+            if self._t0 is None:
+                # Start once every stream has data
+                self._t0 = max(ring.timestamps[(ring.count - len(ring)) % ring.capacity]
+                               for ring in self.rings.values())
+                self._next = 0
+            n = int(np.floor((horizon - self._t0) * self.resample)) + 1 - self._next
+            if n <= 0:
+                return None
+            grid = self._t0 + (self._next + np.arange(n)) / self.resample
+            self._next += n
+            return grid
+
+        primary = self.rings[self.sources[0].source_id]
+        if self._next is None:
+            start = max(ring.timestamps[(ring.count - len(ring)) % ring.capacity]
+                        for ring in self.rings.values())
+            _, timestamps = primary.latest(len(primary))
+            self._next = primary.count - len(primary) + int(np.searchsorted(timestamps, start))
+        self._next = max(self._next, primary.count - len(primary))  # the ring overran
+        _, timestamps = primary.read(self._next, primary.count)
+        n = int(np.searchsorted(timestamps, horizon, side="right"))
+        self._next += n
+        return timestamps[:n]
+
+    def window(self, winsize=1):
+        return self.output.latest(winsize * self.sfreq)
+
+    def history(self, seconds, key=None):
+        """Like ``AcquisitionSource.history``; the sources already applied the pipeline."""
+        data, timestamps = self.output.latest(seconds * self.sfreq)
+        return data, timestamps, self.output.count - len(timestamps)
+
+    def sample_index_at(self, timestamp):
+        return self.index.nearest(timestamp, self.sfreq)
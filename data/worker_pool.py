@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+from data.dsp_pipeline import Pipeline
+from data.protocol import encode_frame
+from data.ring_buffer import SharedSampleRing
+
+
+def _view(view):
+    """Rebuild a session ``view`` dict from the tuple used in encode keys."""
+    if not view:
+        return None
+    return {k: v for k, v in zip(("width", "span"), view) if v is not None}
+
+
+def _process(task, attach, pipelines):
+    source_id, sfreq, ch_names = task["source_id"], task["sfreq"], task["ch_names"]
+    ring = attach(task["input"])
+    ring.count = task["stop"]
+    data, timestamps = ring.read(task["start"], task["stop"])
+
+    outputs = {None: (data, ch_names)}
+    for key, (config, spec, count) in task["pipelines"].items():
+        pipeline = pipelines.get((source_id, key))
+        if pipeline is None:
+            # The filter state lives here; its output history is the shared ring the
+            # event loop reads window frames and processed samples from.
+            pipeline = Pipeline(config, ch_names, sfreq, history=0)
+            pipeline.history = attach(spec)
+            pipelines[(source_id, key)] = pipeline
+        # The event loop's count is authoritative: a restarted worker continues from it,
+        # and it is reset when a failed job left a gap
+        pipeline.history.count = count
+        pipeline.exclude(task["exclude"])
+        outputs[key] = (pipeline.process(data, timestamps), pipeline.ch_names)
+
+    # An encoding that fails only concerns the sessions using it; the others still get their frames
+    frames, errors = {}, {}
+    for encoding in task["encodings"]:
+        delivery, frame_format, key, view, resolution = encoding
+        samples, channels = outputs[key]
+        frame_timestamps, first_sample = timestamps, task["first_sample"]
+        try:
+            if delivery != "incremental":
+                winsize = float(view[1]) if view and view[1] is not None else 1
+                history = ring if key is None else pipelines[(source_id, key)].history
+                samples, frame_timestamps = history.latest(winsize * sfreq)
+                first_sample += len(timestamps) - len(frame_timestamps)
+            frames[encoding] = encode_frame(
+                samples, frame_timestamps, task["seq"], channels, sfreq, first_sample, task["n_dropped"],
+                delivery, frame_format, _view(view), resolution, task["units"], task["stream_id"]
+            )
+        except Exception as e:
+            errors[encoding] = f"{type(e).__name__}: {e}"
+    counts = {key: pipelines[(source_id, key)].history.count for key in task["pipelines"]}
+    return frames, counts, errors
+
+
+def _worker(jobs, results):
+    """Worker process: runs the pipelines of the sources assigned to it, in order."""
+    rings = {}
+    pipelines = {}  # (source_id, pipeline key) -> Pipeline
+
+    def attach(spec):
+        n_channels, capacity, name = spec
+        if name not in rings:
+            rings[name] = SharedSampleRing(n_channels, capacity, name=name)
+        return rings[name]
+
+    while True:
+        job = jobs.get()
+        if job[0] == "stop":
+            break
+        if job[0] == "drop":
+            _, source_id, key, ring_name = job
+            pipelines.pop((source_id, key), None)
+            ring = rings.pop(ring_name, None)
+            if ring is not None:
+                ring.close()
+            continue
+        _, job_id, task = job
+        try:
+            results.send((job_id, _process(task, attach, pipelines), None))
+        except Exception as e:
+            results.send((job_id, None, f"{type(e).__name__}: {e}"))
+
+    for ring in rings.values():
+        ring.close()
+    results.close()
+
+
+class DSPWorkerPool:
+    """Worker processes that run pipelines and frame encoding off the event loop.
+
+    Acquisition writes each chunk into a per-source ``SharedSampleRing`` and submits
+    a small job naming the ring slice, the source's pipelines and the encodings its
+    subscribers need. Filters are stateful, so every source is pinned to one worker
+    (the least loaded when it first submits) and its jobs run in order there; separate
+    sources scale across processes. Processed samples are written straight into the
+    pipelines' shared history rings; only the encoded frames travel back, each worker
+    through its own pipe, and the event loop just routes them to clients.
+
+    A worker that dies, or does not answer a job within ``timeout`` seconds, is
+    replaced: its pending jobs fail with ``RuntimeError`` and its sources' filters
+    start over in the new process. The replacement gets a new job queue and result
+    pipe, since a killed process can leave a shared queue unusable.
+    """
+
+    # Seconds between liveness checks of the worker running a pending job
+    LIVENESS_INTERVAL = 0.5
+
+    def __init__(self, n_workers, timeout=5.0):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.timeout = timeout
+        self._jobs = [None] * n_workers
+        self._processes = [None] * n_workers
+        self._readers = [None] * n_workers
+        self._assigned = {}  # source_id -> worker index
+        self._futures = {}  # job id -> (future, worker index)
+        self._ids = itertools.count()
+        self._loop = None
+
+    def _spawn(self, index):
+        """Start worker ``index`` with a new job queue and a result pipe read by its own thread."""
+        self._jobs[index] = self._ctx.Queue()
+        receiver, sender = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(target=_worker, args=(self._jobs[index], sender),
+                                    name=f"dsp-worker-{index}", daemon=True)
+        process.start()
+        sender.close()  # the worker holds the only write end, so its exit ends the reader
+        reader = threading.Thread(target=self._read_results, args=(receiver,), name=f"dsp-results-{index}",
+                                  daemon=True)
+        reader.start()
+        self._processes[index] = process
+        self._readers[index] = reader
+
+    def _restart(self, index):
+        """Replace worker ``index`` (dead or hung), failing the jobs it had not answered.
+
+        The old process is reaped in a thread, so the event loop does not wait for it.
+        """
+        process = self._processes[index]
+        logging.error(f"[WORKERS] DSP worker {index} stopped responding (exit code {process.exitcode}); restarting")
+        if process.is_alive():
+            process.terminate()
+        self._loop.run_in_executor(None, self._reap, process)
+        for job_id, (future, worker) in list(self._futures.items()):
+            if worker == index:
+                del self._futures[job_id]
+                if not future.done():
+                    future.set_exception(RuntimeError(f"DSP worker {index} stopped"))
+        # Jobs still queued for the old process are dropped along with its queue
+        self._spawn(index)
+
+    @staticmethod
+    def _reap(process):
+        process.join(timeout=1)
+        if process.is_alive():
+            process.kill()  # a stopped process does not act on SIGTERM
+            process.join(timeout=1)
+
+    @property
+    def pids(self):
+        return [process.pid for process in self._processes]
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        for index in range(len(self._processes)):
+            self._spawn(index)
+        logging.info(f"[WORKERS] Started {len(self._processes)} DSP worker process(es)")
+
+    def stop(self):
+        for jobs in self._jobs:
+            jobs.put(("stop",))
+        for process in self._processes:
+            process.join(timeout=5)
+        for reader in self._readers:
+            reader.join(timeout=5)
+        logging.info("[WORKERS] DSP workers stopped")
+
+    def _read_results(self, receiver):
+        try:
+            while True:
+                try:
+                    item = receiver.recv()
+                except (EOFError, OSError):
+                    return  # the worker exited
+                self._loop.call_soon_threadsafe(self._resolve, *item)
+        finally:
+            receiver.close()
+
+    def _resolve(self, job_id, result, error):
+        future, _ = self._futures.pop(job_id, (None, None))
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _worker_for(self, source_id):
+        if source_id not in self._assigned:
+            load = [list(self._assigned.values()).count(i) for i in range(len(self._jobs))]
+            self._assigned[source_id] = load.index(min(load))
+        return self._assigned[source_id]
+
+    async def run(self, source_id, task):
+        """Process one chunk; returns ``(frames by encode key, history count by pipeline key,
+        error message by encode key)``.
+
+        Raises ``RuntimeError`` if the job fails, or if its worker dies or times out.
+        """
+        index = self._worker_for(source_id)
+        job_id = next(self._ids)
+        future = self._loop.create_future()
+        self._futures[job_id] = (future, index)
+        self._jobs[index].put(("process", job_id, task))
+        deadline = self._loop.time() + self.timeout
+        try:
+            while True:
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), self.LIVENESS_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                if not self._processes[index].is_alive() or self._loop.time() > deadline:
+                    self._restart(index)  # fails ``future``
+        finally:
+            self._futures.pop(job_id, None)
+
+    def drop(self, source_id, key, ring_name):
+        """Forget a pipeline (or, with ``key=None``, a source's input ring) in its worker."""
+        if source_id in self._assigned:
+            self._jobs[self._assigned[source_id]].put(("drop", source_id, key, ring_name))
+
+    def release(self, source_id):
+        self._assigned.pop(source_id, None)
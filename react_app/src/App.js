@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef } from "react";
 import EEGGraph from "./components/EEGGraph";
 import MultiChannelGraph from "./components/MultiChannelGraph";
 import SpectralAnalysis from "./components/SpectralAnalysis";
+import { decodeFrame } from "./protocol";
 
 const App = () => {
   const [socket, setSocket] = useState(null);
@@ -24,13 +25,32 @@ const App = () => {
   const [referenceDropdownOpen, setReferenceDropdownOpen] = useState(false);
   const dropdownRef = useRef(null);
   const referenceDropdownRef = useRef(null);
+  const channelsRef = useRef([]);
+  // Compressed frames decode asynchronously; chaining keeps them in arrival order
+  const decodingRef = useRef(Promise.resolve());
 
   useEffect(() => {
     const ws = new WebSocket("ws://localhost:8765");
+    ws.binaryType = "arraybuffer";
     ws.onopen = () => console.log("✅ Connected to WebSocket server");
 
     ws.onmessage = (event) => {
       try {
+        if (event.data instanceof ArrayBuffer) {
+          const buffer = event.data;
+          decodingRef.current = decodingRef.current
+            .then(() => decodeFrame(buffer))
+            .then((frame) =>
+              setEegData({
+                data: frame.data,
+                timestamps: frame.timestamps,
+                selected_channels: channelsRef.current,
+              })
+            )
+            .catch((error) => console.error("❌ Error decoding frame:", error));
+          return;
+        }
+
         const message = JSON.parse(event.data);
 
         if (message.type === "stream_list") {
@@ -38,7 +58,21 @@ const App = () => {
           setMarkerStreams(message.marker_streams || []);
         }
 
+        if (message.type === "stream_added" || message.type === "stream_removed") {
+          const setStreams =
+            message.kind === "marker" ? setMarkerStreams : setDataStreams;
+          setStreams((prev) => {
+            const others = prev.filter(
+              (s) => s.source_id !== message.stream.source_id
+            );
+            return message.type === "stream_added"
+              ? [...others, message.stream]
+              : others;
+          });
+        }
+
         if (message.channels) {
+          channelsRef.current = message.channels;
           setChannels(message.channels);
         }
 
@@ -55,14 +89,15 @@ const App = () => {
           });
         }
 
-        if (message.type === "trigger") {
-          const newTrigger = {
-            trigger: message.trigger,
-            timestamp: message.timestamp,
-          };
+        if (message.type === "triggers") {
+          const newTriggers = message.triggers.map((t) => ({
+            trigger: t.trigger,
+            timestamp: t.timestamp,
+            sample_index: t.sample_index,
+          }));
 
           setTriggers((prev) => {
-            const updated = [...prev.slice(-19), newTrigger];
+            const updated = [...prev, ...newTriggers].slice(-20);
             window.dispatchEvent(
               new CustomEvent("update-triggers", { detail: updated })
             );
@@ -91,6 +126,7 @@ const App = () => {
           type: "start_data",
           data_stream: data,
           reference_channels: reference || [],
+          view: { width: window.innerWidth - 100, span: 1 },
         })
       );
     }
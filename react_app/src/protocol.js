@@ -0,0 +1,140 @@
+// Decoder for the binary EEG frames produced by data/protocol.py.
+//
+// Header (little-endian, 44 bytes):
+//   magic "EEGF" | version u8 | dtype u8 | stream_id u16 | seq u32 |
+//   n_channels u32 | n_samples u32 | first_sample u64 | t0 f64 | dt f64
+// followed by a C-contiguous (n_channels, n_samples) float32 array (dtype 1), or
+// by a quantized delta frame (dtype 2, formats "delta16"/"delta24"):
+//   bits u8 | width u8 | flags u16 | n_corrections u32 | payload_size u32 |
+//   correction_index u32[n_corrections] | correction_offset f32[n_corrections] |
+//   zlib(scale f32[n_channels] | first i32[n_channels] |
+//        `width` byte planes of the zigzag-coded sample deltas)
+// Quantized values are within +-(2**(bits - 1) - 1); -2**(bits - 1) marks a missing
+// (non-finite) sample and decodes as NaN. With flag DELTA_PAIRS (min/max decimated
+// frames) samples come in pairs sharing one timestamp, and the timestamp index, dt
+// and corrections count pairs.
+
+const FRAME_MAGIC = "EEGF";
+const HEADER_SIZE = 44;
+const DELTA_HEADER_SIZE = 12;
+const DTYPE_FLOAT32 = 1;
+const DTYPE_DELTA = 2;
+const DELTA_PAIRS = 1;
+
+const readHeader = (view) => {
+  const magic = String.fromCharCode(
+    view.getUint8(0),
+    view.getUint8(1),
+    view.getUint8(2),
+    view.getUint8(3)
+  );
+  if (magic !== FRAME_MAGIC) {
+    throw new Error(`Not an EEG frame (magic=${magic})`);
+  }
+  return {
+    version: view.getUint8(4),
+    dtype: view.getUint8(5),
+    stream_id: view.getUint16(6, true),
+    seq: view.getUint32(8, true),
+    nChannels: view.getUint32(12, true),
+    nSamples: view.getUint32(16, true),
+    first_sample: Number(view.getBigUint64(20, true)),
+    t0: view.getFloat64(28, true),
+    dt: view.getFloat64(36, true),
+  };
+};
+
+const toFrame = (header, data, timestamps) => ({
+  type: "eeg",
+  version: header.version,
+  stream_id: header.stream_id,
+  seq: header.seq,
+  first_sample: header.first_sample,
+  timestamps,
+  data,
+});
+
+export const decodeBinaryFrame = (buffer) => {
+  const header = readHeader(new DataView(buffer));
+  if (header.dtype !== DTYPE_FLOAT32) {
+    throw new Error(`Unsupported frame dtype code ${header.dtype}`);
+  }
+  const { nChannels, nSamples, t0, dt } = header;
+
+  const samples = new Float32Array(buffer, HEADER_SIZE, nChannels * nSamples);
+  const data = [];
+  for (let ch = 0; ch < nChannels; ch++) {
+    data.push(samples.subarray(ch * nSamples, (ch + 1) * nSamples));
+  }
+  const timestamps = Array.from({ length: nSamples }, (_, i) => t0 + i * dt);
+  return toFrame(header, data, timestamps);
+};
+
+const inflate = async (bytes) => {
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return new Response(stream).arrayBuffer();
+};
+
+const decodeDeltaFrame = async (buffer, header) => {
+  const { nChannels, nSamples, t0, dt } = header;
+  const view = new DataView(buffer, HEADER_SIZE);
+  const bits = view.getUint8(0);
+  const width = view.getUint8(1);
+  const pairs = (view.getUint16(2, true) & DELTA_PAIRS) !== 0;
+  const nCorrections = view.getUint32(4, true);
+  const payloadSize = view.getUint32(8, true);
+  let offset = HEADER_SIZE + DELTA_HEADER_SIZE;
+  const correctionIndex = new Uint32Array(buffer.slice(offset, offset + 4 * nCorrections));
+  offset += 4 * nCorrections;
+  const correctionOffset = new Float32Array(buffer.slice(offset, offset + 4 * nCorrections));
+  offset += 4 * nCorrections;
+
+  const payload = await inflate(new Uint8Array(buffer, offset, payloadSize));
+  const scale = new Float32Array(payload, 0, nChannels);
+  const first = new Int32Array(payload, 4 * nChannels, nChannels);
+  const planes = new Uint8Array(payload, 8 * nChannels);
+  const perChannel = Math.max(nSamples - 1, 0);
+  const nDeltas = nChannels * perChannel;
+  const missing = -(2 ** (bits - 1)); // marks a non-finite sample
+
+  const data = [];
+  for (let ch = 0; ch < nChannels; ch++) {
+    const values = new Float64Array(nSamples);
+    let value = first[ch];
+    if (nSamples) values[0] = value === missing ? NaN : value * scale[ch];
+    for (let i = 0; i < perChannel; i++) {
+      const k = ch * perChannel + i;
+      let zigzag = 0;
+      for (let b = width - 1; b >= 0; b--) {
+        zigzag = zigzag * 256 + planes[b * nDeltas + k];
+      }
+      value += zigzag % 2 ? -(zigzag + 1) / 2 : zigzag / 2;
+      values[i + 1] = value === missing ? NaN : value * scale[ch];
+    }
+    data.push(values);
+  }
+
+  const timestamps = new Array(nSamples);
+  const nTimes = pairs ? nSamples / 2 : nSamples;
+  let correction = 0;
+  for (let i = 0, c = 0; i < nTimes; i++) {
+    if (c < nCorrections && correctionIndex[c] === i) {
+      correction = correctionOffset[c++];
+    }
+    if (pairs) {
+      timestamps[2 * i] = timestamps[2 * i + 1] = t0 + i * dt + correction;
+    } else {
+      timestamps[i] = t0 + i * dt + correction;
+    }
+  }
+  return toFrame(header, data, timestamps);
+};
+
+// Decodes either frame type; quantized delta frames are inflated asynchronously.
+export const decodeFrame = async (buffer) => {
+  const header = readHeader(new DataView(buffer));
+  if (header.dtype === DTYPE_DELTA) {
+    return decodeDeltaFrame(buffer, header);
+  }
+  return decodeBinaryFrame(buffer);
+};
@@ -0,0 +1,248 @@
+"""End-to-end latency and throughput benchmark for EEGWebSocketServer.
+
+Runs entirely on one machine without amplifier hardware: a helper process publishes
+local pylsl StreamOutlets and drives N headless WebSocket clients per stream, while
+the server runs in-process in this one, so the CPU and RSS figures are the server's
+alone (CPU includes the server's DSP worker processes when ``--workers`` is set).
+Channel 0 of the synthetic stream carries a running sample counter, which the
+clients use to count dropped and duplicated samples.
+
+    python -m tests.benchmark_streaming --channels 8 64 256 --rates 250 1000 8000 \\
+        --clients 1 10 --duration 10 --output bench.jsonl
+
+    # Scaling of the worker-process mode: 4 streams, bandpass pipeline, 0 vs 4 workers
+    python -m tests.benchmark_streaming --channels 128 --rates 2000 --sources 4 \\
+        --clients 2 --pipeline --workers 0 4
+
+Each configuration appends one JSON line with p50/p99 latency (LSL timestamp of the
+newest sample in a frame to client receipt), frames/s, bytes/s, server CPU and RSS
+and sample integrity counts, tagged with the current git commit.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+import numpy as np
+
+
+PIPELINE = [{"type": "notch", "freq": 50}, {"type": "bandpass", "l_freq": 1, "h_freq": 40}]
+
+
+def run_outlet(source_id, n_channels, sfreq, chunk_size, stop_event):
+    from pylsl import StreamInfo, StreamOutlet
+
+    info = StreamInfo("Benchmark", "EEG", n_channels, sfreq, "float32", source_id)
+    channels = info.desc().append_child("channels")
+    for k in range(n_channels):
+        ch = channels.append_child("channel")
+        ch.append_child_value("label", f"CH{k}")
+        ch.append_child_value("unit", "microvolts")
+        ch.append_child_value("type", "EEG")
+    outlet = StreamOutlet(info, chunk_size)
+
+    block = np.random.default_rng(0).standard_normal((chunk_size, n_channels)).astype(np.float32)
+    counter = np.arange(chunk_size, dtype=np.float32)
+    period = chunk_size / sfreq
+    next_push = time.perf_counter()
+    n_pushed = 0
+    while not stop_event.is_set():
+        block[:, 0] = counter + n_pushed
+        outlet.push_chunk(block)
+        n_pushed += chunk_size
+        next_push += period
+        delay = next_push - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+async def run_client(uri, source_id, frame_format, pipeline, duration, results):
+    import websockets
+    from pylsl import local_clock
+    from data.protocol import decode_binary_frame
+
+    latencies = []
+    n_frames = n_bytes = n_samples = n_dropped = n_duplicated = 0
+    last_value = None
+    async with websockets.connect(uri, max_size=None) as websocket:
+        await websocket.send(json.dumps({
+            "type": "start_data",
+            "data_stream": {"source_id": source_id},
+            "delivery": "incremental",
+            "format": frame_format,
+            "pipeline": PIPELINE if pipeline else None,
+        }))
+        end = None
+        while end is None or time.perf_counter() < end:
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout=5)
+            except asyncio.TimeoutError:
+                break
+            received = local_clock()
+            if isinstance(message, bytes):
+                frame = decode_binary_frame(message)
+            else:
+                frame = json.loads(message)
+                if frame.get("type") != "eeg":
+                    continue
+            if end is None:
+                # Start measuring once the first frame (the buffer backlog) has arrived
+                end = time.perf_counter() + duration
+                last_value = float(frame["data"][0][-1])
+                continue
+
+            n_frames += 1
+            n_bytes += len(message)
+            latencies.append(received - float(frame["timestamps"][-1]))
+            values = np.asarray(frame["data"][0], dtype=np.float64)
+            n_samples += values.size
+            if not pipeline:  # the counter channel is only intact without filtering
+                steps = np.diff(np.concatenate(([last_value], values)))
+                n_dropped += int(np.sum(steps[steps > 1] - 1))
+                n_duplicated += int(np.sum(steps < 1))
+            last_value = values[-1]
+
+    results.append({
+        "latencies": latencies,
+        "frames": n_frames,
+        "bytes": n_bytes,
+        "samples": n_samples,
+        "dropped": n_dropped,
+        "duplicated": n_duplicated,
+    })
+
+
+def run_load(uri, source_ids, config, stop_event, result_queue):
+    """Helper process: publish the LSL outlets and drive the headless clients."""
+    import threading
+
+    for source_id in source_ids:
+        threading.Thread(
+            target=run_outlet,
+            args=(source_id, config["channels"], config["sfreq"], config["chunk_size"], stop_event),
+            daemon=True,
+        ).start()
+
+    async def clients():
+        results = []
+        await asyncio.gather(*[
+            run_client(uri, source_id, config["format"], config["pipeline"], config["duration"], results)
+            for source_id in source_ids
+            for _ in range(config["clients"])
+        ])
+        return results
+
+    result_queue.put(asyncio.run(clients()))
+    stop_event.set()
+
+
+def process_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def benchmark(config):
+    from app import EEGWebSocketServer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    port = free_port()
+    server = EEGWebSocketServer(host="127.0.0.1", port=port, workers=config["workers"])
+    server_task = asyncio.create_task(server.start_server())
+    await asyncio.sleep(0.5)
+    worker_pids = server.pool.pids if server.pool is not None else []
+
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    result_queue = ctx.Queue()
+    source_ids = [f"benchmark-{uuid.uuid4().hex}" for _ in range(config["sources"])]
+    load = ctx.Process(target=run_load,
+                       args=(f"ws://127.0.0.1:{port}", source_ids, config, stop_event, result_queue))
+
+    def cpu_seconds():
+        times = os.times()
+        return times.user + times.system + sum(process_cpu_seconds(pid) for pid in worker_pids)
+
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    load.start()
+    results = await asyncio.get_running_loop().run_in_executor(None, result_queue.get)
+    cpu_end, wall_end = cpu_seconds(), time.perf_counter()
+    load.join()
+    server_task.cancel()
+
+    latencies = np.concatenate([r["latencies"] for r in results]) * 1000 if results else np.array([])
+    cpu = cpu_end - cpu_start
+    duration = config["duration"]
+    return dict(
+        config,
+        latency_p50_ms=float(np.percentile(latencies, 50)) if latencies.size else None,
+        latency_p99_ms=float(np.percentile(latencies, 99)) if latencies.size else None,
+        frames_per_s=sum(r["frames"] for r in results) / duration,
+        bytes_per_s=sum(r["bytes"] for r in results) / duration,
+        samples_received=sum(r["samples"] for r in results),
+        samples_dropped=sum(r["dropped"] for r in results),
+        samples_duplicated=sum(r["duplicated"] for r in results),
+        server_cpu_percent=100 * cpu / (wall_end - wall_start),
+        server_rss_mb=rss_bytes() / 2 ** 20,
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--rates", type=float, nargs="+", default=[250, 1000])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[32])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1])
+    parser.add_argument("--formats", nargs="+", default=["json", "binary"])
+    parser.add_argument("--sources", type=int, default=1, help="number of LSL streams")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0], help="DSP worker processes")
+    parser.add_argument("--pipeline", action="store_true", help="clients request a filter pipeline")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--output", default=None, help="append JSON lines here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for channels, sfreq, chunk_size, clients, frame_format, workers in itertools.product(
+                args.channels, args.rates, args.chunk_sizes, args.clients, args.formats, args.workers):
+            config = {"channels": channels, "sfreq": sfreq, "chunk_size": chunk_size,
+                      "sources": args.sources, "clients": clients, "format": frame_format,
+                      "pipeline": args.pipeline, "workers": workers, "duration": args.duration}
+            result = asyncio.run(benchmark(config))
+            result["commit"] = commit
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,36 @@ import asyncio
 import websockets
 import json
 import matplotlib.pyplot as plt
+from data.protocol import decode_binary_frame
 
-async def visualize_eeg_data():
+async def visualize_eeg_data(frame_format="binary"):
     uri = "ws://127.0.0.1:8765"  # WebSocket server address
     try:
         print(f"Attempting to connect to WebSocket server at {uri}...")
         async with websockets.connect(uri) as websocket:
             print("Connected to the WebSocket server.")
+
+            # Pick the first available data stream and request frames in the chosen format
+            stream_list = json.loads(await websocket.recv())
+            if not stream_list.get("data_streams"):
+                print(f"No data streams available: {stream_list}")
+                return
+            await websocket.send(json.dumps({
+                "type": "start_data",
+                "data_stream": stream_list["data_streams"][0],
+                "format": frame_format
+            }))
+            # Connection status messages may arrive before the channel list
+            while True:
+                message = await websocket.recv()
+                reply = json.loads(message) if isinstance(message, str) else {}
+                if "error" in reply:
+                    print(f"Server error: {reply['error']}")
+                    return
+                if "channels" in reply:
+                    ch_names = reply["channels"]
+                    break
+
             plt.ion()  # Enable interactive mode
 
             # Create subplots for 6 EEG channels
@@ -20,10 +43,14 @@ async def visualize_eeg_data():
                     print("Waiting for data from the server...")
                     message = await websocket.recv()
                     print("Received data from server.")
-                    data = json.loads(message)
-                    timestamps = data["timestamp"]
+                    if isinstance(message, bytes):
+                        data = decode_binary_frame(message)
+                    else:
+                        data = json.loads(message)
+                    if data.get("type") != "eeg":
+                        continue
+                    timestamps = data["timestamps"]
                     eeg_data = data["data"]
-                    ch_names = data["ch_names"]
 
                     # Clear previous plots
                     for ax in axes:
@@ -43,4 +70,5 @@ async def visualize_eeg_data():
         print(f"Failed to connect to WebSocket server: {e}")
 
 # Run the visualization
-asyncio.run(visualize_eeg_data())
+if __name__ == "__main__":
+    asyncio.run(visualize_eeg_data())
@@ -0,0 +1,40 @@
+import numpy as np
+
+from data.lsl_stream_connector import LSLStreamConnector
+
+
+class _Buffer:
+    """Stands in for the mne_lsl stream: a zero-initialized buffer partly filled."""
+
+    connected = True
+    n_new_samples = 0
+
+    def __init__(self, timestamps, sfreq):
+        self.timestamps = timestamps
+        self.sfreq = sfreq
+
+    def get_data(self, winsize, picks=None):
+        timestamps = self.timestamps[-int(round(winsize * self.sfreq)):]
+        return np.where(timestamps > 0, 1.0, 0.0)[None, :].repeat(2, axis=0), timestamps
+
+
+def _connector(n_filled, sample_count, bufsize=20, sfreq=250.0):
+    connector = LSLStreamConnector(bufsize, sfreq=sfreq)
+    timestamps = np.zeros(int(bufsize * sfreq))
+    timestamps[-n_filled:] = 500 + np.arange(n_filled) / sfreq
+    connector.stream = _Buffer(timestamps, sfreq)
+    connector.last_timestamp = timestamps[-1]
+    connector.sample_count = sample_count
+    return connector
+
+
+def test_history_right_after_connect_skips_unfilled_slots():
+    data, timestamps, first_sample = _connector(285, 285).get_history(2)
+    assert first_sample == 0
+    assert len(timestamps) == 285 and np.all(timestamps > 0) and np.all(data == 1.0)
+
+
+def test_history_after_reconnect_only_returns_the_new_connection():
+    data, timestamps, first_sample = _connector(100, 5000).get_history(2)
+    assert len(timestamps) == 100 and np.all(timestamps > 0)
+    assert first_sample == 4900
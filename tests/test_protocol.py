@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from data.decimation import minmax_decimate, samples_per_bin
+from data.protocol import (DELTA_FORMATS, DELTA_RESOLUTION, decode_binary_frame, encode_delta_frame, encode_frame,
+                           quantization_steps)
+
+
+def _round_trip(data, timestamps, sfreq, bits, steps=None):
+    frame = decode_binary_frame(encode_delta_frame(data, timestamps, 7, sfreq, bits, steps, stream_id=3))
+    assert frame["seq"] == 7 and frame["stream_id"] == 3
+    return frame
+
+
+@pytest.mark.parametrize("bits", DELTA_FORMATS.values())
+def test_delta_frame_error_within_half_step(bits):
+    rng = np.random.default_rng(0)
+    sfreq = 250.0
+    data = np.cumsum(rng.normal(0, 20, (4, 500)), axis=1)
+    data[2] *= 1e4  # exceeds the fixed step's range, so it gets a peak-scaled step
+    data[3] = 0.0  # silent channel
+    timestamps = 100.0 + np.arange(500) / sfreq
+    steps = quantization_steps(["a", "b", "c", "d"], {"a": -6, "b": -6, "c": -6}, bits)
+
+    frame = _round_trip(data, timestamps, sfreq, bits, steps)
+
+    qmax = 2 ** (bits - 1) - 1
+    scale = np.fmax(steps, np.abs(data).max(axis=1) / qmax)
+    scale[~(scale > 0)] = 1.0
+    error = np.abs(frame["data"] - data).max(axis=1)
+    # Half a step, with slack for the scale being sent as float32
+    assert np.all(error <= scale / 2 * (1 + 1e-6))
+    assert np.allclose(frame["timestamps"], timestamps, atol=0.1 / sfreq)
+
+
+@pytest.mark.parametrize("bits", DELTA_FORMATS.values())
+def test_delta_frame_restores_missing_samples(bits):
+    sfreq = 100.0
+    data = np.sin(np.linspace(0, 20, 200))[None, :].repeat(3, axis=0) * 50
+    data[0, 10] = np.nan
+    data[1, [0, 199]] = [np.inf, -np.inf]
+    data[2, :] = np.nan
+    timestamps = np.arange(200) / sfreq
+
+    frame = _round_trip(data, timestamps, sfreq, bits)
+
+    missing = ~np.isfinite(data)
+    assert np.array_equal(np.isnan(frame["data"]), missing)
+    # A missing sample does not widen the step of the rest of the channel
+    qmax = 2 ** (bits - 1) - 1
+    error = np.abs(frame["data"] - data)[~missing]
+    assert error.max() <= 50 / qmax / 2 * (1 + 1e-6)
+
+
+@pytest.mark.parametrize("frame_format", DELTA_FORMATS)
+def test_decimated_delta_frame(frame_format):
+    rng = np.random.default_rng(1)
+    sfreq = 1000.0
+    channels = [f"ch{i}" for i in range(8)]
+    data = np.cumsum(rng.normal(0, 2, (8, 1000)), axis=1)
+    timestamps = 50.0 + np.arange(1000) / sfreq + rng.normal(0, 1e-5, 1000)
+    view = {"width": 100, "span": 1}
+    units = dict.fromkeys(channels, -6)
+
+    delta = encode_frame(data, timestamps, 0, channels, sfreq, 12345, delivery="incremental",
+                         frame_format=frame_format, view=view, units=units)
+    binary = encode_frame(data, timestamps, 0, channels, sfreq, 12345, delivery="incremental",
+                          frame_format="binary", view=view)
+    frame = decode_binary_frame(delta)
+
+    expected, expected_ts = minmax_decimate(data, timestamps, samples_per_bin(view, sfreq), 12345)
+    assert frame["data"].shape == expected.shape
+    assert np.abs(frame["data"] - expected).max() <= DELTA_RESOLUTION[DELTA_FORMATS[frame_format]] / 2 + 1e-6
+    # Both points of a pair carry the bin's first timestamp
+    assert np.allclose(frame["timestamps"], np.repeat(expected_ts[0::2], 2), atol=0.1 * 10 / sfreq)
+    # One timestamp per bin fits the nominal grid, so no per-point corrections inflate the frame
+    assert len(delta) < len(binary) / 1.5
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import socket
+
+import numpy as np
+import websockets
+
+from app import EEGWebSocketServer
+from data.recorder import SegmentedStreamWriter
+
+
+def _write_recording(directory, source_ids, seconds=30, sfreq=250.0, n_channels=3, t0=1000.0):
+    """A replayable recording of ``source_ids``, each ``seconds`` of sine waves."""
+    directory.mkdir()
+    n_samples = int(seconds * sfreq)
+    timestamps = t0 + np.arange(n_samples) / sfreq
+    for i, source_id in enumerate(source_ids):
+        meta = {"source_id": source_id, "ch_names": [f"{source_id}{ch}" for ch in range(n_channels)],
+                "sfreq": sfreq, "units": {}}
+        writer = SegmentedStreamWriter(str(directory), source_id, meta, 1024 * 1024)
+        data = 50 * np.sin(2 * np.pi * (5 + i + np.arange(n_channels))[:, None] * timestamps / 10)
+        writer.append(data, timestamps)
+        writer.close()
+    return directory
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(recording, client, **kwargs):
+    """Run ``client(websocket)`` against a server replaying ``recording``; returns its result."""
+    async def main():
+        port = _free_port()
+        server = EEGWebSocketServer(host="127.0.0.1", port=port, replay=str(recording), **kwargs)
+        task = asyncio.create_task(server.start_server())
+        try:
+            for _ in range(100):
+                try:
+                    websocket = await websockets.connect(f"ws://127.0.0.1:{port}", max_size=None)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.05)
+            async with websocket:
+                return await asyncio.wait_for(client(websocket), 20)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    return asyncio.run(main())
+
+
+async def _receive(websocket, predicate):
+    """The first JSON message matching ``predicate``; binary frames are skipped."""
+    while True:
+        message = await websocket.recv()
+        if isinstance(message, str) and predicate(json.loads(message)):
+            return json.loads(message)
+
+
+def test_history_of_combined_stream(tmp_path):
+    recording = _write_recording(tmp_path / "rec", ["a", "b"])
+
+    async def client(websocket):
+        await websocket.send(json.dumps({"type": "start_data", "delivery": "incremental",
+                                         "data_streams": [{"source_id": "a"}, {"source_id": "b"}]}))
+        channels = await _receive(websocket, lambda m: "channels" in m or "error" in m)
+        assert len(channels["channels"]) == 6
+        await _receive(websocket, lambda m: m.get("type") == "eeg")
+        await websocket.send(json.dumps({"type": "history", "seconds": 5}))
+        history = await _receive(websocket, lambda m: m.get("type") == "history" or "error" in m)
+        assert "error" not in history
+        # Live frames keep coming; the history frame is the one starting at the announced sample
+        frame = await _receive(websocket, lambda m: m.get("type") == "eeg"
+                               and m["first_sample"] == history["first_sample"])
+        return history, frame
+
+    history, frame = _serve(recording, client)
+    assert history["n_samples"] > 0 and history["first_sample"] >= 0
+    assert len(frame["data"]) == 6 and len(frame["timestamps"]) == history["n_samples"]
+
+
+def test_recording_name_is_not_reused(tmp_path):
+    recording = _write_recording(tmp_path / "rec", ["a"])
+
+    async def client(websocket):
+        replies = []
+        for _ in range(2):
+            await websocket.send(json.dumps({"type": "start_recording", "name": "run1",
+                                             "data_streams": [{"source_id": "a"}]}))
+            replies.append(await _receive(websocket, lambda m: m.get("type") == "recording_status" or "error" in m))
+            await asyncio.sleep(0.3)
+            await websocket.send(json.dumps({"type": "stop_recording"}))
+            await _receive(websocket, lambda m: m.get("state") in ("stopped", "not_recording"))
+        return replies
+
+    started, reused = _serve(recording, client, data_path=str(tmp_path))
+    assert started["state"] == "started"
+    assert "already exists" in reused["error"]
+    assert (tmp_path / "run1" / "a.json").exists()